@@ -0,0 +1,249 @@
+"""Offline throughput benchmark for the pedal -> camera -> Dropbox pipeline.
+
+Runs the real pedal loop, capture and upload code against a synthetic
+pedal report stream, a fake camera and a local stand-in for the Dropbox
+API, so it needs no hardware and no Dropbox account:
+
+    python benchmark.py --presses 30 --press-interval 1 --file-size 25000000
+
+It runs in a temporary directory and reports captures/minute, latency
+percentiles per pipeline stage and memory use.
+"""
+import argparse
+import hashlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Make the project modules importable when running from another directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_ACCOUNT = {
+    "account_id": "dbid:" + "a" * 35,
+    "name": {"given_name": "Bench", "surname": "Mark", "familiar_name": "Bench",
+             "display_name": "Bench Mark", "abbreviated_name": "BM"},
+    "email": "bench@example.com",
+    "email_verified": True,
+    "disabled": False,
+    "locale": "en",
+    "referral_link": "https://db.tt/bench",
+    "is_paired": False,
+    "account_type": {".tag": "basic"},
+    "root_info": {".tag": "user", "root_namespace_id": "1", "home_namespace_id": "1"}
+}
+
+class FakeDropboxHandler(BaseHTTPRequestHandler):
+    """Implements the handful of Dropbox API routes the uploader uses."""
+
+    protocol_version = "HTTP/1.1"
+    sessions = {}
+    files = {}
+    lock = threading.Lock()
+    response_delay = 0.0
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _file_metadata(self, path, size, content_hash):
+        name = path.rsplit("/", 1)[-1]
+        return {".tag": "file", "name": name, "id": "id:" + uuid.uuid4().hex, "path_lower": path.lower(),
+                "path_display": path, "client_modified": "2024-01-01T00:00:00Z",
+                "server_modified": "2024-01-01T00:00:00Z", "rev": "0123456789abcdef", "size": size,
+                "content_hash": content_hash}
+
+    def _store(self, path, data):
+        """Keep only the size and content hash of an uploaded file."""
+        block_digests = hashlib.sha256()
+        for start in range(0, len(data), 4 * 1024 * 1024):
+            block_digests.update(hashlib.sha256(data[start:start + 4 * 1024 * 1024]).digest())
+        with self.lock:
+            self.files[path] = (len(data), block_digests.hexdigest())
+        return self._file_metadata(path, *self.files[path])
+
+    def _commit(self, session_id, path):
+        with self.lock:
+            data = self.sessions.pop(session_id)
+        return self._store(path, data)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        arg = json.loads(self.headers.get("Dropbox-API-Arg", "null") or "null")
+        time.sleep(self.response_delay)
+
+        if self.path == "/2/users/get_current_account":
+            self._send_json(FAKE_ACCOUNT)
+        elif self.path == "/2/files/list_folder":
+            folder = json.loads(body)["path"].lower()
+            with self.lock:
+                entries = [self._file_metadata(path, size, content_hash)
+                           for path, (size, content_hash) in self.files.items()
+                           if path.lower().rsplit("/", 1)[0] == folder]
+            self._send_json({"entries": entries, "cursor": "end", "has_more": False})
+        elif self.path == "/2/files/upload":
+            self._send_json(self._store(arg["path"], body))
+        elif self.path == "/2/files/upload_session/start":
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = bytearray(body)
+            self._send_json({"session_id": session_id})
+        elif self.path == "/2/files/upload_session/append_v2":
+            with self.lock:
+                self.sessions[arg["cursor"]["session_id"]] += body
+            self._send_json(None)
+        elif self.path == "/2/files/upload_session/finish":
+            with self.lock:
+                self.sessions[arg["cursor"]["session_id"]] += body
+            self._send_json(self._commit(arg["cursor"]["session_id"], arg["commit"]["path"]))
+        elif self.path == "/2/files/upload_session/finish_batch_v2":
+            request = json.loads(body)
+            entries = [dict(self._commit(entry["cursor"]["session_id"], entry["commit"]["path"]), **{".tag": "success"})
+                       for entry in request["entries"]]
+            self._send_json({"entries": entries})
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def log_message(self, format, *args):
+        return
+
+class LocalRedirectAdapter(requests.adapters.HTTPAdapter):
+    """Sends every Dropbox API request to the local stand-in server over plain HTTP."""
+
+    def __init__(self, port, **kwargs):
+        super().__init__(**kwargs)
+        self.port = port
+
+    def send(self, request, **kwargs):
+        path = request.url.split("/", 3)[3]
+        request.url = f"http://127.0.0.1:{self.port}/{path}"
+        return super().send(request, **kwargs)
+
+class SyntheticPedal:
+    """Stands in for hid.device, replaying press/release reports on a schedule."""
+
+    def __init__(self, presses, press_interval, hold_time=0.1):
+        start = time.monotonic() + 0.5
+        self.reports = []
+        for i in range(presses):
+            pressed_at = start + i * press_interval
+            self.reports.append((pressed_at, [0, 0, 0, 0, 3, 0, 0, 0]))
+            self.reports.append((pressed_at + hold_time, [0, 0, 0, 0, 0, 0, 0, 0]))
+
+    def read(self, max_length, timeout_ms=0):
+        if not self.reports:
+            raise OSError("end of synthetic report stream")
+
+        due_at, report = self.reports[0]
+        wait = due_at - time.monotonic()
+        if wait > timeout_ms / 1000:
+            time.sleep(timeout_ms / 1000)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.reports.pop(0)
+        return report
+
+    def close(self):
+        pass
+
+def wait_for_uploads(upload_queue, timeout):
+    """Wait until the upload queue is empty."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        stats = upload_queue.get_queue_stats()
+        if stats["depth"] == 0 and stats["in_flight"] == 0:
+            return True
+        time.sleep(0.1)
+    return False
+
+def run_benchmark(args):
+    # Everything the pipeline writes ends up in a throwaway directory
+    work_dir = tempfile.mkdtemp(prefix="camera_bench_")
+    os.chdir(work_dir)
+
+    import camera_backend
+    import camera_pedal
+    import dropbox_client
+    import dropbox_oauth
+    import latency
+    import upload_queue
+    import webinterface
+
+    # Local stand-in for the Dropbox API
+    FakeDropboxHandler.response_delay = args.server_delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDropboxHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    dropbox_client.get_session().mount("https://", LocalRedirectAdapter(server.server_address[1]))
+
+    dropbox_oauth.DROPBOX_TOKEN_FILE = os.path.join(work_dir, "dropbox_tokens.json")
+    dropbox_oauth.save_dropbox_tokens({"access_token": "benchmark", "expires_at": time.time() + 86400})
+
+    # Fake camera and user setup
+    webinterface.setup_user_system()
+    camera_pedal.camera = camera_backend.FakeCamera(file_size=args.file_size, capture_delay=args.capture_delay,
+                                                    extensions=tuple(args.extensions.split(",")))
+    camera_pedal.TIMELAPSE_TRIGGER_COUNT = args.presses + 1  # Never toggle timelapse mode
+    camera_pedal.start_upload_workers()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    print(f"🏁 Replaying {args.presses} presses every {args.press_interval}s "
+          f"({args.file_size / 1e6:.1f} MB x {args.extensions}, {args.capture_delay}s capture)")
+    started_at = time.monotonic()
+    camera_pedal.run_pedal_loop(SyntheticPedal(args.presses, args.press_interval))
+    captured_at = time.monotonic()
+    drained = wait_for_uploads(upload_queue, args.upload_timeout)
+    finished_at = time.monotonic()
+
+    captures = camera_pedal.camera.capture_count
+    stats = latency.get_latency_stats()
+    queue_stats = upload_queue.get_queue_stats()
+
+    print("\n📊 Benchmark results")
+    print(f"Captures: {captures} in {captured_at - started_at:.1f}s "
+          f"({captures / (captured_at - started_at) * 60:.1f} captures/minute)")
+    print(f"Uploads: {queue_stats['completed']} completed, {queue_stats['failed_attempts']} failed attempts, "
+          f"{'drained' if drained else 'NOT drained'} after {finished_at - captured_at:.1f}s")
+    print(f"{'stage':<14}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage in latency.STAGES:
+        if stage in stats:
+            s = stats[stage]
+            print(f"{stage:<14}{s['count']:>7}{s['p50_ms']:>10}{s['p90_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    if args.tracemalloc:
+        print(f"Peak Python allocations: {tracemalloc.get_traced_memory()[1] / 1e6:.1f} MB")
+
+    server.shutdown()
+    upload_queue.stop_workers()
+    print(f"Work directory: {work_dir}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the capture pipeline without hardware")
+    parser.add_argument("--presses", type=int, default=20, help="number of synthetic pedal presses")
+    parser.add_argument("--press-interval", type=float, default=1.0, help="seconds between presses")
+    parser.add_argument("--file-size", type=int, default=5 * 1024 * 1024, help="bytes per captured file")
+    parser.add_argument("--extensions", default="jpg,cr2", help="files written per capture")
+    parser.add_argument("--capture-delay", type=float, default=0.3, help="seconds the fake camera takes per capture")
+    parser.add_argument("--server-delay", type=float, default=0.02, help="seconds added to every fake Dropbox response")
+    parser.add_argument("--upload-timeout", type=float, default=300, help="seconds to wait for the upload backlog")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak Python allocations")
+    run_benchmark(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
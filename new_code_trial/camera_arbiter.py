@@ -0,0 +1,170 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# fcntl is POSIX only - elsewhere the camera is only arbitrated within this process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Who gets the camera first when several parts of the program want it at once
+PRIORITY_INTERACTIVE = 0  # Pedal presses, web captures and bursts
+PRIORITY_TIMELAPSE = 1
+PRIORITY_PREVIEW = 2  # Live-view frames
+PRIORITY_PROBE = 3  # Background health checks
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_TIMELAPSE: "timelapse",
+                  PRIORITY_PREVIEW: "preview", PRIORITY_PROBE: "probe"}
+
+# Held for its whole life by the one process that drives the camera. A gphoto2
+# session keeps the USB interface claimed between captures, so processes
+# cannot take turns on the device - other processes go through camera_service.
+DEVICE_LOCK_FILE = "camera.lock"
+
+class CameraBusy(Exception):
+    """Raised when the camera could not be claimed before the timeout."""
+
+# Arbiter state (guarded by _arbiter_lock)
+_arbiter_lock = threading.Lock()
+_turn_changed = threading.Condition(_arbiter_lock)
+_owner = None
+_waiting = []  # heap of (priority, ticket number)
+_tickets = itertools.count()
+_grants = {name: 0 for name in PRIORITY_NAMES.values()}
+_rejections = {name: 0 for name in PRIORITY_NAMES.values()}
+_wait_seconds = {name: 0.0 for name in PRIORITY_NAMES.values()}
+
+# Open lock file once this process owns the device
+_device_file = None
+_device_lock = threading.Lock()
+
+def own_device():
+    """Make this process the sole owner of the camera device, if no other process is.
+
+    The lock is kept until the process exits. Returns True if this process
+    owns the device (calling again is cheap).
+    """
+    global _device_file
+    if fcntl is None:
+        return True
+
+    with _device_lock:
+        if _device_file is not None:
+            return True
+        device_file = open(DEVICE_LOCK_FILE, "a+")
+        try:
+            fcntl.flock(device_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            device_file.close()
+            return False
+
+        device_file.seek(0)
+        device_file.truncate()
+        device_file.write(str(os.getpid()))
+        device_file.flush()
+        _device_file = device_file
+        return True
+
+def get_device_owner():
+    """Return the pid of the process driving the camera, or None if no process has claimed it."""
+    if fcntl is None or _device_file is not None:
+        return os.getpid()
+    try:
+        with open(DEVICE_LOCK_FILE) as f:
+            # A lock we can take means the pid in the file belongs to a process that has exited
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+                return None
+            except BlockingIOError:
+                return int(f.read().strip() or 0) or None
+    except (OSError, ValueError):
+        return None
+
+def acquire(priority, owner, blocking=True, timeout=None):
+    """Claim the camera for owner (a short description such as "pedal capture").
+
+    Waiting claims are granted highest priority first, then in arrival
+    order. A non-blocking claim only succeeds when the camera is free and
+    nobody is waiting for it, so previews and probes never jump the queue.
+    Claims fail straight away while another process owns the device.
+    Returns True if the camera is now ours.
+    """
+    global _owner
+    name = PRIORITY_NAMES[priority]
+    requested_at = time.monotonic()
+    deadline = requested_at + timeout if timeout is not None else None
+
+    if not own_device():
+        with _arbiter_lock:
+            _rejections[name] += 1
+        return False
+
+    with _turn_changed:
+        if _owner is not None or _waiting:
+            if not blocking:
+                _rejections[name] += 1
+                return False
+
+            ticket = (priority, next(_tickets))
+            heapq.heappush(_waiting, ticket)
+            while _owner is not None or _waiting[0] != ticket:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    _waiting.remove(ticket)
+                    heapq.heapify(_waiting)
+                    _rejections[name] += 1
+                    _turn_changed.notify_all()
+                    return False
+                _turn_changed.wait(remaining)
+            heapq.heappop(_waiting)
+
+        _owner = {"owner": owner, "priority": name, "since": time.time(), "thread": threading.current_thread().name}
+        _grants[name] += 1
+        _wait_seconds[name] += time.monotonic() - requested_at
+    return True
+
+def release():
+    """Give the camera back and let the next waiting claim have it."""
+    global _owner
+    with _turn_changed:
+        _owner = None
+        _turn_changed.notify_all()
+
+@contextmanager
+def claim(priority, owner, timeout=None):
+    """Own the camera for the duration of the block, waiting for it if necessary.
+
+    Raises CameraBusy if the camera is still taken after timeout seconds.
+    """
+    if not acquire(priority, owner, timeout=timeout):
+        state = get_state()
+        if state["device_owner"] != os.getpid():
+            raise CameraBusy(f"Camera is driven by process {state['device_owner']}")
+        raise CameraBusy(f"Camera is busy ({state['owner']})")
+    try:
+        yield
+    finally:
+        release()
+
+def get_state():
+    """Return who owns the camera, who is waiting for it and how often each kind got it."""
+    with _arbiter_lock:
+        owner = dict(_owner) if _owner else None
+        waiting = [PRIORITY_NAMES[priority] for priority, _ in sorted(_waiting)]
+        stats = {name: {"grants": _grants[name],
+                        "rejections": _rejections[name],
+                        "avg_wait_ms": round(_wait_seconds[name] / _grants[name] * 1000, 1) if _grants[name] else None}
+                 for name in PRIORITY_NAMES.values()}
+
+    if owner:
+        owner["held_seconds"] = round(time.time() - owner["since"], 1)
+    return {
+        "owner": owner["owner"] if owner else None,
+        "holder": owner,
+        "waiting": waiting,
+        "device_owner": get_device_owner(),
+        "stats": stats
+    }
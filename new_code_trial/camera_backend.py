@@ -0,0 +1,382 @@
+import base64
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import time
+
+# python-gphoto2 is optional - without it we fall back to running the gphoto2 CLI
+try:
+    import gphoto2 as gp
+except ImportError:
+    gp = None
+
+CAMERA_MODEL = "Canon EOS 700D"
+CAPTURE_TIMEOUT = 30  # seconds before a capture is considered hung
+CAPTURE_EVENT_TIMEOUT_MS = 500  # How long to wait for the second file of a RAW+JPG pair
+
+# Burst (continuous drive) settings for the session backend
+BURST_DRIVE_MODE = "Continuous"
+SINGLE_DRIVE_MODE = "Single"
+BURST_EVENT_TIMEOUT_MS = 100
+BURST_DRAIN_TIMEOUT = 3  # seconds to keep collecting buffered frames after the release
+
+PREVIEW_TIMEOUT = 10  # seconds before a live-view frame is considered hung
+
+# gphoto2 error messages that mean the camera has gone away
+DISCONNECT_MESSAGES = ("Could not claim the USB device", "No camera found")
+
+# gphoto2 reports every downloaded file with this line
+SAVED_FILE_PATTERN = re.compile(r"^Saving file as (.+)$", re.MULTILINE)
+
+# 16x12 grey JPEG served by FakeCamera as its live-view frame
+FAKE_PREVIEW_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxOQERXRTc4UG1R"
+    "V19iZ2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2Nj"
+    "Y2NjY2NjY2NjY2NjY2P/wAARCAAMABADASIAAhEBAxEB/8QAHwAAAQUBAQEBAQEAAAAAAAAAAAECAwQFBgcICQoL/8QAtRAA"
+    "AgEDAwIEAwUFBAQAAAF9AQIDAAQRBRIhMUEGE1FhByJxFDKBkaEII0KxwRVS0fAkM2JyggkKFhcYGRolJicoKSo0NTY3ODk6"
+    "Q0RFRkdISUpTVFVWV1hZWmNkZWZnaGlqc3R1dnd4eXqDhIWGh4iJipKTlJWWl5iZmqKjpKWmp6ipqrKztLW2t7i5usLDxMXG"
+    "x8jJytLT1NXW19jZ2uHi4+Tl5ufo6erx8vP09fb3+Pn6/8QAHwEAAwEBAQEBAQEBAQAAAAAAAAECAwQFBgcICQoL/8QAtREA"
+    "AgECBAQDBAcFBAQAAQJ3AAECAxEEBSExBhJBUQdhcRMiMoEIFEKRobHBCSMzUvAVYnLRChYkNOEl8RcYGRomJygpKjU2Nzg5"
+    "OkNERUZHSElKU1RVVldYWVpjZGVmZ2hpanN0dXZ3eHl6goOEhYaHiImKkpOUlZaXmJmaoqOkpaanqKmqsrO0tba3uLm6wsPE"
+    "xcbHyMnK0tPU1dbX2Nna4uPk5ebn6Onq8vP09fb3+Pn6/9oADAMBAAIRAxEAPwDPooooA//Z")
+
+class CameraError(Exception):
+    """Raised when a capture fails. disconnected=True means the camera needs reconnecting."""
+
+    def __init__(self, message, disconnected=False):
+        super().__init__(message)
+        self.disconnected = disconnected
+
+class _FileWriter:
+    """Writes downloaded frames to disk on a background thread so the next download can start."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="burst-writer")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, path, data):
+        self._queue.put((path, data))
+
+    def close(self):
+        """Wait for every queued frame to be written."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            path, data = job
+            with open(path, 'wb') as f:
+                f.write(data)
+
+class SubprocessCamera:
+    """Runs one gphoto2 process per capture. Slow, but needs nothing beyond the CLI."""
+
+    name = "subprocess"
+
+    def __init__(self, command, model=CAMERA_MODEL):
+        self.command = command
+        self.model = model
+
+    def capture(self, target_dir, prefix):
+        """Capture an image and return the paths of the files saved in target_dir."""
+        # Have gphoto2 write straight into the target folder (%f = camera file name, %C = suffix)
+        filename_template = os.path.join(target_dir, f"{prefix}_%f.%C")
+        try:
+            result = subprocess.run(
+                self.command + ["--filename", filename_template, "--force-overwrite"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=CAPTURE_TIMEOUT
+            )
+        except subprocess.TimeoutExpired:
+            raise CameraError("Camera command timed out - possible camera sleep or disconnection", disconnected=True)
+
+        if result.returncode != 0:
+            disconnected = any(message in result.stderr for message in DISCONNECT_MESSAGES)
+            raise CameraError(result.stderr, disconnected=disconnected)
+
+        # Take the file names from gphoto2's own report instead of scanning for new files
+        return [path.strip() for path in SAVED_FILE_PATTERN.findall(result.stdout)]
+
+    def capture_burst(self, target_dir, prefix, stop_event):
+        """Capture frame after frame until stop_event is set (one gphoto2 run per frame)."""
+        saved_paths = []
+        frame = 0
+        while not stop_event.is_set():
+            saved_paths.extend(self.capture(target_dir, f"{prefix}{frame:03d}"))
+            frame += 1
+        return saved_paths
+
+    def capture_preview(self):
+        """Grab one low-res live-view frame and return it as JPEG bytes."""
+        # Same command line as a capture, with --capture-preview in place of the capture action
+        with tempfile.TemporaryDirectory() as temp_dir:
+            preview_file = os.path.join(temp_dir, "preview.jpg")
+            try:
+                result = subprocess.run(
+                    self.command[:-1] + ["--capture-preview", "--filename", preview_file, "--force-overwrite"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    timeout=PREVIEW_TIMEOUT
+                )
+            except subprocess.TimeoutExpired:
+                raise CameraError("Live view timed out - possible camera sleep or disconnection", disconnected=True)
+
+            if result.returncode != 0:
+                disconnected = any(message in result.stderr for message in DISCONNECT_MESSAGES)
+                raise CameraError(result.stderr, disconnected=disconnected)
+
+            with open(preview_file, 'rb') as f:
+                return f.read()
+
+    def is_connected(self):
+        """Check if the camera shows up in gphoto2 --auto-detect."""
+        check_cmd = ["gphoto2", f"--camera={self.model}", "--auto-detect"]
+        result = subprocess.run(check_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        return self.model in result.stdout
+
+    def reset(self):
+        """Reset the USB connection to the camera."""
+        reset_cmd = ["gphoto2", f"--camera={self.model}", "--reset"]
+        subprocess.run(reset_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def close(self):
+        pass
+
+class GPhoto2SessionCamera:
+    """Keeps the camera open through libgphoto2 so captures skip USB setup and the PTP handshake."""
+
+    name = "gphoto2"
+
+    def __init__(self):
+        if gp is None:
+            raise RuntimeError("python-gphoto2 is not installed")
+        self._camera = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        """Open the camera session if it is not open already. Caller must hold _lock."""
+        if self._camera is None:
+            camera = gp.Camera()
+            camera.init()
+            self._camera = camera
+        return self._camera
+
+    def _close(self):
+        """Release the camera. Caller must hold _lock."""
+        if self._camera is not None:
+            try:
+                self._camera.exit()
+            except gp.GPhoto2Error:
+                pass
+            self._camera = None
+
+    def _download(self, camera, file_path, target_dir, prefix):
+        """Save a file from the camera into target_dir and remove it from the camera."""
+        local_path = os.path.join(target_dir, f"{prefix}_{file_path.name}")
+        camera_file = camera.file_get(file_path.folder, file_path.name, gp.GP_FILE_TYPE_NORMAL)
+        camera_file.save(local_path)
+        self._delete_from_camera(camera, file_path)
+        return local_path
+
+    def _delete_from_camera(self, camera, file_path):
+        """Remove a downloaded file from the camera's card so it does not fill up."""
+        try:
+            camera.file_delete(file_path.folder, file_path.name)
+        except gp.GPhoto2Error:
+            pass  # Files captured to RAM are gone already
+
+    def capture(self, target_dir, prefix):
+        """Capture an image and return the paths of the files saved in target_dir."""
+        with self._lock:
+            try:
+                camera = self._open()
+                file_path = camera.capture(gp.GP_CAPTURE_IMAGE)
+                saved_paths = [self._download(camera, file_path, target_dir, prefix)]
+
+                # With RAW+JPG the second file is announced as an event
+                while True:
+                    event_type, event_data = camera.wait_for_event(CAPTURE_EVENT_TIMEOUT_MS)
+                    if event_type == gp.GP_EVENT_FILE_ADDED:
+                        saved_paths.append(self._download(camera, event_data, target_dir, prefix))
+                    elif event_type == gp.GP_EVENT_TIMEOUT:
+                        break
+                return saved_paths
+
+            except gp.GPhoto2Error as e:
+                # Drop the session so the next capture starts from a clean connection
+                self._close()
+                raise CameraError(str(e), disconnected=True)
+
+    def _set_config(self, camera, name, value):
+        """Change a single camera setting."""
+        config = camera.get_config()
+        config.get_child_by_name(name).set_value(value)
+        camera.set_config(config)
+
+    def _end_burst(self, camera, release):
+        """Let go of the shutter and go back to single shots, also after a failed burst."""
+        try:
+            if release:
+                self._set_config(camera, "eosremoterelease", "Release Full")
+            self._set_config(camera, "drivemode", SINGLE_DRIVE_MODE)
+        except gp.GPhoto2Error as e:
+            print(f"⚠️ Could not put the camera back in single-shot mode: {e}")
+
+    def capture_burst(self, target_dir, prefix, stop_event):
+        """Shoot in continuous drive until stop_event is set, downloading frames as they arrive.
+
+        The camera keeps shooting into its buffer while we download, and
+        frames are written to disk on a separate thread.
+        """
+        with self._lock:
+            writer = _FileWriter()
+            saved_paths = []
+            released_at = None
+            last_file_at = time.monotonic()
+            try:
+                camera = self._open()
+                try:
+                    self._set_config(camera, "drivemode", BURST_DRIVE_MODE)
+                    self._set_config(camera, "eosremoterelease", "Press Full")
+
+                    while True:
+                        if released_at is None and stop_event.is_set():
+                            self._set_config(camera, "eosremoterelease", "Release Full")
+                            released_at = time.monotonic()
+
+                        event_type, event_data = camera.wait_for_event(BURST_EVENT_TIMEOUT_MS)
+                        if event_type == gp.GP_EVENT_FILE_ADDED:
+                            local_path = os.path.join(target_dir, f"{prefix}_{event_data.name}")
+                            camera_file = camera.file_get(event_data.folder, event_data.name, gp.GP_FILE_TYPE_NORMAL)
+                            writer.write(local_path, bytes(camera_file.get_data_and_size()))
+                            self._delete_from_camera(camera, event_data)
+                            saved_paths.append(local_path)
+                            last_file_at = time.monotonic()
+                        elif released_at is not None and time.monotonic() - max(released_at, last_file_at) > BURST_DRAIN_TIMEOUT:
+                            break
+                finally:
+                    # Runs before an error closes the session, so the camera never stays in continuous drive
+                    self._end_burst(camera, release=released_at is None)
+                return saved_paths
+
+            except gp.GPhoto2Error as e:
+                self._close()
+                raise CameraError(str(e), disconnected=True)
+            finally:
+                writer.close()
+
+    def capture_preview(self):
+        """Grab one low-res live-view frame over the open session and return it as JPEG bytes."""
+        with self._lock:
+            try:
+                camera_file = self._open().capture_preview()
+                return bytes(camera_file.get_data_and_size())
+            except gp.GPhoto2Error as e:
+                self._close()
+                raise CameraError(str(e), disconnected=True)
+
+    def is_connected(self):
+        """Check the camera answers on the open session, opening it if needed."""
+        with self._lock:
+            try:
+                self._open().get_summary()
+                return True
+            except gp.GPhoto2Error:
+                self._close()
+                return False
+
+    def reset(self):
+        """Drop the session so the next call opens the camera again."""
+        with self._lock:
+            self._close()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+class FakeCamera:
+    """Writes placeholder files instead of talking to hardware, for testing without a camera."""
+
+    name = "fake"
+
+    def __init__(self, file_size=1024 * 1024, capture_delay=0.2, extensions=("jpg", "cr2"), burst_interval=0.2,
+                 preview_delay=0.05):
+        self.file_size = file_size
+        self.capture_delay = capture_delay
+        self.burst_interval = burst_interval
+        self.preview_delay = preview_delay
+        self.extensions = extensions
+        self.connected = True
+        self.capture_count = 0
+        self._lock = threading.Lock()
+
+    def capture(self, target_dir, prefix):
+        """Pretend to capture and write one file per extension into target_dir."""
+        with self._lock:
+            if not self.connected:
+                raise CameraError("No camera found", disconnected=True)
+
+            time.sleep(self.capture_delay)
+            saved_paths = []
+            for extension in self.extensions:
+                local_path = os.path.join(target_dir, f"{prefix}_capt{self.capture_count:04d}.{extension}")
+                with open(local_path, 'wb') as f:
+                    f.write(os.urandom(self.file_size))
+                saved_paths.append(local_path)
+            self.capture_count += 1
+            return saved_paths
+
+    def capture_burst(self, target_dir, prefix, stop_event):
+        """Pretend to shoot in continuous drive, one frame every burst_interval, until stop_event is set."""
+        with self._lock:
+            writer = _FileWriter()
+            saved_paths = []
+            try:
+                while not stop_event.is_set():
+                    if not self.connected:
+                        raise CameraError("No camera found", disconnected=True)
+
+                    time.sleep(self.burst_interval)
+                    for extension in self.extensions:
+                        local_path = os.path.join(target_dir, f"{prefix}_capt{self.capture_count:04d}.{extension}")
+                        writer.write(local_path, os.urandom(self.file_size))
+                        saved_paths.append(local_path)
+                    self.capture_count += 1
+            finally:
+                writer.close()
+            return saved_paths
+
+    def capture_preview(self):
+        """Return a small grey placeholder JPEG as the live-view frame."""
+        if not self.connected:
+            raise CameraError("No camera found", disconnected=True)
+        time.sleep(self.preview_delay)
+        return FAKE_PREVIEW_JPEG
+
+    def is_connected(self):
+        return self.connected
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+def create_camera(backend, command):
+    """Create a camera backend by name: "gphoto2", "subprocess", "fake" or "auto"."""
+    if backend == "fake":
+        return FakeCamera()
+    if backend == "gphoto2" or (backend == "auto" and gp is not None):
+        return GPhoto2SessionCamera()
+    return SubprocessCamera(command)
@@ -1,16 +1,30 @@
 import hid
-import subprocess
 import time
 import os
-import shutil
-import threading
 from datetime import datetime
-import dropbox
-from dropbox.exceptions import AuthError
+from dropbox.exceptions import ApiError, AuthError, RateLimitError
 from dropbox.files import WriteMode
 
-# Import our Dropbox OAuth module
-import dropbox_oauth
+# Import our Dropbox client and upload modules
+import camera_arbiter
+import camera_backend
+import capture_index
+import camera_status
+import dropbox_client
+import dropbox_dedup
+import latency
+import live_view
+import pedal_input
+import postprocess
+import storage_manager
+import thumbnails
+import timelapse_scheduler
+import timelapse_video
+import dropbox_upload
+import event_bus
+import upload_queue
+import user_registry
+import worker_pool
 
 # HID device identifiers for the foot pedal
 VENDOR_ID = 0x04b4
@@ -19,95 +33,193 @@ PRODUCT_ID = 0x5555
 # Camera capture command that works 
 CAMERA_COMMAND = ["sudo", "gphoto2", "--camera=Canon EOS 700D", "--capture-image-and-download"]
 
+# Camera backend: "gphoto2" keeps a session open, "subprocess" runs CAMERA_COMMAND
+# per capture, "fake" needs no hardware, "auto" picks gphoto2 when it is installed
+CAMERA_BACKEND = os.environ.get("CAMERA_BACKEND", "auto")
+camera = None
+
 # Set up a directory to save the photos
 PHOTO_DIR = "pedal_triggered_photos"
 os.makedirs(PHOTO_DIR, exist_ok=True)
 
-# Keep track of the last pedal state
-last_state = None
+# Debounce between camera triggers (compared against time.monotonic() press timestamps)
 DEBOUNCE_TIME = 0.5  # seconds
 last_trigger_time = 0
 
+# Holding the pedal this long after a press switches to burst (continuous) capture
+BURST_ENABLED = True
+BURST_HOLD_TIME = 0.6  # seconds
+
 # Camera connection maintenance
-CAMERA_CHECK_INTERVAL = 300  # Check camera connection every 5 minutes
-last_camera_check = time.time()
-camera_connected = True
+CAMERA_CHECK_INTERVAL = 60  # Background camera status probe every minute
+CAMERA_CLAIM_TIMEOUT = 120  # seconds a capture waits for the camera before giving up
 
 # Timelapse parameters
 TIMELAPSE_INTERVAL = 180  # Take a photo every 3 minutes
-timelapse_active = False
-timelapse_thread = None
-timelapse_stop_event = threading.Event()
+PEDAL_TIMELAPSE = "pedal"  # Name of the schedule toggled by rapid pedal presses
 
 # Pedal press counting for timelapse mode
 pedal_presses = []
 TIMELAPSE_TRIGGER_COUNT = 5
 TIMELAPSE_TRIGGER_WINDOW = 20  # seconds
 
+# Upload batching - files from one capture (or one timelapse window) are committed together
+BATCH_UPLOADS = True
+TIMELAPSE_BATCH_WINDOW = 900  # Commit timelapse frames every 15 minutes
+UPLOAD_WAIT_TIMEOUT = 120  # seconds take_photo waits when asked to wait for uploads
+
+# Finish press-to-upload latency traces as their uploads complete
+upload_queue.add_listener(latency.on_upload_finished)
+upload_queue.add_listener(capture_index.on_upload_finished)
+upload_queue.add_listener(postprocess.on_upload_finished)
+upload_queue.add_listener(timelapse_video.on_upload_finished)
+
+# Close a schedule's video as soon as its series ends
+timelapse_scheduler.add_finish_listener(lambda schedule: timelapse_video.finish(schedule.name))
+
+def publish_upload_event(item, status):
+    """Upload queue listener that pushes upload progress to the web interface."""
+    event_bus.publish("upload", {"file": os.path.basename(item["local_path"]), "status": status,
+                                 "attempts": item["attempts"], "waiting": upload_queue.get_waiting_count()})
+
+upload_queue.add_listener(publish_upload_event)
+
 def upload_to_dropbox(local_file_path, dropbox_folder_path):
-    """Upload a file to Dropbox and return success status."""
+    """Upload a file to Dropbox and return its result for the upload queue.
+
+    True when uploaded, False to retry later, or upload_queue.PERMANENT_FAILURE.
+    """
     try:
-        # Get a valid access token using our OAuth module
-        access_token = dropbox_oauth.get_valid_access_token()
-        if not access_token:
-            print("❌ Could not get valid Dropbox access token")
+        # Reuse the shared, already validated Dropbox client
+        dbx = dropbox_client.get_client()
+        if dbx is None:
             return False
-            
-        # Initialize Dropbox client with the valid token
-        dbx = dropbox.Dropbox(access_token)
         
-        # Check if the token is valid
-        try:
-            dbx.users_get_current_account()
-        except AuthError as e:
-            print(f"❌ Dropbox auth error: {e}")
-            return False
+        file_name = os.path.basename(local_file_path)
+        dropbox_path = f"{dropbox_folder_path}/{file_name}"
         
-        # Open the local file
-        with open(local_file_path, 'rb') as f:
-            file_name = os.path.basename(local_file_path)
-            dropbox_path = f"{dropbox_folder_path}/{file_name}"
-            
-            # Upload the file
-            print(f"📤 Uploading {file_name} to Dropbox folder {dropbox_folder_path}...")
-            dbx.files_upload(f.read(), dropbox_path, mode=WriteMode('overwrite'))
-            
-            print(f"✅ Successfully uploaded to Dropbox as {dropbox_path}")
+        # Don't send the file again if Dropbox already has identical content there
+        if dropbox_dedup.is_already_uploaded(dbx, local_file_path, dropbox_path):
+            print(f"⏭️ {file_name} is already in Dropbox, skipping upload")
             return True
+        
+        print(f"📤 Uploading {file_name} to Dropbox folder {dropbox_folder_path}...")
+        
+        if os.path.getsize(local_file_path) > dropbox_upload.CHUNKED_UPLOAD_THRESHOLD:
+            # Large RAW files are streamed in chunks and can resume after a drop
+            metadata = dropbox_upload.upload_large_file(dbx, local_file_path, dropbox_path)
+        else:
+            with open(local_file_path, 'rb') as f:
+                data = f.read()
+            dropbox_upload.throttle(len(data))
+            metadata = dbx.files_upload(data, dropbox_path, mode=WriteMode('overwrite'))
+        dropbox_dedup.record_upload(metadata)
+        
+        print(f"✅ Successfully uploaded to Dropbox as {dropbox_path}")
+        return True
     
+    except AuthError as e:
+        # Token was revoked or expired early - refresh it before the next attempt
+        print(f"❌ Dropbox auth error: {e}")
+        dropbox_client.report_auth_error()
+        return False
+    except RateLimitError as e:
+        # Too many requests - slow the whole upload queue down
+        upload_queue.report_rate_limit(e.backoff)
+        return False
+    except ApiError as e:
+        print(f"❌ Dropbox upload error: {e}")
+        # Errors such as a malformed path or a full Dropbox would fail again on every retry
+        if dropbox_upload.is_permanent_error(e):
+            return upload_queue.PERMANENT_FAILURE
+        return False
     except Exception as e:
         print(f"❌ Dropbox upload error: {e}")
         return False
 
+def upload_batch_to_dropbox(files):
+    """Upload (local_path, dropbox_folder) pairs with one batch commit and return a result per file (see upload_queue)."""
+    try:
+        dbx = dropbox_client.get_client()
+        if dbx is None:
+            return [False] * len(files)
+        
+        print(f"📤 Uploading batch of {len(files)} file(s) to Dropbox...")
+        entries = [(local_path, f"{folder}/{os.path.basename(local_path)}") for local_path, folder in files]
+        results = dropbox_upload.upload_batch(dbx, entries)
+        
+        print(f"✅ Batch committed: {sum(result is True for result in results)}/{len(files)} file(s) uploaded")
+        return results
+    
+    except AuthError as e:
+        print(f"❌ Dropbox auth error: {e}")
+        dropbox_client.report_auth_error()
+        return [False] * len(files)
+    except RateLimitError as e:
+        upload_queue.report_rate_limit(e.backoff)
+        return [False] * len(files)
+    except Exception as e:
+        print(f"❌ Dropbox batch upload error: {e}")
+        return [False] * len(files)
+
+def start_upload_workers():
+    """Start the background Dropbox upload workers (safe to call repeatedly)."""
+    upload_queue.start_workers(upload_to_dropbox, upload_batch_to_dropbox)
+
+def queue_capture_upload(files, timelapse_mode=False):
+    """Queue the files from one capture, batched per shot or per timelapse window.
+    
+    Timelapse frames go in the background lane so shots taken at the bench upload first.
+    """
+    lane = upload_queue.LANE_BACKGROUND if timelapse_mode else upload_queue.LANE_INTERACTIVE
+    if not BATCH_UPLOADS:
+        return [upload_queue.enqueue_upload(local_path, folder, lane) for local_path, folder in files]
+    
+    if timelapse_mode:
+        # Frames from the same window share a batch that is committed when the window closes
+        window_start = int(time.time() // TIMELAPSE_BATCH_WINDOW) * TIMELAPSE_BATCH_WINDOW
+        return upload_queue.enqueue_batch(files, batch_id=f"timelapse_{window_start}",
+                                          not_before=window_start + TIMELAPSE_BATCH_WINDOW, lane=lane)
+    
+    return upload_queue.enqueue_batch(files, lane=lane)
+
+def get_camera():
+    """Return the shared camera backend, creating it on first use."""
+    global camera
+    if camera is None:
+        camera = camera_backend.create_camera(CAMERA_BACKEND, CAMERA_COMMAND)
+        print(f"📷 Using {camera.name} camera backend")
+    return camera
+
+def is_camera_connected():
+    """Check the shared camera status. Unknown (not probed yet) counts as connected."""
+    return camera_status.is_camera_connected() is not False
+
 def check_camera_connection():
-    """Check if camera is still connected and reconnect if needed."""
-    global camera_connected
+    """Check if camera is still connected and reconnect if needed.
     
+    The caller must own the camera through camera_arbiter. The result is
+    recorded in camera_status, which every part of the program reads.
+    """
     try:
-        # Run a simple gphoto2 command to check camera connection
-        check_cmd = ["gphoto2", "--camera=Canon EOS 700D", "--auto-detect"]
-        result = subprocess.run(check_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        # Check if our camera model is in the output
-        if "Canon EOS 700D" in result.stdout:
-            if not camera_connected:
+        # Check if our camera answers
+        if get_camera().is_connected():
+            if not is_camera_connected():
                 print("✅ Camera reconnected successfully")
-            camera_connected = True
+            camera_status.record_status(True)
             return True
         else:
             print("❌ Camera not detected, attempting to reconnect...")
-            camera_connected = False
+            camera_status.record_status(False)
             
             # Try to reset USB connections
-            reset_cmd = ["gphoto2",  "--camera=Canon EOS 700D", "--reset"]
-            subprocess.run(reset_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            get_camera().reset()
             time.sleep(5)  # Give camera time to initialize
             
             # Check again after reset
-            result = subprocess.run(check_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            if "Canon EOS 700D" in result.stdout:
+            if get_camera().is_connected():
                 print("✅ Camera reconnected after reset")
-                camera_connected = True
+                camera_status.record_status(True)
                 return True
             else:
                 print("⚠️ Could not reconnect camera")
@@ -115,14 +227,66 @@ def check_camera_connection():
     
     except Exception as e:
         print(f"⚠️ Error checking camera connection: {e}")
-        camera_connected = False
+        camera_status.record_status(False, str(e))
         return False
 
-def take_photo(timelapse_mode=False):
-    """Take a photo with the camera and save it to the appropriate folder."""
-    global camera_connected
+def probe_camera():
+    """Health probe for the camera status monitor. Skips the probe while anything else wants the camera."""
+    if not camera_arbiter.acquire(camera_arbiter.PRIORITY_PROBE, "health probe", blocking=False):
+        return None
+    try:
+        return check_camera_connection()
+    finally:
+        camera_arbiter.release()
+
+def start_storage_manager():
+    """Start the background disk-space manager for PHOTO_DIR (safe to call repeatedly)."""
+    storage_manager.start_manager(PHOTO_DIR)
+
+def start_camera_monitor():
+    """Start the background camera status monitor (safe to call repeatedly)."""
+    camera_status.start_monitor(probe_camera, CAMERA_CHECK_INTERVAL)
+
+def stop_background_services():
+    """Stop the timelapse engine, monitors, upload workers and worker processes, finishing open timelapse videos.
+
+    Uploads that have not finished stay in the queue file for the next run.
+    """
+    timelapse_scheduler.stop_engine()
+    timelapse_video.finish_all()
+    camera_status.stop_monitor()
+    storage_manager.stop_manager()
+    upload_queue.stop_workers()
+    worker_pool.shutdown()
+
+def capture_preview_frame():
+    """Read one live-view frame, or return None if a capture is using or waiting for the camera."""
+    if not camera_arbiter.acquire(camera_arbiter.PRIORITY_PREVIEW, "live view", blocking=False):
+        return None
+    try:
+        return get_camera().capture_preview()
+    except camera_backend.CameraError as e:
+        if e.disconnected:
+            camera_status.record_status(False)
+        raise
+    finally:
+        camera_arbiter.release()
+
+# Live view reads frames through the same camera backend as captures
+live_view.set_frame_source(capture_preview_frame)
+
+def take_photo(timelapse_mode=False, wait_for_upload=False, trace=None, username=None, timelapse_name=None):
+    """Take a photo with the camera and save it to the appropriate folder.
     
-    current_time = time.time()
+    Files go to the Dropbox folder of username (default: the active user).
+    Uploads run in the background. With wait_for_upload=True this waits for
+    them and only returns True if every captured file reached Dropbox.
+    A latency.Trace passed in gets a mark at each pipeline stage.
+    Frames of the timelapse schedule timelapse_name are also appended to its video.
+    
+    The camera is claimed through camera_arbiter, so concurrent callers
+    take turns: interactive captures go before timelapse frames.
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     today_date = datetime.now().strftime("%Y-%m-%d")
     
@@ -135,122 +299,221 @@ def take_photo(timelapse_mode=False):
     date_folder = os.path.join(PHOTO_DIR, today_date)
     os.makedirs(date_folder, exist_ok=True)
     
-    # Only proceed if camera is connected or we can reconnect it
-    if not camera_connected:
-        if not check_camera_connection():
-            print("⚠️ Camera disconnected - cannot take photo")
-            return False
+    mode = "timelapse" if timelapse_mode else "single"
+    priority = camera_arbiter.PRIORITY_TIMELAPSE if timelapse_mode else camera_arbiter.PRIORITY_INTERACTIVE
+    
+    # Never start a capture the disk cannot hold
+    if not storage_manager.has_space_for_capture():
+        event_bus.publish("capture", {"state": "failed", "mode": mode, "reason": "Not enough disk space"})
+        return False
     
-    # Run the camera capture command
+    # Capture straight into the date folder
+    event_bus.publish("capture", {"state": "started", "mode": mode})
     try:
-        result = subprocess.run(
-            CAMERA_COMMAND, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=30  # Add timeout to prevent hanging
-        )
-        
-        if result.returncode == 0:
-            print("✅ Photo captured successfully!")
-            
-            # Find the captured image file and move it to the date folder
-            uploaded_files = []
-            for file in os.listdir("."):
-                if file.endswith(".jpg") or file.endswith(".cr2"):
-                    if os.path.isfile(file) and os.path.getmtime(file) > current_time - 5:
-                        new_name = f"{timestamp}_{file}"
-                        local_path = os.path.join(date_folder, new_name)
-                        shutil.move(file, local_path)
-                        print(f"📸 Saved locally as: {local_path}")
-                        
-                        # Get the current user's Dropbox folder from webinterface
-                        from webinterface import get_user_config
-                        user_config = get_user_config()
-                        user_folder = user_config.get("dropbox_folder", "/Camera_Pedal_Photos/shared")
-                        
-                        # Create the Dropbox path with user folder and date
-                        dropbox_folder = f"{user_folder}/{today_date}"
-                        
-                        # Upload to Dropbox
-                        upload_success = upload_to_dropbox(local_path, dropbox_folder)
-                        if upload_success:
-                            uploaded_files.append(new_name)
-            
-            if uploaded_files:
-                print(f"📂 All files uploaded to Dropbox folder: {dropbox_folder}")
-                return True
-            else:
-                print("⚠️ No files were found to upload")
+        with live_view.paused(), camera_arbiter.claim(priority, f"{mode} capture", timeout=CAMERA_CLAIM_TIMEOUT):
+            # Only proceed if camera is connected or we can reconnect it
+            if not is_camera_connected() and not check_camera_connection():
+                print("⚠️ Camera disconnected - cannot take photo")
+                event_bus.publish("capture", {"state": "failed", "mode": mode, "reason": "Camera disconnected"})
                 return False
-        else:
-            print("❌ Error capturing photo:")
-            print(result.stderr)
-            
-            # Check if error indicates disconnection
-            if "Could not claim the USB device" in result.stderr or "No camera found" in result.stderr:
-                camera_connected = False
-                check_camera_connection()
             
-            return False
-    
-    except subprocess.TimeoutExpired:
-        print("⚠️ Camera command timed out - possible camera sleep or disconnection")
-        camera_connected = False
-        check_camera_connection()
+            if trace:
+                trace.mark("capture_start")
+            try:
+                saved_paths = get_camera().capture(date_folder, timestamp)
+            except camera_backend.CameraError as e:
+                # Check if error indicates disconnection, while we still own the camera
+                if e.disconnected:
+                    camera_status.record_status(False, str(e))
+                    check_camera_connection()
+                raise
+            if trace:
+                trace.mark("capture_done")
+    except camera_backend.CameraError as e:
+        print("❌ Error capturing photo:")
+        print(e)
+        event_bus.publish("capture", {"state": "failed", "mode": mode, "reason": str(e)})
         return False
     except Exception as camera_error:
         print(f"❌ Camera error: {camera_error}")
+        event_bus.publish("capture", {"state": "failed", "mode": mode, "reason": str(camera_error)})
         return False
+    
+    print("✅ Photo captured successfully!")
+    camera_status.record_status(True)
+    storage_manager.note_capture(saved_paths)
+    event_bus.publish("capture", {"state": "finished", "mode": mode,
+                                  "files": [os.path.basename(path) for path in saved_paths]})
+    
+    if trace:
+        trace.mark("file_saved")
+    
+    # Hand the files to the background uploader so the pedal loop is free again
+    captured_files, item_ids = queue_saved_files(saved_paths, today_date, timelapse_mode, username)
+    if not captured_files:
+        return False
+    
+    if timelapse_name is not None:
+        try:
+            timelapse_video.add_frame(timelapse_name, saved_paths, captured_files[0][1], queue_video_upload)
+        except Exception as e:
+            print(f"⚠️ Could not add frame to the timelapse video: {e}")
+    
+    if trace:
+        latency.watch_uploads(trace, item_ids)
+        # Catch uploads that finished before the trace was registered
+        for item_id in item_ids:
+            status = upload_queue.get_item_status(item_id)
+            if status in ("uploaded", "failed"):
+                latency.on_upload_finished({"id": item_id}, status)
+    
+    if wait_for_upload:
+        statuses = upload_queue.wait_for_items(item_ids, timeout=UPLOAD_WAIT_TIMEOUT)
+        for (local_path, _), item_id in zip(captured_files, item_ids):
+            status = statuses[item_id]
+            print(f"{'✅' if status == 'uploaded' else '⚠️'} {os.path.basename(local_path)}: {status}")
+        return all(status == "uploaded" for status in statuses.values())
+    
+    return True
 
-def timelapse_worker():
-    """Worker function for timelapse thread."""
-    print("🕒 Starting timelapse mode - taking photos every 3 minutes")
+def queue_saved_files(saved_paths, today_date, timelapse_mode=False, username=None, mode=None):
+    """Queue freshly captured files for upload to the user's Dropbox date folder.
     
-    # Take an initial photo immediately when starting timelapse
-    take_photo(timelapse_mode=True)
+    The files are also added to the capture index under mode ("single",
+    "timelapse" or "burst"; by default taken from timelapse_mode). If the
+    user's profile has post-processing steps, they run in the background
+    and their chosen outputs are queued to the same Dropbox folder.
+    Returns the (local_path, dropbox_folder) pairs and their upload queue item ids
+    (no ids when the profile does not upload originals).
+    """
+    start_upload_workers()
     
-    while not timelapse_stop_event.is_set():
-        # Sleep for the interval, but check stop_event frequently
-        for i in range(TIMELAPSE_INTERVAL):
-            if timelapse_stop_event.is_set():
-                break
-            if i % 60 == 0:  # Log every minute
-                print(f"Waited {i} seconds so far...")
-            time.sleep(1)
-        
-        if not timelapse_stop_event.is_set():
-            # Check camera connection before taking timelapse photo
-            if not camera_connected:
-                check_camera_connection()
-            
-            # Take timelapse photo
-            print("🕒 Taking scheduled timelapse photo...")
-            take_photo(timelapse_mode=True)
+    # Get the user's Dropbox folder (cached in memory, no file reads)
+    user_config = user_registry.get_user_config(username)
+    user_folder = user_config.get("dropbox_folder", "/Camera_Pedal_Photos/shared")
+    
+    # Create the Dropbox path with user folder and date
+    dropbox_folder = f"{user_folder}/{today_date}"
+    
+    captured_files = []
+    for local_path in saved_paths:
+        print(f"📸 Saved locally as: {local_path}")
+        captured_files.append((local_path, dropbox_folder))
+    
+    if not captured_files:
+        print("⚠️ No files were found to upload")
+        return [], []
+    
+    steps, uploads = postprocess.get_pipeline(user_config)
+    upload_originals = postprocess.ORIGINAL in uploads
+    
+    # Index the capture before queueing so upload results always find its rows
+    if username is None:
+        username = user_registry.get_active_user()
+    if mode is None:
+        mode = "timelapse" if timelapse_mode else "single"
+    try:
+        capture_index.record_captures(captured_files, username, mode,
+                                      upload_state="pending" if upload_originals else "local_only")
+    except Exception as e:
+        print(f"⚠️ Could not add capture to the index: {e}")
+    
+    item_ids = []
+    if upload_originals:
+        item_ids = queue_capture_upload(captured_files, timelapse_mode)
+        print(f"📂 {len(captured_files)} file(s) queued for Dropbox folder: {dropbox_folder}")
+    
+    # Post-processing runs in worker processes; its outputs are queued when they are ready
+    if steps:
+        try:
+            postprocess.submit_capture(
+                saved_paths, today_date, steps, uploads,
+                lambda paths: queue_capture_upload([(path, dropbox_folder) for path in paths], timelapse_mode))
+        except Exception as e:
+            print(f"⚠️ Could not queue post-processing: {e}")
+    
+    # Thumbnails for the web gallery are made in worker processes
+    try:
+        thumbnails.submit_captures(saved_paths, username, today_date)
+    except Exception as e:
+        print(f"⚠️ Could not queue thumbnails: {e}")
+    return captured_files, item_ids
+
+def queue_video_upload(local_path, dropbox_folder):
+    """Queue a finished timelapse video next to its frames in Dropbox."""
+    start_upload_workers()
+    upload_queue.enqueue_upload(local_path, dropbox_folder, upload_queue.LANE_BACKGROUND)
+    print(f"📂 {os.path.basename(local_path)} queued for Dropbox folder: {dropbox_folder}")
+
+def take_burst(stop_event):
+    """Fire continuously until stop_event is set, then queue every frame for upload.
+    
+    Returns the number of frames and the achieved frames per second.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    today_date = datetime.now().strftime("%Y-%m-%d")
+    date_folder = os.path.join(PHOTO_DIR, today_date)
+    os.makedirs(date_folder, exist_ok=True)
     
-    print("🕒 Timelapse mode stopped")
+    if not storage_manager.has_space_for_capture():
+        return 0, 0.0
+    
+    print("🔁 BURST MODE - firing until the pedal is released...")
+    event_bus.publish("capture", {"state": "started", "mode": "burst"})
+    started_at = time.monotonic()
+    try:
+        with live_view.paused(), camera_arbiter.claim(camera_arbiter.PRIORITY_INTERACTIVE, "burst capture",
+                                                      timeout=CAMERA_CLAIM_TIMEOUT):
+            try:
+                saved_paths = get_camera().capture_burst(date_folder, f"{timestamp}_burst", stop_event)
+            except camera_backend.CameraError as e:
+                if e.disconnected:
+                    camera_status.record_status(False, str(e))
+                    check_camera_connection()
+                raise
+    except (camera_backend.CameraError, camera_arbiter.CameraBusy) as e:
+        print(f"❌ Error during burst: {e}")
+        event_bus.publish("capture", {"state": "failed", "mode": "burst", "reason": str(e)})
+        return 0, 0.0
+    elapsed = time.monotonic() - started_at
+    
+    # A RAW+JPG frame produces two files with the same base name
+    frames = len({os.path.splitext(path)[0] for path in saved_paths})
+    fps = frames / elapsed if elapsed > 0 else 0.0
+    print(f"📸 Burst finished: {frames} frames in {elapsed:.2f}s ({fps:.1f} frames/second)")
+    
+    storage_manager.note_capture(saved_paths)
+    event_bus.publish("capture", {"state": "finished", "mode": "burst", "frames": frames,
+                                  "files": [os.path.basename(path) for path in saved_paths]})
+    queue_saved_files(saved_paths, today_date, mode="burst")
+    return frames, fps
+
+def capture_timelapse_frame(schedule):
+    """Take one frame for a timelapse schedule (called by the scheduler's capture thread)."""
+    return take_photo(timelapse_mode=True, username=schedule.username, timelapse_name=schedule.name)
+
+def start_timelapse_scheduler():
+    """Start the timelapse scheduler (safe to call repeatedly)."""
+    timelapse_scheduler.start_engine(capture_timelapse_frame)
+
+def is_timelapse_active():
+    """Check if the pedal-toggled timelapse is running."""
+    return timelapse_scheduler.is_active(PEDAL_TIMELAPSE)
 
 def toggle_timelapse_mode():
     """Toggle timelapse mode on/off."""
-    global timelapse_active, timelapse_thread, timelapse_stop_event
+    start_timelapse_scheduler()
     
-    if timelapse_active:
+    if is_timelapse_active():
         # Stop timelapse
         print("🕒 Stopping timelapse mode...")
-        timelapse_stop_event.set()
-        if timelapse_thread:
-            timelapse_thread.join()
-        timelapse_active = False
+        timelapse_scheduler.stop_schedule(PEDAL_TIMELAPSE)
         print("🕒 Timelapse mode deactivated")
     else:
-        # Start timelapse
+        # Start timelapse - the first frame is taken straight away
         print("🕒 Activating timelapse mode...")
-        timelapse_stop_event.clear()
-        timelapse_thread = threading.Thread(target=timelapse_worker)
-        timelapse_thread.daemon = True
-        timelapse_thread.start()
-        timelapse_active = True
-        print("🕒 Timelapse mode activated - photos will be taken every 5 minutes")
+        timelapse_scheduler.add_schedule(PEDAL_TIMELAPSE, TIMELAPSE_INTERVAL)
+        print(f"🕒 Timelapse mode activated - photos will be taken every {TIMELAPSE_INTERVAL} seconds")
 
 def check_rapid_presses():
     """Check if there were 5 presses within 10 seconds."""
@@ -276,17 +539,86 @@ def check_rapid_presses():
     
     return False
 
+def handle_pedal_press(event, reader=None):
+    """Handle one pedal press event: rapid-press detection, debounce and capture.
+    
+    If the reader shows the pedal is still held BURST_HOLD_TIME after the
+    press, capture continues as a burst until the pedal is released.
+    """
+    global last_trigger_time
+    
+    trace = latency.Trace()
+    trace.mark("hid_read", event.timestamp)
+    delay_ms = (time.monotonic() - event.timestamp) * 1000
+    print(f"Detected pedal press at {datetime.now().strftime('%H:%M:%S.%f')} ({delay_ms:.1f} ms after HID report)")
+    
+    # Check for rapid presses (timelapse toggle)
+    rapid_press_detected = check_rapid_presses()
+    
+    # If not handling a timelapse toggle and enough time has passed (debounce)
+    if not rapid_press_detected and event.timestamp - last_trigger_time > DEBOUNCE_TIME and not is_timelapse_active():
+        trace.mark("debounce")
+        print("\n🔴 TRIGGERING CAMERA...")
+        take_photo(trace=trace)
+        last_trigger_time = event.timestamp
+        
+        if BURST_ENABLED and reader is not None and reader.events.empty():
+            # Still holding the pedal after the shot - keep firing until it is released
+            hold_remaining = event.timestamp + BURST_HOLD_TIME - time.monotonic()
+            if not reader.released.wait(timeout=max(hold_remaining, 0)):
+                take_burst(reader.released)
+                last_trigger_time = time.monotonic()
+
+def run_pedal_loop(pedal):
+    """Handle press events from an open pedal device until it disconnects."""
+    # A dedicated thread blocks on the pedal and queues press events;
+    # this thread only wakes up when there is a press to handle
+    reader = pedal_input.PedalReader(pedal)
+    reader.start()
+    
+    try:
+        while True:
+            event = reader.events.get()
+            
+            if event.kind == "press":
+                handle_pedal_press(event, reader)
+            elif event.kind == "error":
+                print(f"❌ Lost connection to foot pedal: {event.data}")
+                break
+    finally:
+        reader.stop()
+
 # Main function
-def main():
+def main(stop_services=True):
+    """Run the pedal loop until Ctrl+C or the pedal goes away.
+
+    With stop_services=False the background services are left running for
+    the process hosting the loop (camera_service.py --pedal) to stop.
+    """
+    # Only one process can drive the camera - a running camera service (or dev web server) owns it
+    if not camera_arbiter.own_device():
+        print(f"❌ The camera is driven by process {camera_arbiter.get_device_owner()}. "
+              f"Run the pedal loop in that process instead: python camera_service.py --pedal")
+        return
+    
     # First, ensure we have a valid Dropbox token
     print("🔐 Checking Dropbox authentication...")
-    access_token = dropbox_oauth.get_valid_access_token()
-    if not access_token:
+    if dropbox_client.get_client() is None:
         print("❌ Failed to authenticate with Dropbox. Exiting.")
         return
     
     print("✅ Dropbox authentication successful.")
     
+    # Start uploading anything left over from a previous session
+    start_upload_workers()
+    
+    # Probe the camera in the background instead of from the pedal loop
+    start_camera_monitor()
+    
+    # Free up disk space by evicting photos that are safely in Dropbox
+    start_storage_manager()
+    
+    pedal = None
     try:
         # Connect to the foot pedal
         pedal = hid.device()
@@ -295,59 +627,22 @@ def main():
         print("Press Ctrl+C to exit")
         print(f"Press pedal {TIMELAPSE_TRIGGER_COUNT} times within {TIMELAPSE_TRIGGER_WINDOW} seconds to toggle timelapse mode")
         
-        # Initial camera check
-        check_camera_connection()
-        
-        while True:
-            # Periodically check camera connection
-            current_time = time.time()
-            if current_time - last_camera_check > CAMERA_CHECK_INTERVAL:
-                print("🔄 Performing routine camera connection check...")
-                check_camera_connection()
-                last_camera_check = current_time
-            
-            # Read data from the pedal
-            data = pedal.read(64, timeout_ms=100)  # Short timeout for responsiveness
-            
-            # Only process if we got data
-            if data:
-                current_state = data
-                print(f"Pedal Data: {data}")
-                
-                if (last_state is None or last_state[4] == 0) and data[4] == 3:
-                    current_time = time.time()
-                    print(f"Detected pedal press at {datetime.now().strftime('%H:%M:%S.%f')}")
-                    
-                    # Check for rapid presses (timelapse toggle)
-                    rapid_press_detected = check_rapid_presses()
-                    
-                    # If not handling a timelapse toggle and enough time has passed (debounce)
-                    if not rapid_press_detected and current_time - last_trigger_time > DEBOUNCE_TIME and not timelapse_active:
-                        print("\n🔴 TRIGGERING CAMERA...")
-                        take_photo()
-                        last_trigger_time = current_time
-                
-                # Update the last state
-                last_state = current_state
-            
-            # Small sleep to prevent CPU hogging
-            time.sleep(0.01)
+        run_pedal_loop(pedal)
 
     except KeyboardInterrupt:
         print("\nExiting program")
-        # Make sure to stop timelapse if active
-        if timelapse_active:
-            timelapse_stop_event.set()
-            if timelapse_thread:
-                timelapse_thread.join(timeout=1)
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        # Clean up
+        # Clean up - however the loop ended, stop timelapse, uploads and worker processes
+        if stop_services:
+            stop_background_services()
         try:
             pedal.close()
         except:
             pass
+        if camera is not None:
+            camera.close()
         print("Disconnected from foot pedal")
 
 if __name__ == "__main__":
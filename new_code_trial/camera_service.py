@@ -0,0 +1,329 @@
+"""Camera process for the production web server.
+
+The camera, timelapse engine, upload queue and event bus live in this one
+process. Web server workers (see wsgi.py) reach them over a local socket:
+
+    python camera_service.py            # camera process
+    python camera_service.py --pedal    # ...that also runs the foot pedal loop
+
+The development server (python webinterface.py) runs the same operations
+in-process through LocalCamera instead.
+"""
+import argparse
+import ipaddress
+import os
+import secrets
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+# Local IPC channel between the camera process and the web server workers.
+# A path is a Unix socket, host:port is TCP on the loopback interface.
+SERVICE_ADDRESS = os.environ.get("CAMERA_SERVICE_ADDRESS", "camera_service.sock")
+# Every connection must prove it knows this secret - messages are unpickled, so
+# an unauthenticated peer could run code in the camera process. Without the
+# environment variable, the camera process generates one into SERVICE_AUTHKEY_FILE.
+SERVICE_AUTHKEY = os.environ.get("CAMERA_SERVICE_AUTHKEY", "").encode() or None
+SERVICE_AUTHKEY_FILE = os.environ.get("CAMERA_SERVICE_AUTHKEY_FILE", "camera_service.key")
+
+class CameraServiceError(Exception):
+    """Raised in a web worker when the camera process is unreachable or an operation failed there."""
+
+# Operation tables, built on first use so web workers never import the camera code
+_tables_lock = threading.Lock()
+_operations = None
+_streams = None
+
+def _parse_address(address):
+    """Turn "host:port" into a TCP address; anything else is a Unix socket path.
+
+    Raises ValueError for a host that is not on the loopback interface.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        host = host.strip("[]")
+        if host != "localhost":
+            try:
+                loopback = ipaddress.ip_address(host).is_loopback
+            except ValueError:
+                loopback = False
+            if not loopback:
+                raise ValueError(f"Camera service address must be on the loopback interface, not {host}")
+        return (host, int(port))
+    return address
+
+def _get_authkey(authkey=None, create=False):
+    """Return authkey, or the one in SERVICE_AUTHKEY_FILE (created readable by this user only if create is set)."""
+    if authkey:
+        return authkey
+    if create and not os.path.exists(SERVICE_AUTHKEY_FILE):
+        try:
+            fd = os.open(SERVICE_AUTHKEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # Another camera process got there first
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(SERVICE_AUTHKEY_FILE) as f:
+            key = f.read().strip().encode()
+    except OSError as e:
+        raise CameraServiceError(f"No camera service key (set CAMERA_SERVICE_AUTHKEY or start camera_service.py): {e}")
+    if not key:
+        raise CameraServiceError(f"Camera service key file {SERVICE_AUTHKEY_FILE} is empty")
+    return key
+
+def _run_capture_job(job):
+    """Take the photo for a queued web capture job (runs on the capture job worker)."""
+    import camera_pedal
+    return camera_pedal.take_photo(username=job["username"])
+
+def _load_tables():
+    """Import the camera side and build the operation tables. Only runs in the camera process."""
+    global _operations, _streams
+    with _tables_lock:
+        if _operations is not None:
+            return _operations, _streams
+
+        import camera_arbiter
+        import camera_pedal
+        import camera_status
+        import capture_jobs
+        import event_bus
+        import latency
+        import live_view
+        import postprocess
+        import storage_manager
+        import thumbnails
+        import timelapse_scheduler
+        import timelapse_video
+        import upload_queue
+
+        def submit_capture(username):
+            capture_jobs.start_worker(_run_capture_job)
+            return capture_jobs.submit(username)
+
+        def get_camera_status(refresh=False):
+            camera_pedal.start_camera_monitor()
+            if refresh:
+                # Ask for a fresh probe; the result shows up on the next check
+                camera_status.request_check()
+            status = camera_status.get_camera_status()
+            status["busy_with"] = camera_arbiter.get_state()["owner"]
+            return status
+
+        def toggle_timelapse():
+            camera_pedal.toggle_timelapse_mode()
+            return camera_pedal.is_timelapse_active()
+
+        def add_schedule(name, interval, username=None, start_at=None, stop_at=None):
+            camera_pedal.start_timelapse_scheduler()
+            return timelapse_scheduler.add_schedule(name, interval, username, start_at, stop_at).to_dict()
+
+        def get_thumbnail_path(username, date, name):
+            thumbnail_path = thumbnails.get_thumbnail_path(username, date, name)
+            return os.path.abspath(thumbnail_path) if thumbnail_path else None
+
+        def stream_events(last_event_id=None):
+            camera_pedal.start_camera_monitor()
+            return event_bus.stream_events(last_event_id)
+
+        # Every browser that opens /events starts from the current camera and timelapse state
+        event_bus.add_snapshot(lambda: ("camera", camera_status.get_camera_status()))
+        event_bus.add_snapshot(lambda: ("state", {"timelapse_active": camera_pedal.is_timelapse_active(),
+                                                  "upload_waiting": upload_queue.get_waiting_count()}))
+
+        _operations = {
+            "submit_capture": submit_capture,
+            "get_job": capture_jobs.get_job,
+            "list_jobs": capture_jobs.list_jobs,
+            "camera_status": get_camera_status,
+            "camera_arbiter": camera_arbiter.get_state,
+            "live_view_frame": live_view.get_latest_frame,
+            "live_view_stats": live_view.get_live_view_stats,
+            "timelapse_active": camera_pedal.is_timelapse_active,
+            "toggle_timelapse": toggle_timelapse,
+            "list_schedules": timelapse_scheduler.list_schedules,
+            "add_schedule": add_schedule,
+            "remove_schedule": timelapse_scheduler.remove_schedule,
+            "timelapse_videos": timelapse_video.get_video_stats,
+            "gallery": thumbnails.get_gallery,
+            "thumbnail_path": get_thumbnail_path,
+            "storage": storage_manager.get_storage_stats,
+            "upload_queue": upload_queue.get_queue_stats,
+            "latency": latency.get_latency_stats,
+            "postprocess": postprocess.get_postprocess_stats,
+            "prometheus": latency.render_prometheus
+        }
+        _streams = {
+            "events": stream_events,
+            "live_view": live_view.stream_frames
+        }
+        return _operations, _streams
+
+def start_camera_process():
+    """Start the background services of the process that owns the camera (safe to call repeatedly)."""
+    _load_tables()
+    import camera_arbiter
+    if not camera_arbiter.own_device():
+        print(f"⚠️ The camera is driven by process {camera_arbiter.get_device_owner()} - captures from here will fail. "
+              f"Stop it and use python camera_service.py --pedal to run the pedal loop here")
+    import camera_pedal
+    import capture_jobs
+    camera_pedal.start_upload_workers()
+    camera_pedal.start_camera_monitor()
+    camera_pedal.start_storage_manager()
+    camera_pedal.start_timelapse_scheduler()
+    capture_jobs.start_worker(_run_capture_job)
+
+def stop_camera_process():
+    """Stop the background services started by start_camera_process."""
+    import camera_pedal
+    import capture_jobs
+    capture_jobs.stop_worker()
+    camera_pedal.stop_background_services()
+
+class LocalCamera:
+    """Runs camera operations in this process (development server, single process)."""
+
+    def call(self, operation, *args, **kwargs):
+        return _load_tables()[0][operation](*args, **kwargs)
+
+    def stream(self, name, *args):
+        return _load_tables()[1][name](*args)
+
+class RemoteCamera:
+    """Sends camera operations to the camera process over the local IPC channel.
+
+    Each web server thread keeps its own connection, so calls from
+    different requests never wait on each other here.
+    """
+
+    def __init__(self, address=SERVICE_ADDRESS, authkey=SERVICE_AUTHKEY):
+        self.address = _parse_address(address)
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connect(self):
+        authkey = _get_authkey(self.authkey)
+        try:
+            return Client(self.address, authkey=authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise CameraServiceError(f"Camera service unavailable at {self.address}: {e}")
+
+    def call(self, operation, *args, **kwargs):
+        connection = getattr(self._local, "connection", None)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = self._local.connection = self._connect()
+            try:
+                connection.send(("call", operation, args, kwargs))
+                status, result = connection.recv()
+                break
+            except (OSError, EOFError) as e:
+                connection.close()
+                connection = self._local.connection = None
+                # A connection left over from before a service restart gets one retry
+                if not reused:
+                    raise CameraServiceError(f"Lost connection to the camera service: {e}")
+                reused = False
+
+        if status == "ok":
+            return result
+        error_type, message = result
+        if error_type == "ValueError":
+            raise ValueError(message)
+        raise CameraServiceError(f"{error_type}: {message}")
+
+    def stream(self, name, *args):
+        """Return a generator of chunks streamed by the camera process on a dedicated connection."""
+        connection = self._connect()
+        connection.send(("stream", name, args, {}))
+
+        def chunks():
+            try:
+                while True:
+                    try:
+                        yield connection.recv()
+                    except EOFError:
+                        return
+            finally:
+                connection.close()
+        return chunks()
+
+def _handle_connection(connection):
+    """Serve one web worker connection until it closes."""
+    operations, streams = _load_tables()
+    try:
+        while True:
+            try:
+                kind, name, args, kwargs = connection.recv()
+            except EOFError:
+                return
+
+            if kind == "stream":
+                # The connection now belongs to this stream until the browser goes away
+                chunks = streams[name](*args)
+                try:
+                    for chunk in chunks:
+                        connection.send(chunk)
+                finally:
+                    chunks.close()
+                return
+
+            try:
+                reply = ("ok", operations[name](*args, **kwargs))
+            except Exception as e:
+                reply = ("error", (type(e).__name__, str(e)))
+            connection.send(reply)
+    except (OSError, EOFError):
+        pass  # The worker or the browser behind it went away
+    finally:
+        connection.close()
+
+def serve(address=SERVICE_ADDRESS, authkey=SERVICE_AUTHKEY):
+    """Start the camera services and answer web workers until interrupted."""
+    address = _parse_address(address)
+    authkey = _get_authkey(authkey, create=True)
+    start_camera_process()
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # Left behind by a previous run
+
+    listener = Listener(address, authkey=authkey)
+    if isinstance(address, str):
+        os.chmod(address, 0o600)
+    print(f"📡 Camera service listening on {address}")
+    try:
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                print(f"⚠️ Rejected camera service connection: {e}")
+                continue
+            thread = threading.Thread(target=_handle_connection, args=(connection,), name="camera-service-client")
+            thread.daemon = True
+            thread.start()
+    finally:
+        listener.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the camera process for the production web server")
+    parser.add_argument("--address", default=SERVICE_ADDRESS, help="Unix socket path or host:port to listen on")
+    parser.add_argument("--pedal", action="store_true", help="also run the foot pedal loop in this process")
+    args = parser.parse_args()
+
+    if args.pedal:
+        import camera_pedal
+        # The service keeps running without the pedal, and stops the background services itself
+        pedal_thread = threading.Thread(target=camera_pedal.main, kwargs={"stop_services": False}, name="pedal-loop")
+        pedal_thread.daemon = True
+        pedal_thread.start()
+
+    try:
+        serve(args.address)
+    except KeyboardInterrupt:
+        print("\nStopping camera service")
+        stop_camera_process()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import event_bus
+
+CAMERA_STATUS_INTERVAL = 60  # seconds between background camera probes
+
+# Cached status (guarded by _status_lock)
+_status_lock = threading.Lock()
+_status = {"connected": None, "checked_at": None, "error": None}
+
+# Monitor state
+_monitor_thread = None
+_probe_func = None
+_wake_event = threading.Event()
+_stop_event = threading.Event()
+
+def record_status(connected, error=None):
+    """Update the cached status, e.g. after a capture proved the camera works."""
+    with _status_lock:
+        changed = _status["connected"] != connected or _status["error"] != error
+        _status["connected"] = connected
+        _status["checked_at"] = time.time()
+        _status["error"] = error
+
+    # Browsers only hear about changes, so an idle system sends nothing
+    if changed:
+        event_bus.publish("camera", get_camera_status())
+
+def get_camera_status():
+    """Return the cached camera status without touching the camera."""
+    with _status_lock:
+        status = dict(_status)
+    status["age_seconds"] = round(time.time() - status["checked_at"], 1) if status["checked_at"] else None
+    return status
+
+def is_camera_connected():
+    """Return the cached connection flag (None until the first probe finishes)."""
+    with _status_lock:
+        return _status["connected"]
+
+def request_check():
+    """Ask the monitor to probe the camera soon, without waiting for the result."""
+    _wake_event.set()
+
+def _probe_once():
+    """Run one probe and cache the result. A probe returning None is skipped."""
+    try:
+        connected = _probe_func()
+        if connected is not None:
+            record_status(bool(connected))
+    except Exception as e:
+        print(f"⚠️ Camera status probe failed: {e}")
+        record_status(False, str(e))
+
+def _monitor(interval):
+    """Background thread that probes the camera on a fixed schedule."""
+    while not _stop_event.is_set():
+        _wake_event.clear()
+        _probe_once()
+        _wake_event.wait(timeout=interval)
+
+def start_monitor(probe_func, interval=CAMERA_STATUS_INTERVAL):
+    """Start the background camera monitor. Calling this again is a no-op.
+
+    probe_func() returns True/False for connected, or None to skip a probe
+    (for example while a capture is holding the camera).
+    """
+    global _monitor_thread, _probe_func
+    if _monitor_thread is not None:
+        return
+
+    _probe_func = probe_func
+    _stop_event.clear()
+    _monitor_thread = threading.Thread(target=_monitor, args=(interval,), name="camera-status")
+    _monitor_thread.daemon = True
+    _monitor_thread.start()
+
+def stop_monitor():
+    """Stop the background camera monitor."""
+    global _monitor_thread
+    _stop_event.set()
+    _wake_event.set()
+    if _monitor_thread is not None:
+        _monitor_thread.join(timeout=1)
+        _monitor_thread = None
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+CAPTURE_DB_FILE = "capture_index.db"
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes read at a time when hashing a capture
+MAX_QUERY_LIMIT = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    captured_at REAL NOT NULL,
+    username TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    local_path TEXT NOT NULL UNIQUE,
+    dropbox_path TEXT,
+    size INTEGER,
+    sha256 TEXT,
+    upload_state TEXT NOT NULL DEFAULT 'pending',
+    uploaded_at REAL,
+    evicted_at REAL
+);
+CREATE INDEX IF NOT EXISTS captures_by_time ON captures (captured_at);
+CREATE INDEX IF NOT EXISTS captures_by_user_time ON captures (username, captured_at);
+CREATE INDEX IF NOT EXISTS captures_by_state ON captures (upload_state, captured_at);
+"""
+
+# Columns added after the first release, created on databases that lack them
+ADDED_COLUMNS = (("evicted_at", "REAL"),)
+
+# One shared connection (guarded by _db_lock)
+_db_lock = threading.Lock()
+_connection = None
+
+# Files waiting for their sha256 to be filled in
+_hash_jobs = queue.Queue()
+_hash_thread = None
+
+def _connect():
+    """Open the database on first use. Caller must hold _db_lock."""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(CAPTURE_DB_FILE, check_same_thread=False)
+        _connection.row_factory = sqlite3.Row
+        # WAL lets the web interface read while a capture is being written
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.executescript(SCHEMA)
+        existing = {row["name"] for row in _connection.execute("PRAGMA table_info(captures)")}
+        for column, column_type in ADDED_COLUMNS:
+            if column not in existing:
+                _connection.execute(f"ALTER TABLE captures ADD COLUMN {column} {column_type}")
+    return _connection
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _hash_worker():
+    """Background thread that hashes new captures so take_photo does not have to."""
+    while True:
+        local_path = _hash_jobs.get()
+        try:
+            sha256 = _file_sha256(local_path)
+        except OSError as e:
+            print(f"⚠️ Could not hash {os.path.basename(local_path)}: {e}")
+            continue
+
+        with _db_lock:
+            with _connect() as connection:
+                connection.execute("UPDATE captures SET sha256 = ? WHERE local_path = ?", (sha256, local_path))
+
+def _ensure_hash_worker():
+    global _hash_thread
+    if _hash_thread is None:
+        _hash_thread = threading.Thread(target=_hash_worker, name="capture-hasher")
+        _hash_thread.daemon = True
+        _hash_thread.start()
+
+def record_captures(files, username, mode, upload_state="pending"):
+    """Add the (local_path, dropbox_folder) pairs of one capture in a single transaction.
+
+    Files that will not be uploaded are recorded as "local_only", which
+    also keeps the storage manager from evicting them.
+    """
+    captured_at = time.time()
+    rows = []
+    for local_path, dropbox_folder in files:
+        try:
+            size = os.path.getsize(local_path)
+        except OSError:
+            size = None
+        dropbox_path = f"{dropbox_folder}/{os.path.basename(local_path)}"
+        rows.append((captured_at, username, mode, os.path.abspath(local_path), dropbox_path, size, upload_state))
+
+    with _db_lock:
+        with _connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO captures "
+                "(captured_at, username, mode, local_path, dropbox_path, size, upload_state) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        _ensure_hash_worker()
+
+    for row in rows:
+        _hash_jobs.put(row[3])
+
+def on_upload_finished(item, status):
+    """Upload queue listener that records each file's upload state."""
+    uploaded_at = time.time() if status == "uploaded" else None
+    with _db_lock:
+        with _connect() as connection:
+            connection.execute(
+                "UPDATE captures SET upload_state = ?, uploaded_at = COALESCE(?, uploaded_at) "
+                "WHERE local_path = ?", (status, uploaded_at, os.path.abspath(item["local_path"])))
+
+def eviction_candidates(username=None, limit=100):
+    """Return uploaded captures still on local disk, oldest first."""
+    where, params = _where(username=username, upload_state="uploaded")
+    with _db_lock:
+        rows = _connect().execute(
+            f"SELECT id, username, local_path, dropbox_path, size, captured_at FROM captures{where} AND evicted_at IS NULL "
+            "ORDER BY captured_at, id LIMIT ?", params + [int(limit)]).fetchall()
+    return [dict(row) for row in rows]
+
+def set_upload_state(local_path, upload_state):
+    """Change the upload state of one capture, e.g. back to "pending" when it has to be sent again."""
+    with _db_lock:
+        with _connect() as connection:
+            connection.execute("UPDATE captures SET upload_state = ? WHERE local_path = ?",
+                               (upload_state, os.path.abspath(local_path)))
+
+def mark_evicted(local_paths):
+    """Record that these files were deleted from local disk."""
+    evicted_at = time.time()
+    with _db_lock:
+        with _connect() as connection:
+            connection.executemany("UPDATE captures SET evicted_at = ? WHERE local_path = ?",
+                                   [(evicted_at, local_path) for local_path in local_paths])
+
+def local_usage_by_user():
+    """Return {username: bytes} of indexed captures still on local disk."""
+    with _db_lock:
+        rows = _connect().execute(
+            "SELECT username, COALESCE(SUM(size), 0) AS bytes FROM captures "
+            "WHERE evicted_at IS NULL GROUP BY username").fetchall()
+    return {row["username"]: row["bytes"] for row in rows}
+
+def _where(username=None, start=None, end=None, mode=None, upload_state=None):
+    """Build the WHERE clause and parameters shared by the queries."""
+    clauses = []
+    params = []
+    for column, value in (("username", username), ("mode", mode), ("upload_state", upload_state)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if start is not None:
+        clauses.append("captured_at >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("captured_at < ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def query_captures(username=None, start=None, end=None, mode=None, upload_state=None, limit=500, offset=0):
+    """Return captures matching the filters, newest first. start/end are epoch seconds."""
+    where, params = _where(username, start, end, mode, upload_state)
+    limit = min(int(limit), MAX_QUERY_LIMIT)
+    with _db_lock:
+        rows = _connect().execute(
+            f"SELECT * FROM captures{where} ORDER BY captured_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + [limit, int(offset)]).fetchall()
+    return [dict(row) for row in rows]
+
+def summarize_captures(username=None, start=None, end=None, mode=None):
+    """Count captures and bytes per local day and upload state."""
+    where, params = _where(username, start, end, mode)
+    with _db_lock:
+        rows = _connect().execute(
+            "SELECT date(captured_at, 'unixepoch', 'localtime') AS day, upload_state, "
+            f"COUNT(*) AS files, COALESCE(SUM(size), 0) AS bytes FROM captures{where} "
+            "GROUP BY day, upload_state ORDER BY day DESC", params).fetchall()
+    return [dict(row) for row in rows]
+
+def get_capture(capture_id):
+    """Return one capture by id, or None."""
+    with _db_lock:
+        row = _connect().execute("SELECT * FROM captures WHERE id = ?", (capture_id,)).fetchone()
+    return dict(row) if row else None
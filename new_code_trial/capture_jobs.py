@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import event_bus
+
+COALESCE_WINDOW = 2  # seconds in which a repeat request from the same user joins the queued job
+JOB_HISTORY = 200  # Finished jobs kept for the status endpoint
+
+# Job state (guarded by _jobs_lock)
+_jobs_lock = threading.Lock()
+_work_available = threading.Condition(_jobs_lock)
+_jobs = OrderedDict()
+_user_queues = OrderedDict()  # username -> deque of queued job ids, served round-robin
+
+# Worker state
+_worker_thread = None
+_capture_func = None
+_stop_event = threading.Event()
+
+def _public(job):
+    """Copy of a job for the API, with its place in line if it is still queued."""
+    job = dict(job)
+    if job["state"] == "queued":
+        job["position"] = _position(job["id"])
+    return job
+
+def _position(job_id):
+    """1-based place of a queued job, following the round-robin order. Caller must hold _jobs_lock."""
+    queues = [list(queue) for queue in _user_queues.values()]
+    position = 0
+    for depth in range(max((len(queue) for queue in queues), default=0)):
+        for queue in queues:
+            if depth < len(queue):
+                position += 1
+                if queue[depth] == job_id:
+                    return position
+    return None
+
+def _publish(job):
+    event_bus.publish("job", {key: job[key] for key in ("id", "username", "state", "success", "message")})
+
+def submit(username):
+    """Queue a capture for username and return the job.
+
+    A request arriving while the same user already has a job waiting (for
+    example a double click) joins that job instead of taking another photo.
+    """
+    with _work_available:
+        now = time.time()
+        queue = _user_queues.get(username)
+        if queue:
+            waiting = _jobs[queue[-1]]
+            if now - waiting["submitted_at"] <= COALESCE_WINDOW:
+                waiting["requests"] += 1
+                return _public(waiting)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "username": username,
+            "state": "queued",
+            "requests": 1,
+            "submitted_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "success": None,
+            "message": None
+        }
+        _jobs[job["id"]] = job
+        _user_queues.setdefault(username, deque()).append(job["id"])
+        while len(_jobs) > JOB_HISTORY:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if oldest["state"] in ("queued", "running"):
+                break
+            _jobs.pop(oldest_id)
+        _work_available.notify()
+        result = _public(job)
+
+    _publish(result)
+    return result
+
+def get_job(job_id):
+    """Return a job by id, or None if it is unknown or too old."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return _public(job) if job else None
+
+def list_jobs():
+    """Return queued and running jobs plus recent finished ones, newest first."""
+    with _jobs_lock:
+        return [_public(job) for job in reversed(_jobs.values())]
+
+def _next_job():
+    """Block until a job is queued, taking users in turn so nobody waits behind another's backlog."""
+    with _work_available:
+        while not _stop_event.is_set():
+            if _user_queues:
+                username, queue = next(iter(_user_queues.items()))
+                job = _jobs[queue.popleft()]
+                # Move this user to the back of the line
+                del _user_queues[username]
+                if queue:
+                    _user_queues[username] = queue
+                job["state"] = "running"
+                job["started_at"] = time.time()
+                return dict(job)
+            _work_available.wait(timeout=1)
+    return None
+
+def _worker():
+    """The only thread that runs web captures, one at a time."""
+    while not _stop_event.is_set():
+        job = _next_job()
+        if job is None:
+            continue
+        _publish(job)
+
+        try:
+            success = bool(_capture_func(job))
+            message = "Photo captured successfully" if success else "Failed to capture photo"
+        except Exception as e:
+            success = False
+            message = f"Error capturing photo: {e}"
+
+        with _jobs_lock:
+            finished = _jobs.get(job["id"], job)
+            finished.update(state="done" if success else "failed", success=success, message=message,
+                            finished_at=time.time())
+            finished = dict(finished)
+        _publish(finished)
+
+def start_worker(capture_func):
+    """Start the capture worker. Calling this again is a no-op.
+
+    capture_func(job) takes the photo for job["username"] and returns success.
+    """
+    global _worker_thread, _capture_func
+    with _jobs_lock:
+        if _worker_thread is not None:
+            return
+        _capture_func = capture_func
+        _stop_event.clear()
+        _worker_thread = threading.Thread(target=_worker, name="capture-jobs")
+        _worker_thread.daemon = True
+        _worker_thread.start()
+
+def stop_worker():
+    """Stop the capture worker once the current job is done."""
+    global _worker_thread
+    _stop_event.set()
+    with _work_available:
+        _work_available.notify_all()
+    if _worker_thread is not None:
+        _worker_thread.join(timeout=5)
+    _worker_thread = None
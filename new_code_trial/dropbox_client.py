@@ -0,0 +1,110 @@
+import threading
+import time
+import dropbox
+from dropbox.exceptions import AuthError
+
+# Import our Dropbox OAuth module
+import dropbox_oauth
+
+# Refresh the access token this long before it expires
+TOKEN_REFRESH_MARGIN = 600  # seconds
+TOKEN_RETRY_DELAY = 60  # seconds to wait after a failed background refresh
+MAX_CONNECTIONS = 8  # Size of the shared HTTP connection pool
+
+# Shared client state (guarded by _client_lock)
+_client_lock = threading.RLock()
+_tokens = None
+_client = None
+_client_token = None
+_validated_token = None
+_session = None
+_refresh_timer = None
+
+def get_session():
+    """Return the pooled HTTP session shared by every Dropbox client."""
+    global _session
+    if _session is None:
+        _session = dropbox.create_session(max_connections=MAX_CONNECTIONS)
+    return _session
+
+def _load_tokens():
+    """Load tokens from disk once, running the OAuth flow if there are none."""
+    global _tokens
+    if dropbox_oauth.get_valid_access_token():
+        _tokens = dropbox_oauth.load_dropbox_tokens()
+    return _tokens
+
+def _refresh_tokens():
+    """Refresh the in-memory tokens. Caller must hold _client_lock."""
+    global _tokens
+    new_tokens = dropbox_oauth.refresh_tokens(_tokens)
+    if not new_tokens:
+        return False
+
+    _tokens = new_tokens
+    _schedule_refresh()
+    return True
+
+def _timer_refresh():
+    """Background timer callback that refreshes the token ahead of expiry."""
+    with _client_lock:
+        print("⏳ Refreshing Dropbox access token ahead of expiry...")
+        if not _refresh_tokens():
+            print(f"⚠️ Background token refresh failed, retrying in {TOKEN_RETRY_DELAY} seconds")
+            _schedule_refresh(TOKEN_RETRY_DELAY)
+
+def _schedule_refresh(delay=None):
+    """Arm the refresh timer for the current token. Caller must hold _client_lock."""
+    global _refresh_timer
+    if _refresh_timer:
+        _refresh_timer.cancel()
+    if not _tokens or "refresh_token" not in _tokens:
+        return
+
+    if delay is None:
+        delay = max(_tokens.get("expires_at", 0) - TOKEN_REFRESH_MARGIN - time.time(), 0)
+    _refresh_timer = threading.Timer(delay, _timer_refresh)
+    _refresh_timer.daemon = True
+    _refresh_timer.start()
+
+def get_client():
+    """Return a validated Dropbox client, or None if we cannot authenticate."""
+    global _client, _client_token, _validated_token
+
+    with _client_lock:
+        if _tokens is None:
+            if not _load_tokens():
+                print("❌ Could not get valid Dropbox access token")
+                return None
+            _schedule_refresh()
+
+        # Catch up if the timer could not run (e.g. the Pi was suspended)
+        if _tokens.get("expires_at", 0) <= time.time() + 60 and "refresh_token" in _tokens:
+            if not _refresh_tokens():
+                print("❌ Could not refresh Dropbox access token")
+                return None
+
+        access_token = _tokens.get("access_token")
+        if _client is None or _client_token != access_token:
+            # 429s are handed to the upload queue, which backs off for every worker
+            _client = dropbox.Dropbox(access_token, session=get_session(), max_retries_on_rate_limit=0)
+            _client_token = access_token
+
+        # Only hit the network to validate a token we have not checked yet
+        if _validated_token != access_token:
+            try:
+                _client.users_get_current_account()
+            except AuthError as e:
+                print(f"❌ Dropbox auth error: {e}")
+                return None
+            _validated_token = access_token
+
+        return _client
+
+def report_auth_error():
+    """Mark the current token as bad so the next get_client() refreshes it."""
+    global _validated_token
+    with _client_lock:
+        _validated_token = None
+        if _tokens and "refresh_token" in _tokens:
+            _tokens["expires_at"] = 0
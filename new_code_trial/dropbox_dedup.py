@@ -0,0 +1,165 @@
+import hashlib
+import os
+import posixpath
+import sqlite3
+import threading
+import time
+from dropbox.exceptions import ApiError
+from dropbox.files import FileMetadata
+
+# Remote file metadata is cached so most checks need no API call
+REMOTE_CACHE_FILE = "dropbox_metadata.db"
+REMOTE_CACHE_TTL = 600  # seconds before a folder listing is fetched again
+CONTENT_HASH_BLOCK_SIZE = 4 * 1024 * 1024  # Fixed by the Dropbox content hash algorithm
+LOCAL_HASH_CACHE_SIZE = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS remote_files (
+    path_lower TEXT PRIMARY KEY,
+    folder_lower TEXT NOT NULL,
+    content_hash TEXT,
+    size INTEGER,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS remote_files_by_folder ON remote_files (folder_lower);
+CREATE TABLE IF NOT EXISTS listed_folders (
+    folder_lower TEXT PRIMARY KEY,
+    listed_at REAL NOT NULL
+);
+"""
+
+# Shared connection (guarded by _cache_lock)
+_cache_lock = threading.Lock()
+_connection = None
+
+# Content hashes of local files, keyed by (path, size, mtime)
+_local_hashes = {}
+_local_hashes_lock = threading.Lock()
+
+def content_hash(local_file_path):
+    """Compute the Dropbox content hash of a local file in one streaming pass.
+
+    The file is hashed in 4 MB blocks and the block digests are hashed
+    again, the same way Dropbox reports content_hash in file metadata.
+    """
+    stat = os.stat(local_file_path)
+    key = (os.path.abspath(local_file_path), stat.st_size, stat.st_mtime)
+    with _local_hashes_lock:
+        if key in _local_hashes:
+            return _local_hashes[key]
+
+    block_digests = hashlib.sha256()
+    with open(local_file_path, 'rb') as f:
+        for block in iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b""):
+            block_digests.update(hashlib.sha256(block).digest())
+    result = block_digests.hexdigest()
+
+    with _local_hashes_lock:
+        if len(_local_hashes) >= LOCAL_HASH_CACHE_SIZE:
+            _local_hashes.clear()
+        _local_hashes[key] = result
+    return result
+
+def _connect():
+    """Open the cache database on first use. Caller must hold _cache_lock."""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(REMOTE_CACHE_FILE, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.executescript(SCHEMA)
+    return _connection
+
+def record_upload(metadata):
+    """Remember the metadata Dropbox returned for a file we just uploaded."""
+    if not isinstance(metadata, FileMetadata):
+        return
+    with _cache_lock:
+        with _connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?)",
+                (metadata.path_lower, posixpath.dirname(metadata.path_lower),
+                 metadata.content_hash, metadata.size, time.time()))
+
+def _refresh_folder(dbx, folder_lower):
+    """Replace the cached listing of one Dropbox folder with a fresh one."""
+    entries = []
+    try:
+        result = dbx.files_list_folder("" if folder_lower == "/" else folder_lower)
+        while True:
+            entries.extend(entry for entry in result.entries if isinstance(entry, FileMetadata))
+            if not result.has_more:
+                break
+            result = dbx.files_list_folder_continue(result.cursor)
+    except ApiError as e:
+        # A folder that does not exist yet simply has no files in it
+        if not (e.error.is_path() and e.error.get_path().is_not_found()):
+            raise
+
+    now = time.time()
+    with _cache_lock:
+        with _connect() as connection:
+            connection.execute("DELETE FROM remote_files WHERE folder_lower = ?", (folder_lower,))
+            connection.executemany(
+                "INSERT OR REPLACE INTO remote_files VALUES (?, ?, ?, ?, ?)",
+                [(entry.path_lower, folder_lower, entry.content_hash, entry.size, now) for entry in entries])
+            connection.execute("INSERT OR REPLACE INTO listed_folders VALUES (?, ?)", (folder_lower, now))
+    print(f"🗂️ Cached Dropbox listing of {folder_lower} ({len(entries)} files)")
+
+def _cached_remote(dbx, dropbox_path):
+    """Return (content_hash, size) of a Dropbox file from the cache, or None if it is not there."""
+    path_lower = dropbox_path.lower()
+    folder_lower = posixpath.dirname(path_lower)
+
+    with _cache_lock:
+        connection = _connect()
+        listed = connection.execute("SELECT listed_at FROM listed_folders WHERE folder_lower = ?",
+                                    (folder_lower,)).fetchone()
+        row = connection.execute("SELECT content_hash, size FROM remote_files WHERE path_lower = ?",
+                                 (path_lower,)).fetchone()
+
+    # A missing row is trusted while the folder listing is fresher than the TTL
+    if row is None and (listed is None or time.time() - listed[0] > REMOTE_CACHE_TTL):
+        _refresh_folder(dbx, folder_lower)
+        with _cache_lock:
+            row = _connect().execute("SELECT content_hash, size FROM remote_files WHERE path_lower = ?",
+                                     (path_lower,)).fetchone()
+    return row
+
+def _forget(dropbox_path):
+    with _cache_lock:
+        with _connect() as connection:
+            connection.execute("DELETE FROM remote_files WHERE path_lower = ?", (dropbox_path.lower(),))
+
+def get_remote_file(dbx, dropbox_path):
+    """Fetch fresh (content_hash, size) of a Dropbox file, or None if it is not there, and update the cache."""
+    try:
+        metadata = dbx.files_get_metadata(dropbox_path)
+    except ApiError as e:
+        if e.error.is_path() and e.error.get_path().is_not_found():
+            _forget(dropbox_path)
+            return None
+        raise
+    if not isinstance(metadata, FileMetadata):
+        _forget(dropbox_path)
+        return None
+    record_upload(metadata)
+    return metadata.content_hash, metadata.size
+
+def is_already_uploaded(dbx, local_file_path, dropbox_path):
+    """Check if Dropbox already has this exact file at dropbox_path.
+
+    The cache rules out most files without an API call. A cached match
+    may be stale (the file deleted or replaced since), so it is confirmed
+    with fresh metadata before the upload is skipped. Any error while
+    checking counts as "not uploaded", so the caller just uploads as before.
+    """
+    try:
+        size = os.path.getsize(local_file_path)
+        remote = _cached_remote(dbx, dropbox_path)
+        if remote is None or remote[1] != size or remote[0] != content_hash(local_file_path):
+            return False
+        remote = get_remote_file(dbx, dropbox_path)
+        return remote is not None and remote == (content_hash(local_file_path), size)
+    except Exception as e:
+        print(f"⚠️ Could not check Dropbox for {os.path.basename(local_file_path)}: {e}")
+        return False
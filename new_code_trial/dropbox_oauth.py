@@ -104,6 +104,19 @@ def refresh_access_token(refresh_token):
         print(f"❌ Error refreshing token: {response.text}")
         return None
 
+def refresh_tokens(tokens):
+    """Refresh a token set, save it and return the new tokens (None on failure)."""
+    new_tokens = refresh_access_token(tokens["refresh_token"])
+    if not new_tokens:
+        return None
+    
+    # Preserve the refresh token if not returned in the response
+    if "refresh_token" not in new_tokens:
+        new_tokens["refresh_token"] = tokens["refresh_token"]
+    
+    save_dropbox_tokens(new_tokens)
+    return new_tokens
+
 def start_oauth_server():
     """Start a local server to handle the OAuth callback."""
     server = HTTPServer(('localhost', 8081), OAuthCallbackHandler)
@@ -170,14 +183,9 @@ def get_valid_access_token():
     
     if is_expired and "refresh_token" in tokens:
         print("⏳ Access token expired, refreshing...")
-        new_tokens = refresh_access_token(tokens["refresh_token"])
+        new_tokens = refresh_tokens(tokens)
         
         if new_tokens:
-            # Preserve the refresh token if not returned in the response
-            if "refresh_token" not in new_tokens:
-                new_tokens["refresh_token"] = tokens["refresh_token"]
-                
-            save_dropbox_tokens(new_tokens)
             return new_tokens["access_token"]
         else:
             print("❌ Token refresh failed. Starting new OAuth flow...")
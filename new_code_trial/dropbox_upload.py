@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+import requests
+from dropbox.exceptions import ApiError, InternalServerError, RateLimitError
+from dropbox.files import CommitInfo, UploadSessionCursor, UploadSessionFinishArg, WriteMode
+
+import dropbox_dedup
+import upload_queue
+
+# Files larger than this are streamed through an upload session
+CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024  # 8 MB
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4 MB per request - also the peak memory per upload
+MAX_CHUNK_RETRIES = 5
+CHUNK_RETRY_DELAY = 2  # seconds, multiplied by the attempt number
+MAX_BATCH_ENTRIES = 1000  # Dropbox limit for one upload_session/finish_batch call
+# Write errors a retry cannot fix, so the upload is given up straight away
+PERMANENT_WRITE_ERRORS = ("malformed_path", "disallowed_name", "insufficient_space", "no_write_permission",
+                          "team_folder")
+
+# Cap on upload bandwidth shared by all workers, in bytes per second (0 = unlimited)
+UPLOAD_BANDWIDTH_LIMIT = int(os.environ.get("UPLOAD_BANDWIDTH_LIMIT", 0))
+BANDWIDTH_BURST_SECONDS = 2  # How much unused bandwidth may be saved up for a burst
+
+class TokenBucket:
+    """Token bucket shared by the upload threads: each byte sent costs one token.
+
+    A request larger than the bucket may go into debt; the caller then
+    sleeps until the debt is paid back, so the average rate stays capped.
+    """
+
+    def __init__(self, rate, burst_seconds=BANDWIDTH_BURST_SECONDS):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst_seconds)
+
+    def set_rate(self, rate, burst_seconds=BANDWIDTH_BURST_SECONDS):
+        with self._lock:
+            self.rate = rate
+            self.capacity = rate * burst_seconds
+            self.tokens = self.capacity
+            self.updated_at = time.monotonic()
+
+    def consume(self, amount):
+        """Take amount tokens, sleeping as long as needed to stay under the rate."""
+        with self._lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+_bandwidth = TokenBucket(UPLOAD_BANDWIDTH_LIMIT)
+
+def set_bandwidth_limit(bytes_per_second):
+    """Change the upload bandwidth cap (0 = unlimited)."""
+    _bandwidth.set_rate(bytes_per_second)
+
+def throttle(size):
+    """Wait until size bytes may be sent under the bandwidth cap."""
+    _bandwidth.consume(size)
+
+# Open upload sessions, keyed by file, so a failed upload resumes instead of restarting
+_upload_sessions = {}
+
+def _session_key(local_file_path, dropbox_path):
+    """Identify an upload session by file path, destination, size and mtime."""
+    stat = os.stat(local_file_path)
+    return (local_file_path, dropbox_path, stat.st_size, stat.st_mtime)
+
+def _correct_offset(error):
+    """Return the server's offset if the error says ours was wrong, else None."""
+    if hasattr(error, "is_lookup_failed") and error.is_lookup_failed():
+        error = error.get_lookup_failed()
+    if hasattr(error, "is_incorrect_offset") and error.is_incorrect_offset():
+        return error.get_incorrect_offset().correct_offset
+    return None
+
+def _session_lost(error):
+    """Check if the error means the upload session can no longer be used."""
+    if hasattr(error, "is_lookup_failed") and error.is_lookup_failed():
+        error = error.get_lookup_failed()
+    return any(
+        hasattr(error, check) and getattr(error, check)()
+        for check in ("is_not_found", "is_closed")
+    )
+
+def is_permanent_error(error):
+    """Check if a Dropbox ApiError (or batch entry failure) will fail again however often it is retried."""
+    if isinstance(error, ApiError):
+        error = error.error
+    if hasattr(error, "is_path") and error.is_path():
+        error = error.get_path()
+        # files_upload wraps the write error together with the upload session id
+        error = getattr(error, "reason", error)
+    return any(
+        hasattr(error, f"is_{name}") and getattr(error, f"is_{name}")()
+        for name in PERMANENT_WRITE_ERRORS
+    )
+
+def _start_session(dbx, f, close=False):
+    """Start a new upload session with the first chunk of the file."""
+    f.seek(0)
+    chunk = f.read(UPLOAD_CHUNK_SIZE)
+    throttle(len(chunk))
+    result = dbx.files_upload_session_start(chunk, close=close)
+    return {"session_id": result.session_id, "offset": len(chunk)}
+
+def _append_chunks(dbx, f, state, end_offset, close=False):
+    """Append file data to the session until end_offset has been acknowledged."""
+    while state["offset"] < end_offset:
+        f.seek(state["offset"])
+        chunk = f.read(min(UPLOAD_CHUNK_SIZE, end_offset - state["offset"]))
+        cursor = UploadSessionCursor(session_id=state["session_id"], offset=state["offset"])
+        is_last = close and state["offset"] + len(chunk) >= end_offset
+        throttle(len(chunk))
+        dbx.files_upload_session_append_v2(chunk, cursor, close=is_last)
+        state["offset"] += len(chunk)
+
+def _with_resume(local_file_path, dropbox_path, upload_step):
+    """Run upload_step(f, state, key) with retries, resuming from the last acknowledged offset."""
+    key = _session_key(local_file_path, dropbox_path)
+    attempts = 0
+
+    with open(local_file_path, 'rb') as f:
+        while True:
+            state = _upload_sessions.get(key)
+            try:
+                result = upload_step(f, state, key)
+                _upload_sessions.pop(key, None)
+                return result
+
+            except ApiError as e:
+                state = _upload_sessions.get(key)
+                offset = _correct_offset(e.error)
+                if offset is not None and state is not None:
+                    print(f"↪️ Resuming {os.path.basename(local_file_path)} from byte {offset}")
+                    state["offset"] = offset
+                elif _session_lost(e.error):
+                    print(f"⚠️ Upload session for {os.path.basename(local_file_path)} expired, starting over")
+                    _upload_sessions.pop(key, None)
+                else:
+                    raise
+
+            except (requests.exceptions.RequestException, InternalServerError) as e:
+                print(f"⚠️ Chunk upload interrupted: {e}")
+
+            attempts += 1
+            if attempts > MAX_CHUNK_RETRIES:
+                # Keep the session so the next attempt from the upload queue can resume it
+                raise RuntimeError(f"giving up on {local_file_path} after {MAX_CHUNK_RETRIES} retries")
+            time.sleep(CHUNK_RETRY_DELAY * attempts)
+
+def upload_large_file(dbx, local_file_path, dropbox_path):
+    """Stream a file to Dropbox through an upload session and return its metadata."""
+    file_size = os.path.getsize(local_file_path)
+
+    def upload_step(f, state, key):
+        if state is None:
+            state = _start_session(dbx, f)
+            _upload_sessions[key] = state
+
+        # Send everything except the last chunk, which goes with the commit
+        _append_chunks(dbx, f, state, file_size - UPLOAD_CHUNK_SIZE)
+
+        f.seek(state["offset"])
+        cursor = UploadSessionCursor(session_id=state["session_id"], offset=state["offset"])
+        commit = CommitInfo(path=dropbox_path, mode=WriteMode('overwrite'))
+        chunk = f.read(UPLOAD_CHUNK_SIZE)
+        throttle(len(chunk))
+        return dbx.files_upload_session_finish(chunk, cursor, commit)
+
+    return _with_resume(local_file_path, dropbox_path, upload_step)
+
+def upload_to_session(dbx, local_file_path, dropbox_path):
+    """Upload a whole file into a closed session and return its batch finish entry."""
+    file_size = os.path.getsize(local_file_path)
+
+    def upload_step(f, state, key):
+        if state is None:
+            state = _start_session(dbx, f, close=file_size <= UPLOAD_CHUNK_SIZE)
+            _upload_sessions[key] = state
+
+        # Close the session with the last chunk so it can be committed in a batch
+        _append_chunks(dbx, f, state, file_size, close=True)
+
+        cursor = UploadSessionCursor(session_id=state["session_id"], offset=state["offset"])
+        commit = CommitInfo(path=dropbox_path, mode=WriteMode('overwrite'))
+        return UploadSessionFinishArg(cursor=cursor, commit=commit)
+
+    return _with_resume(local_file_path, dropbox_path, upload_step)
+
+def upload_batch(dbx, files):
+    """Upload (local_path, dropbox_path) pairs and commit them in one batch call.
+
+    Files are uploaded in the given order, so callers can put JPGs first.
+    Files Dropbox already has with the same content are skipped and count
+    as uploaded. Returns one result per file, in the same order: True,
+    False (worth retrying) or upload_queue.PERMANENT_FAILURE.
+    """
+    results = [False] * len(files)
+    entries = []
+    entry_indexes = []
+
+    for index, (local_file_path, dropbox_path) in enumerate(files):
+        if dropbox_dedup.is_already_uploaded(dbx, local_file_path, dropbox_path):
+            print(f"⏭️ {os.path.basename(local_file_path)} is already in Dropbox, skipping")
+            results[index] = True
+            continue
+        try:
+            entries.append(upload_to_session(dbx, local_file_path, dropbox_path))
+            entry_indexes.append(index)
+        except RateLimitError:
+            # Let the caller back off instead of hammering Dropbox with the rest of the batch
+            raise
+        except Exception as e:
+            print(f"❌ Could not upload {os.path.basename(local_file_path)} for batch: {e}")
+            if is_permanent_error(e):
+                results[index] = upload_queue.PERMANENT_FAILURE
+
+    # Commit every uploaded session with a single API call
+    for start in range(0, len(entries), MAX_BATCH_ENTRIES):
+        batch = entries[start:start + MAX_BATCH_ENTRIES]
+        batch_result = dbx.files_upload_session_finish_batch_v2(batch)
+        for index, entry in zip(entry_indexes[start:start + MAX_BATCH_ENTRIES], batch_result.entries):
+            if entry.is_success():
+                results[index] = True
+                dropbox_dedup.record_upload(entry.get_success())
+            else:
+                print(f"❌ Batch commit failed for {files[index][1]}: {entry.get_failure()}")
+                if is_permanent_error(entry.get_failure()):
+                    results[index] = upload_queue.PERMANENT_FAILURE
+
+    return results
@@ -0,0 +1,92 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+EVENT_HISTORY = 100  # Recent events replayed to a browser that reconnects with Last-Event-ID
+SUBSCRIBER_QUEUE_SIZE = 200  # Events buffered per browser before the oldest are dropped
+HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments on an idle stream
+SSE_RETRY_MS = 3000  # How long browsers wait before reconnecting
+
+# Bus state (guarded by _bus_lock)
+_bus_lock = threading.Lock()
+_subscribers = []
+_history = deque(maxlen=EVENT_HISTORY)
+_next_id = 1
+_snapshot_funcs = []
+
+def publish(kind, data=None):
+    """Send an event to every subscriber. Never blocks the publishing thread."""
+    global _next_id
+    with _bus_lock:
+        event = {"id": _next_id, "kind": kind, "time": time.time(), "data": data or {}}
+        _next_id += 1
+        _history.append(event)
+        subscribers = list(_subscribers)
+
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # A stalled browser loses its oldest events instead of holding up the bus
+            try:
+                subscriber.get_nowait()
+                subscriber.put_nowait(event)
+            except (queue.Empty, queue.Full):
+                pass
+
+def add_snapshot(snapshot_func):
+    """Register snapshot_func() -> (kind, data), sent to every new subscriber as its initial state."""
+    _snapshot_funcs.append(snapshot_func)
+
+def subscribe(last_event_id=None):
+    """Register a subscriber queue, pre-filled with any events it missed since last_event_id."""
+    subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _bus_lock:
+        if last_event_id is not None:
+            for event in _history:
+                if event["id"] > last_event_id:
+                    subscriber.put_nowait(event)
+        _subscribers.append(subscriber)
+    return subscriber
+
+def unsubscribe(subscriber):
+    with _bus_lock:
+        if subscriber in _subscribers:
+            _subscribers.remove(subscriber)
+
+def subscriber_count():
+    with _bus_lock:
+        return len(_subscribers)
+
+def _format(event):
+    """Encode an event in the text/event-stream format."""
+    payload = json.dumps(dict(event["data"], time=event["time"]))
+    event_id = f"id: {event['id']}\n" if event.get("id") else ""
+    return f"{event_id}event: {event['kind']}\ndata: {payload}\n\n"
+
+def stream_events(last_event_id=None):
+    """Generator producing a Server-Sent Events stream for one browser."""
+    subscriber = subscribe(last_event_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+
+        # Start the browser off with the current state instead of making it poll for it
+        for snapshot_func in list(_snapshot_funcs):
+            try:
+                kind, data = snapshot_func()
+                yield _format({"kind": kind, "time": time.time(), "data": data})
+            except Exception as e:
+                print(f"⚠️ Event snapshot failed: {e}")
+
+        while True:
+            try:
+                event = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                # Comment line keeps proxies and the browser from timing out the connection
+                yield ": keep-alive\n\n"
+                continue
+            yield _format(event)
+    finally:
+        unsubscribe(subscriber)
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import deque
+
+# Pipeline stages in the order a pedal press passes through them
+STAGES = ("hid_read", "debounce", "capture_start", "capture_done", "file_saved", "upload_done")
+
+# Histogram bucket upper bounds in seconds (Prometheus style, cumulative)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+LATENCY_WINDOW = 500  # Recent samples kept per stage for percentiles
+
+# Rolling histograms per stage (guarded by _latency_lock)
+_latency_lock = threading.Lock()
+_histograms = {}
+
+# Traces waiting for their uploads to finish, keyed by upload queue item id
+_upload_traces = {}
+
+class Trace:
+    """Monotonic timestamps for one capture as it moves through the pipeline.
+
+    Every mark records the time since the first mark, so each stage's
+    histogram answers "how long after the press did we get here".
+    """
+
+    def __init__(self):
+        self.marks = {}
+        self.started_at = None
+        self.pending_uploads = set()
+
+    def mark(self, stage, timestamp=None):
+        """Record that the capture reached a stage (now, or at a given monotonic time)."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.started_at is None:
+            self.started_at = timestamp
+        self.marks[stage] = timestamp
+        _observe(stage, timestamp - self.started_at)
+
+def _new_histogram():
+    return {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "sum": 0.0, "recent": deque(maxlen=LATENCY_WINDOW)}
+
+def _observe(stage, seconds):
+    """Add one sample to a stage's histogram."""
+    with _latency_lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = _new_histogram()
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+        histogram["count"] += 1
+        histogram["sum"] += seconds
+        histogram["recent"].append(seconds)
+
+def watch_uploads(trace, item_ids):
+    """Mark upload_done on the trace once every listed upload queue item is uploaded."""
+    with _latency_lock:
+        trace.pending_uploads.update(item_ids)
+        for item_id in item_ids:
+            _upload_traces[item_id] = trace
+
+def on_upload_finished(item, status):
+    """Upload queue listener that completes traces registered with watch_uploads.
+
+    A trace with any failed upload is dropped without an upload_done mark.
+    """
+    if status == "retrying":
+        return
+    with _latency_lock:
+        trace = _upload_traces.pop(item["id"], None)
+        if trace is None:
+            return
+        trace.pending_uploads.discard(item["id"])
+        if status != "uploaded":
+            # The capture never fully reached Dropbox, so it must not count towards upload_done
+            for item_id in trace.pending_uploads:
+                _upload_traces.pop(item_id, None)
+            trace.pending_uploads.clear()
+            return
+        finished = not trace.pending_uploads
+
+    if finished:
+        trace.mark("upload_done")
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def get_latency_stats():
+    """Return count, average and percentiles (in ms) per stage."""
+    stats = {}
+    with _latency_lock:
+        for stage in STAGES:
+            histogram = _histograms.get(stage)
+            if not histogram or not histogram["count"]:
+                continue
+            recent = sorted(histogram["recent"])
+            stats[stage] = {
+                "count": histogram["count"],
+                "average_ms": round(histogram["sum"] / histogram["count"] * 1000, 2),
+                "p50_ms": round(_percentile(recent, 0.5) * 1000, 2),
+                "p90_ms": round(_percentile(recent, 0.9) * 1000, 2),
+                "p99_ms": round(_percentile(recent, 0.99) * 1000, 2),
+                "max_ms": round(recent[-1] * 1000, 2)
+            }
+    return stats
+
+def render_prometheus():
+    """Render the histograms in the Prometheus text exposition format."""
+    lines = [
+        "# HELP camera_press_latency_seconds Time from pedal press to each capture pipeline stage",
+        "# TYPE camera_press_latency_seconds histogram"
+    ]
+    with _latency_lock:
+        for stage in STAGES:
+            histogram = _histograms.get(stage)
+            if not histogram:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f'camera_press_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'camera_press_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'camera_press_latency_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+            lines.append(f'camera_press_latency_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LIVE_VIEW_FPS = 10  # Upper bound on camera preview reads per second
+LIVE_VIEW_BUFFER = 4  # Recent frames kept for viewers
+LIVE_VIEW_IDLE_TIMEOUT = 5  # seconds without viewers before the producer stops
+LIVE_VIEW_ERROR_DELAY = 2  # seconds to back off after a failed preview read
+MJPEG_BOUNDARY = "frame"
+
+# Ring buffer of (sequence number, JPEG bytes) shared by every viewer (guarded by _frame_lock)
+_frame_lock = threading.Lock()
+_new_frame = threading.Condition(_frame_lock)
+_frames = deque(maxlen=LIVE_VIEW_BUFFER)
+_sequence = 0
+_viewers = 0
+_last_viewer_at = 0
+
+# Producer state
+_frame_func = None
+_producer_thread = None
+_pause_count = 0
+_resumed = threading.Event()
+_resumed.set()
+
+def _publish(jpeg):
+    """Add a frame to the ring buffer and wake the viewers."""
+    global _sequence
+    with _new_frame:
+        _sequence += 1
+        _frames.append((_sequence, jpeg))
+        _new_frame.notify_all()
+
+def _producer():
+    """Background thread reading preview frames while anyone is watching."""
+    global _producer_thread
+    frame_interval = 1 / LIVE_VIEW_FPS
+    print("🎥 Live view started")
+
+    while True:
+        with _frame_lock:
+            if _viewers == 0 and time.monotonic() - _last_viewer_at > LIVE_VIEW_IDLE_TIMEOUT:
+                _producer_thread = None
+                break
+
+        # Stay off the camera while a capture needs it
+        _resumed.wait()
+
+        started_at = time.monotonic()
+        try:
+            jpeg = _frame_func()
+        except Exception as e:
+            print(f"⚠️ Live view frame failed: {e}")
+            time.sleep(LIVE_VIEW_ERROR_DELAY)
+            continue
+
+        # None means the camera was busy - just try again on the next tick
+        if jpeg:
+            _publish(jpeg)
+        time.sleep(max(frame_interval - (time.monotonic() - started_at), 0))
+
+    print("🎥 Live view stopped (no viewers)")
+
+def _ensure_producer():
+    """Start the producer thread if it is not running. Caller must hold _frame_lock."""
+    global _producer_thread
+    if _producer_thread is None:
+        _producer_thread = threading.Thread(target=_producer, name="live-view")
+        _producer_thread.daemon = True
+        _producer_thread.start()
+
+def set_frame_source(frame_func):
+    """Set the function that reads one preview frame.
+
+    frame_func() returns JPEG bytes, or None if the camera is busy.
+    """
+    global _frame_func
+    _frame_func = frame_func
+
+@contextmanager
+def paused():
+    """Keep the producer off the camera for the duration of the block."""
+    global _pause_count
+    with _frame_lock:
+        _pause_count += 1
+        _resumed.clear()
+    try:
+        yield
+    finally:
+        with _frame_lock:
+            _pause_count -= 1
+            if _pause_count == 0:
+                _resumed.set()
+
+def get_latest_frame(wait=0):
+    """Return the newest frame's JPEG bytes, waiting up to `wait` seconds for the first one."""
+    global _last_viewer_at
+    with _new_frame:
+        _last_viewer_at = time.monotonic()
+        _ensure_producer()
+        if not _frames and wait:
+            _new_frame.wait(timeout=wait)
+        return _frames[-1][1] if _frames else None
+
+def stream_frames():
+    """Generator producing a multipart/x-mixed-replace MJPEG stream for one viewer.
+
+    Every viewer reads from the same ring buffer, so extra viewers cost no
+    camera reads. Slow viewers skip straight to the newest frame.
+    """
+    global _viewers, _last_viewer_at
+    with _frame_lock:
+        _viewers += 1
+        _ensure_producer()
+    print(f"🎥 Live view viewer connected ({_viewers} watching)")
+
+    last_sent = 0
+    try:
+        while True:
+            with _new_frame:
+                if not _frames or _frames[-1][0] == last_sent:
+                    _new_frame.wait(timeout=1)
+                if not _frames or _frames[-1][0] == last_sent:
+                    continue
+                last_sent, jpeg = _frames[-1]
+
+            yield (f"--{MJPEG_BOUNDARY}\r\n"
+                   f"Content-Type: image/jpeg\r\n"
+                   f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+    finally:
+        with _frame_lock:
+            _viewers -= 1
+            _last_viewer_at = time.monotonic()
+        print("🎥 Live view viewer disconnected")
+
+def get_live_view_stats():
+    """Return the producer and viewer state for the status API."""
+    with _frame_lock:
+        return {
+            "running": _producer_thread is not None,
+            "paused": not _resumed.is_set(),
+            "viewers": _viewers,
+            "frames_produced": _sequence
+        }
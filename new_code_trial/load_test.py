@@ -0,0 +1,189 @@
+"""Load test for the web interface: how many dashboards can stay connected?
+
+Each simulated dashboard loads the page and today's gallery, keeps an
+/events stream open like the browser does, and polls the camera and upload
+status. The number of dashboards is stepped up until requests fail, a
+stream cannot connect or the 95th percentile latency passes --max-p95:
+
+    python camera_service.py &
+    gunicorn --worker-class gthread --workers 4 --threads 64 --bind 127.0.0.1:8080 wsgi:app &
+    python load_test.py --url http://127.0.0.1:8080 --clients 10,50,100,200
+
+It works the same against the development server (python webinterface.py).
+"""
+import argparse
+import http.client
+import socket
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+
+class Dashboard:
+    """One simulated browser tab."""
+
+    def __init__(self, url, poll_interval, results):
+        self.url = url.rstrip("/")
+        self.poll_interval = poll_interval
+        self.results = results
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.stream = None  # http.client connection carrying /events
+        self.threads = []
+
+    def _get(self, path, **kwargs):
+        started_at = time.monotonic()
+        try:
+            response = self.session.get(self.url + path, timeout=10, **kwargs)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response, ok = None, False
+        self.results.record_request(time.monotonic() - started_at, ok)
+        return response
+
+    def _listen(self):
+        """Hold an /events stream open and count what arrives, like EventSource.
+
+        Uses http.client so stop() can shut the socket down under a blocked read.
+        """
+        url = urlsplit(self.url)
+        self.stream = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        try:
+            self.stream.request("GET", url.path + "/events", headers={"Accept": "text/event-stream"})
+            response = self.stream.getresponse()
+            if response.status != 200:
+                raise http.client.HTTPException(f"HTTP {response.status}")
+            connected = False
+            while not self.stop_event.is_set():
+                line = response.readline()
+                if not line:
+                    raise http.client.HTTPException("stream closed by the server")
+                if line.startswith(b"event:"):
+                    if not connected:
+                        connected = True
+                        self.results.record_stream()
+                    self.results.record_event()
+        except (OSError, http.client.HTTPException):
+            # Shutting the socket down from stop() also ends up here
+            if not self.stop_event.is_set():
+                self.results.record_stream_error()
+        finally:
+            self.stream.close()
+
+    def _poll(self):
+        user = self._get("/api/current_user")
+        username = user.json()["username"] if user is not None and user.ok else "shared"
+        self._get("/")
+        self._get(f"/gallery/{username}/{datetime.now().strftime('%Y-%m-%d')}")
+        while not self.stop_event.wait(self.poll_interval):
+            self._get("/check_camera")
+            self._get("/api/upload_queue")
+
+    def start(self):
+        for target in (self._listen, self._poll):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.stream is not None and self.stream.sock is not None:
+            try:
+                self.stream.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.session.close()
+
+class Results:
+    """Counters for one load step (shared by every dashboard thread)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.streams = 0
+        self.stream_errors = 0
+        self.events = 0
+
+    def record_request(self, seconds, ok):
+        with self.lock:
+            self.latencies.append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def record_stream(self):
+        with self.lock:
+            self.streams += 1
+
+    def record_stream_error(self):
+        with self.lock:
+            self.stream_errors += 1
+
+    def record_event(self):
+        with self.lock:
+            self.events += 1
+
+    def percentile(self, fraction):
+        with self.lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+def run_step(args, clients):
+    """Run `clients` dashboards for args.duration seconds and return their results."""
+    results = Results()
+    dashboards = [Dashboard(args.url, args.poll_interval, results) for _ in range(clients)]
+    for dashboard in dashboards:
+        dashboard.start()
+        time.sleep(args.ramp / max(clients, 1))
+
+    stop_photos = threading.Event()
+    if args.photo_interval:
+        # One tab keeps taking photos so the streams carry capture and upload events
+        def take_photos():
+            while not stop_photos.wait(args.photo_interval):
+                try:
+                    requests.post(args.url.rstrip("/") + "/take_photo", timeout=10)
+                except requests.RequestException:
+                    pass
+        threading.Thread(target=take_photos, daemon=True).start()
+
+    time.sleep(args.duration)
+    stop_photos.set()
+    for dashboard in dashboards:
+        dashboard.stop()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Find how many dashboard clients the web interface sustains")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="web interface to test")
+    parser.add_argument("--clients", default="10,25,50,100", help="comma-separated dashboard counts to step through")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to hold each step")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which each step's dashboards connect")
+    parser.add_argument("--poll-interval", type=float, default=5, help="seconds between status polls per dashboard")
+    parser.add_argument("--photo-interval", type=float, default=0, help="also take a photo this often (0 = never)")
+    parser.add_argument("--max-p95", type=float, default=500, help="p95 latency in ms a step may reach and still pass")
+    args = parser.parse_args()
+
+    print(f"{'clients':>8}{'requests':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'streams':>9}{'events':>8}  result")
+    sustained = 0
+    for clients in [int(count) for count in args.clients.split(",")]:
+        results = run_step(args, clients)
+        p50, p95, p99 = (results.percentile(fraction) for fraction in (0.5, 0.95, 0.99))
+        passed = (results.errors == 0 and results.stream_errors == 0 and results.streams == clients
+                  and p95 is not None and p95 <= args.max_p95)
+        print(f"{clients:>8}{len(results.latencies):>10}{results.errors:>8}{p50 or 0:>9.1f}{p95 or 0:>9.1f}"
+              f"{p99 or 0:>9.1f}{results.streams:>9}{results.events:>8}  {'✅' if passed else '❌'}")
+        if not passed:
+            break
+        sustained = clients
+
+    print(f"\n📊 Sustained {sustained} concurrent dashboard clients (p95 <= {args.max_p95:.0f} ms, no errors)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+PEDAL_PRESSED = 3  # Value of data[4] while the pedal is held down
+PEDAL_RELEASED = 0  # Value of data[4] once the pedal is let go
+REPORT_SIZE = 64
+READ_TIMEOUT_MS = 1000  # Blocking read - returns early as soon as a report arrives
+
+# kind is "press", "release" or "error"; timestamp is time.monotonic() when the report arrived
+PedalEvent = namedtuple("PedalEvent", ["kind", "timestamp", "data"])
+
+class PedalReader:
+    """Reads HID reports on a dedicated thread and queues pedal press/release events.
+
+    The reader thread only blocks on the device, timestamps each report and
+    detects edges. Everything else happens on whichever thread consumes
+    the events queue.
+    """
+
+    def __init__(self, device, events=None):
+        self.device = device
+        self.events = events if events is not None else queue.Queue()
+        self.pressed = False
+        self.released = threading.Event()  # Set whenever the pedal is up
+        self.released.set()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the reader thread."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="pedal-reader")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reader thread (returns within READ_TIMEOUT_MS)."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=READ_TIMEOUT_MS / 1000 + 1)
+
+    def handle_report(self, data, timestamp):
+        """Turn one HID report into press/release events."""
+        if data[4] == PEDAL_PRESSED and not self.pressed:
+            self.pressed = True
+            self.released.clear()
+            self.events.put(PedalEvent("press", timestamp, data))
+        elif data[4] == PEDAL_RELEASED and self.pressed:
+            self.pressed = False
+            self.released.set()
+            self.events.put(PedalEvent("release", timestamp, data))
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.device.read(REPORT_SIZE, timeout_ms=READ_TIMEOUT_MS)
+            except (OSError, ValueError) as e:
+                self.released.set()
+                self.events.put(PedalEvent("error", time.monotonic(), str(e)))
+                return
+
+            if data:
+                self.handle_report(data, time.monotonic())
@@ -0,0 +1,269 @@
+import io
+import json
+import lzma
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+
+import event_bus
+import thumbnails
+import worker_pool
+
+# Pillow is optional - without it the web_jpeg step is unavailable
+from worker_pool import Image
+
+POSTPROCESS_DIR = "postprocessed"  # Derived files, in one folder per date
+POSTPROCESS_WORKERS = 2
+DELETE_UPLOADED_OUTPUTS = True  # Derived files can be rebuilt from the originals, so they are not kept after upload
+WEB_JPEG_SIZE = (2048, 2048)  # Web-sized derivatives fit inside this box
+WEB_JPEG_QUALITY = 85
+RAW_COMPRESSION_PRESET = 6  # xz preset: higher is smaller but slower
+COPY_CHUNK_SIZE = 1024 * 1024
+
+JPEG_EXTENSIONS = thumbnails.JPEG_EXTENSIONS
+RAW_EXTENSIONS = thumbnails.RAW_EXTENSIONS
+
+# Upload choice meaning "the files exactly as the camera produced them"
+ORIGINAL = "original"
+
+# Directories linked from IFD0, and the maker note inside the EXIF directory
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_MAKER_NOTE = 0x927C
+
+TIFF_TAG_NAMES = {
+    0x010F: "Make", 0x0110: "Model", 0x0112: "Orientation", 0x0131: "Software", 0x0132: "DateTime",
+    0x013B: "Artist", 0x8298: "Copyright", 0x829A: "ExposureTime", 0x829D: "FNumber",
+    0x8822: "ExposureProgram", 0x8827: "ISOSpeedRatings", 0x8830: "SensitivityType", 0x9000: "ExifVersion",
+    0x9003: "DateTimeOriginal", 0x9004: "DateTimeDigitized", 0x9201: "ShutterSpeedValue",
+    0x9202: "ApertureValue", 0x9204: "ExposureBiasValue", 0x9207: "MeteringMode", 0x9209: "Flash",
+    0x920A: "FocalLength", 0x9290: "SubSecTime", 0x9291: "SubSecTimeOriginal", 0xA002: "PixelXDimension",
+    0xA003: "PixelYDimension", 0xA401: "CustomRendered", 0xA402: "ExposureMode", 0xA403: "WhiteBalance",
+    0xA406: "SceneCaptureType", 0xA430: "CameraOwnerName", 0xA431: "BodySerialNumber",
+    0xA432: "LensSpecification", 0xA434: "LensModel", 0xA435: "LensSerialNumber"
+}
+CANON_TAG_NAMES = {
+    0x0001: "CameraSettings", 0x0002: "FocalLength", 0x0004: "ShotInfo", 0x0006: "ImageType",
+    0x0007: "FirmwareVersion", 0x0009: "OwnerName", 0x000C: "SerialNumber", 0x0010: "ModelID",
+    0x0026: "AFInfo2", 0x0095: "LensModel", 0x0096: "InternalSerialNumber", 0x00A0: "ProcessingInfo"
+}
+
+# Counters (guarded by _stats_lock)
+_stats_lock = threading.Lock()
+_stats = {"captures": 0, "failed_steps": 0, "outputs": 0, "queued": 0, "total_seconds": 0.0}
+
+def _read_ifd(data, base, offset, byte_order, names):
+    """Read and name one TIFF directory. Returns ({name: value}, {tag: offset of a linked directory})."""
+    entries, _ = thumbnails.read_ifd(data, base, offset, byte_order)
+    tags = {}
+    locations = {}
+    for tag, (value_type, value_count, value_at) in entries.items():
+        if tag in (TAG_EXIF_IFD, TAG_GPS_IFD):
+            locations[tag] = struct.unpack_from(byte_order + "I", data, value_at)[0]
+        elif tag == TAG_MAKER_NOTE:
+            locations[tag] = value_at - base
+        else:
+            tags[names.get(tag, f"0x{tag:04X}")] = thumbnails.decode_value(data, value_at, value_type,
+                                                                           value_count, byte_order)
+    return tags, locations
+
+def _find_exif(data):
+    """Return where the TIFF structure starts: 0 for a CR2, after the APP1 header for a JPEG."""
+    if data[:2] in (b"II", b"MM"):
+        return 0
+    if data[:2] != b"\xff\xd8":
+        return None
+
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        if marker == 0xDA:
+            break  # Image data starts - no EXIF in this file
+        length = struct.unpack_from(">H", data, position + 2)[0]
+        if marker == 0xE1 and data[position + 4:position + 10] == b"Exif\0\0":
+            return position + 10
+        position += 2 + length
+    return None
+
+def read_metadata(path):
+    """Read the EXIF, GPS and Canon maker-note tags of a JPG or CR2 without decoding the image."""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        base = _find_exif(data)
+        if base is None:
+            raise ValueError(f"No EXIF data in {os.path.basename(path)}")
+        byte_order = "<" if data[base:base + 2] == b"II" else ">"
+        ifd0_offset = struct.unpack_from(byte_order + "I", data, base + 4)[0]
+
+        image, locations = _read_ifd(data, base, ifd0_offset, byte_order, TIFF_TAG_NAMES)
+        metadata = {"source": os.path.basename(path), "size": os.path.getsize(path), "image": image}
+        if TAG_EXIF_IFD in locations:
+            exif, exif_locations = _read_ifd(data, base, locations[TAG_EXIF_IFD], byte_order, TIFF_TAG_NAMES)
+            metadata["exif"] = exif
+            # Canon maker notes are a TIFF directory with offsets from the start of the TIFF data
+            if TAG_MAKER_NOTE in exif_locations and image.get("Make", "").startswith("Canon"):
+                try:
+                    metadata["maker_note"], _ = _read_ifd(data, base, exif_locations[TAG_MAKER_NOTE],
+                                                          byte_order, CANON_TAG_NAMES)
+                except (ValueError, struct.error) as e:
+                    metadata["maker_note_error"] = str(e)
+        if TAG_GPS_IFD in locations:
+            metadata["gps"], _ = _read_ifd(data, base, locations[TAG_GPS_IFD], byte_order, {})
+    return metadata
+
+def _split_capture(files):
+    """Return the JPG and RAW files of one capture."""
+    jpegs = [path for path in files if path.lower().endswith(JPEG_EXTENSIONS)]
+    raws = [path for path in files if path.lower().endswith(RAW_EXTENSIONS)]
+    return jpegs, raws
+
+def extract_metadata(files, output_dir, stem):
+    """Step: write the capture's EXIF and maker notes to a sidecar JSON (read from the RAW when there is one)."""
+    jpegs, raws = _split_capture(files)
+    metadata = read_metadata((raws or jpegs or files)[0])
+    metadata["files"] = [os.path.basename(path) for path in files]
+    sidecar = os.path.join(output_dir, f"{stem}.json")
+    with open(f"{sidecar}.tmp", 'w') as f:
+        json.dump(metadata, f, indent=4)
+    os.replace(f"{sidecar}.tmp", sidecar)
+    return [sidecar]
+
+def make_web_jpeg(files, output_dir, stem):
+    """Step: write a downscaled JPEG, from the JPG or else the preview embedded in the RAW."""
+    if Image is None:
+        raise RuntimeError("Pillow is needed for web_jpeg")
+    jpegs, raws = _split_capture(files)
+    if jpegs:
+        image = Image.open(jpegs[0])
+    elif raws:
+        data = thumbnails.extract_embedded_jpeg(raws[0])
+        if data is None:
+            raise ValueError(f"No embedded preview in {os.path.basename(raws[0])}")
+        image = Image.open(io.BytesIO(data))
+    else:
+        return []
+
+    exif = image.info.get("exif")
+    image.draft("RGB", WEB_JPEG_SIZE)
+    image = image.convert("RGB")
+    image.thumbnail(WEB_JPEG_SIZE)
+    web_jpeg = os.path.join(output_dir, f"{stem}_web.jpg")
+    image.save(f"{web_jpeg}.tmp", "JPEG", quality=WEB_JPEG_QUALITY, **({"exif": exif} if exif else {}))
+    os.replace(f"{web_jpeg}.tmp", web_jpeg)
+    return [web_jpeg]
+
+def compress_raw(files, output_dir, stem):
+    """Step: losslessly compress each RAW file with xz (decompresses to the identical CR2)."""
+    outputs = []
+    for raw in _split_capture(files)[1]:
+        compressed = os.path.join(output_dir, f"{os.path.basename(raw)}.xz")
+        with open(raw, 'rb') as source, lzma.open(f"{compressed}.tmp", 'wb', preset=RAW_COMPRESSION_PRESET) as target:
+            shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+        os.replace(f"{compressed}.tmp", compressed)
+        outputs.append(compressed)
+    return outputs
+
+# Available steps: name -> step(files, output_dir, stem) returning the paths it wrote.
+# Steps run in worker processes, so they must be module-level functions.
+STEPS = {
+    "metadata": extract_metadata,
+    "web_jpeg": make_web_jpeg,
+    "compress_raw": compress_raw
+}
+
+def register_step(name, step_func):
+    """Add a post-processing step that user profiles can then list by name."""
+    STEPS[name] = step_func
+
+def _run_pipeline(steps, files, output_dir, stem):
+    """Run the steps on one capture (runs in a worker process). Returns ({step: paths}, {step: error})."""
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {}
+    errors = {}
+    for name, step_func in steps:
+        try:
+            outputs[name] = step_func(files, output_dir, stem)
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+    return outputs, errors
+
+def get_pipeline(user_config):
+    """Read a profile's "postprocess" settings. Returns (step names, outputs to upload).
+
+    A profile without settings gets no steps and uploads only the originals:
+
+        "postprocess": {"steps": ["metadata", "web_jpeg", "compress_raw"],
+                        "upload": ["metadata", "web_jpeg", "compress_raw"]}
+
+    "upload" lists step names and "original"; it defaults to the originals
+    plus every step.
+    """
+    settings = user_config.get("postprocess") or {}
+    steps = []
+    for name in settings.get("steps", []):
+        if name in STEPS:
+            steps.append(name)
+        else:
+            print(f"⚠️ Unknown post-processing step '{name}' ignored")
+    uploads = set(settings.get("upload", [ORIGINAL] + steps))
+    return steps, uploads
+
+def submit_capture(saved_paths, date, steps, uploads, upload_func):
+    """Run the steps on freshly captured files in the background (returns immediately).
+
+    upload_func(paths) is called in this process with the outputs of the
+    steps listed in uploads, once each capture is processed.
+    """
+    captures = {}
+    for path in saved_paths:
+        captures.setdefault(os.path.splitext(os.path.basename(path))[0], []).append(path)
+
+    output_dir = os.path.join(POSTPROCESS_DIR, date)
+    step_funcs = [(name, STEPS[name]) for name in steps]
+    for stem, files in captures.items():
+        submitted_at = time.monotonic()
+        with _stats_lock:
+            _stats["queued"] += 1
+
+        def done(future, stem=stem, submitted_at=submitted_at):
+            try:
+                outputs, errors = future.result()
+            except Exception as e:
+                outputs, errors = {}, {"pipeline": str(e)}
+            with _stats_lock:
+                _stats["queued"] -= 1
+                _stats["captures"] += 1
+                _stats["failed_steps"] += len(errors)
+                _stats["outputs"] += sum(len(paths) for paths in outputs.values())
+                _stats["total_seconds"] += time.monotonic() - submitted_at
+
+            for name, error in errors.items():
+                print(f"⚠️ Post-processing step {name} failed for {stem}: {error}")
+            to_upload = [path for name, paths in outputs.items() if name in uploads for path in paths]
+            event_bus.publish("postprocess", {"capture": stem, "success": not errors, "errors": errors,
+                                              "outputs": [os.path.basename(path)
+                                                          for paths in outputs.values() for path in paths]})
+            if to_upload:
+                try:
+                    upload_func(to_upload)
+                except Exception as e:
+                    print(f"⚠️ Could not queue post-processed files of {stem}: {e}")
+
+        pool = worker_pool.get_pool("postprocess", POSTPROCESS_WORKERS)
+        future = pool.submit(_run_pipeline, step_funcs, files, output_dir, stem)
+        future.add_done_callback(done)
+
+def on_upload_finished(item, status):
+    """Upload queue listener that deletes derived files once they are safely in Dropbox."""
+    if DELETE_UPLOADED_OUTPUTS:
+        worker_pool.delete_if_uploaded(item, status, POSTPROCESS_DIR)
+
+def get_postprocess_stats():
+    """Return counts of processed captures, outputs and failures, and the average time per capture."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["avg_seconds"] = round(stats.pop("total_seconds") / stats["captures"], 2) if stats["captures"] else None
+    stats["steps"] = sorted(STEPS)
+    return stats
@@ -0,0 +1,224 @@
+import os
+import posixpath
+import shutil
+import threading
+import time
+
+import capture_index
+import dropbox_client
+import dropbox_dedup
+import upload_queue
+import user_registry
+
+# Free-space targets for the disk holding the photos
+STORAGE_LOW_WATER_MB = 2048  # Start evicting uploaded files below this much free space
+STORAGE_HIGH_WATER_MB = 3072  # ...and keep going until this much is free again
+STORAGE_CHECK_INTERVAL = 30  # seconds between background checks
+EVICTION_BATCH = 20  # Files deleted per step, so eviction never holds things up for long
+EVICTION_PAUSE = 0.2  # seconds between eviction steps
+DEFAULT_FRAME_SIZE_MB = 60  # Assumed size of the next capture until we have seen one
+FRAME_SIZE_MARGIN = 1.5  # Reserve this multiple of the largest recent capture
+
+# Manager state (guarded by _storage_lock)
+_storage_lock = threading.Lock()
+_photo_dir = None
+_expected_frame_bytes = DEFAULT_FRAME_SIZE_MB * 1024 * 1024
+_evicted_files = 0
+_evicted_bytes = 0
+_last_check_at = None
+
+# Only one eviction step runs at a time (background thread or a capture waiting for space)
+_evict_lock = threading.Lock()
+
+# Monitor thread state
+_monitor_thread = None
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+
+def _free_bytes():
+    return shutil.disk_usage(_photo_dir).free
+
+def _remove_capture(capture):
+    """Delete one local file and any folder it leaves empty. Returns the bytes freed."""
+    local_path = capture["local_path"]
+    try:
+        size = os.path.getsize(local_path)
+        os.remove(local_path)
+    except FileNotFoundError:
+        size = 0
+
+    folder = os.path.dirname(local_path)
+    try:
+        if folder != os.path.abspath(_photo_dir) and not os.listdir(folder):
+            os.rmdir(folder)
+    except OSError:
+        pass
+    return size
+
+def _confirm_uploaded(dbx, capture):
+    """Check with fresh Dropbox metadata that the uploaded copy matches the local file."""
+    local_path = capture["local_path"]
+    if not os.path.exists(local_path):
+        return True  # Nothing left to lose
+    if not capture["dropbox_path"]:
+        return False
+    remote = dropbox_dedup.get_remote_file(dbx, capture["dropbox_path"])
+    return remote == (dropbox_dedup.content_hash(local_path), os.path.getsize(local_path))
+
+def _send_again(capture):
+    """Put a capture whose Dropbox copy is missing or different back in the upload queue."""
+    local_path = capture["local_path"]
+    print(f"⚠️ Dropbox copy of {os.path.basename(local_path)} is missing or different - uploading it again")
+    if not capture["dropbox_path"]:
+        capture_index.set_upload_state(local_path, "local_only")
+        return
+    capture_index.set_upload_state(local_path, "pending")
+    upload_queue.enqueue_upload(local_path, posixpath.dirname(capture["dropbox_path"]), upload_queue.LANE_BACKGROUND)
+
+def _evict_step(username=None):
+    """Delete up to EVICTION_BATCH of the oldest uploaded files. Returns how many were handled.
+
+    A file is only deleted once fresh Dropbox metadata shows the same
+    content there; the index alone may be out of date.
+    """
+    global _evicted_files, _evicted_bytes
+    with _evict_lock:
+        candidates = capture_index.eviction_candidates(username, limit=EVICTION_BATCH)
+        if not candidates:
+            return 0
+        dbx = dropbox_client.get_client()
+        if dbx is None:
+            print("⚠️ Cannot reach Dropbox to confirm uploads - not evicting")
+            return 0
+
+        confirmed = []
+        resent = 0
+        for capture in candidates:
+            try:
+                if _confirm_uploaded(dbx, capture):
+                    confirmed.append(capture)
+                else:
+                    _send_again(capture)
+                    resent += 1
+            except Exception as e:
+                print(f"⚠️ Could not confirm upload of {os.path.basename(capture['local_path'])}: {e}")
+
+        freed = sum(_remove_capture(capture) for capture in confirmed)
+        capture_index.mark_evicted([capture["local_path"] for capture in confirmed])
+
+    with _storage_lock:
+        _evicted_files += len(confirmed)
+        _evicted_bytes += freed
+    who = f" of {username}" if username else ""
+    print(f"🧹 Evicted {len(confirmed)} uploaded file(s){who} ({freed / (1024 * 1024):.1f} MB)")
+    return len(confirmed) + resent
+
+def _over_quota_users():
+    """Return the users whose local files take more than their local_quota_mb."""
+    users = user_registry.get_all_users()
+    over = []
+    for username, used in capture_index.local_usage_by_user().items():
+        quota_mb = users.get(username, {}).get("local_quota_mb")
+        if quota_mb is not None and used > quota_mb * 1024 * 1024:
+            over.append(username)
+    return over
+
+def run_eviction():
+    """Enforce per-user quotas and the global low-water mark, one small step at a time."""
+    global _last_check_at
+
+    for username in _over_quota_users():
+        while not _stop_event.is_set() and username in _over_quota_users():
+            if not _evict_step(username):
+                break
+            time.sleep(EVICTION_PAUSE)
+
+    if _free_bytes() < STORAGE_LOW_WATER_MB * 1024 * 1024:
+        print(f"⚠️ Less than {STORAGE_LOW_WATER_MB} MB free, evicting uploaded photos...")
+        while not _stop_event.is_set() and _free_bytes() < STORAGE_HIGH_WATER_MB * 1024 * 1024:
+            if not _evict_step():
+                print("⚠️ Nothing left to evict - remaining files are not uploaded yet")
+                break
+            time.sleep(EVICTION_PAUSE)
+
+    with _storage_lock:
+        _last_check_at = time.time()
+
+def _monitor(interval):
+    """Background thread that keeps free space above the low-water mark."""
+    while not _stop_event.is_set():
+        try:
+            run_eviction()
+        except Exception as e:
+            print(f"⚠️ Storage check failed: {e}")
+        _wake_event.wait(interval)
+        _wake_event.clear()
+
+def start_manager(photo_dir, interval=STORAGE_CHECK_INTERVAL):
+    """Start the background storage manager. Calling this again is a no-op."""
+    global _photo_dir, _monitor_thread
+    with _storage_lock:
+        if _monitor_thread is not None:
+            return
+        _photo_dir = photo_dir
+        _stop_event.clear()
+        _monitor_thread = threading.Thread(target=_monitor, args=(interval,), name="storage-manager")
+        _monitor_thread.daemon = True
+        _monitor_thread.start()
+
+def stop_manager():
+    """Stop the background storage manager."""
+    global _monitor_thread
+    _stop_event.set()
+    _wake_event.set()
+    if _monitor_thread is not None:
+        _monitor_thread.join(timeout=5)
+    _monitor_thread = None
+
+def note_capture(saved_paths):
+    """Learn the size of a capture and let the manager check the disk again."""
+    global _expected_frame_bytes
+    size = 0
+    for path in saved_paths:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    with _storage_lock:
+        if size:
+            # Follow the largest recent capture, letting old peaks fade slowly
+            _expected_frame_bytes = max(size, _expected_frame_bytes * 0.9)
+    _wake_event.set()
+
+def has_space_for_capture():
+    """Check that another capture fits on disk, evicting right away if it does not.
+
+    Only returns False when the disk is full of files that are not uploaded yet.
+    """
+    if _photo_dir is None:
+        return True
+    needed = _expected_frame_bytes * FRAME_SIZE_MARGIN
+    while _free_bytes() < needed:
+        if not _evict_step():
+            print(f"❌ Not enough disk space for another capture ({_free_bytes() / (1024 * 1024):.0f} MB free)")
+            return False
+    return True
+
+def get_storage_stats():
+    """Return disk usage, per-user local usage and eviction counters."""
+    usage = shutil.disk_usage(_photo_dir or ".")
+    quotas = {username: profile.get("local_quota_mb") for username, profile in user_registry.get_all_users().items()}
+    local_usage = capture_index.local_usage_by_user()
+    with _storage_lock:
+        return {
+            "free_mb": round(usage.free / (1024 * 1024), 1),
+            "total_mb": round(usage.total / (1024 * 1024), 1),
+            "low_water_mb": STORAGE_LOW_WATER_MB,
+            "high_water_mb": STORAGE_HIGH_WATER_MB,
+            "expected_frame_mb": round(_expected_frame_bytes / (1024 * 1024), 1),
+            "users": {username: {"local_mb": round(used / (1024 * 1024), 1), "quota_mb": quotas.get(username)}
+                      for username, used in local_usage.items()},
+            "evicted_files": _evicted_files,
+            "evicted_mb": round(_evicted_bytes / (1024 * 1024), 1),
+            "last_check_at": _last_check_at
+        }
@@ -0,0 +1,310 @@
+import io
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import worker_pool
+
+# Pillow is optional - without it CR2 files still get the small thumbnail embedded in the RAW
+from worker_pool import Image
+
+THUMBNAIL_DIR = "thumbnail_cache"
+THUMBNAIL_SIZE = (320, 320)  # Thumbnails fit inside this box
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_CACHE_MAX_MB = 200  # Least recently used thumbnails are deleted above this
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_TIMEOUT = 30  # seconds to wait when a thumbnail is rebuilt on request
+MANIFEST_FILE = "manifest.json"
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+RAW_EXTENSIONS = (".cr2",)
+
+# TIFF tags used to find the JPEGs embedded in a CR2
+TAG_STRIP_OFFSETS = 0x0111
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+
+# TIFF field types: struct format and size of one value
+TIFF_TYPES = {1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("I", 8), 6: ("b", 1), 7: ("B", 1),
+              8: ("h", 2), 9: ("i", 4), 10: ("i", 8), 11: ("f", 4), 12: ("d", 8)}
+TIFF_ASCII = 2
+TIFF_UNDEFINED = 7
+TIFF_RATIONAL_TYPES = (5, 10)
+MAX_IFD_ENTRIES = 1000  # Anything larger is a corrupt directory
+MAX_BLOB_BYTES = 64  # Longer opaque values are summarised instead of dumped
+
+# Usernames and date folders that may appear in a cache path
+SAFE_NAME = re.compile(r"^[\w-]+$")
+
+# LRU index of cached thumbnails: relative path -> size, oldest first (guarded by _cache_lock)
+_cache_lock = threading.Lock()
+_index = None
+_total_bytes = 0
+
+def decode_value(data, offset, value_type, count, byte_order):
+    """Turn one TIFF field into JSON-friendly values."""
+    fmt, unit = TIFF_TYPES[value_type]
+    raw = data[offset:offset + unit * count]
+    if value_type == TIFF_ASCII:
+        return bytes(raw).split(b"\0")[0].decode("ascii", "replace").strip()
+    if value_type == TIFF_UNDEFINED:
+        raw = bytes(raw)
+        if len(raw) > MAX_BLOB_BYTES:
+            return f"<{len(raw)} bytes>"
+        text = raw.rstrip(b"\0")
+        return text.decode("ascii") if text.isascii() and text.decode("ascii").isprintable() else raw.hex()
+
+    if value_type in TIFF_RATIONAL_TYPES:
+        numbers = struct.unpack(f"{byte_order}{count * 2}{fmt}", raw)
+        values = [round(n / d, 6) if d else None for n, d in zip(numbers[::2], numbers[1::2])]
+    else:
+        values = list(struct.unpack(f"{byte_order}{count}{fmt}", raw))
+    return values[0] if count == 1 else values
+
+def read_ifd(data, base, offset, byte_order):
+    """Read one TIFF directory from data, where the TIFF structure starts at base.
+
+    Returns ({tag: (value_type, count, absolute offset of the value)}, offset
+    of the next directory). Entries of unknown types or pointing past the end
+    of data are left out.
+    """
+    start = base + offset
+    count = struct.unpack_from(byte_order + "H", data, start)[0]
+    if count > MAX_IFD_ENTRIES:
+        raise ValueError(f"Corrupt TIFF directory at {start}")
+
+    entries = {}
+    for index in range(count):
+        entry = start + 2 + index * 12
+        tag, value_type, value_count = struct.unpack_from(byte_order + "HHI", data, entry)
+        if value_type not in TIFF_TYPES:
+            continue
+        size = TIFF_TYPES[value_type][1] * value_count
+        value_at = entry + 8 if size <= 4 else base + struct.unpack_from(byte_order + "I", data, entry + 8)[0]
+        if value_at + size <= len(data):
+            entries[tag] = (value_type, value_count, value_at)
+    # Maker notes may end right after their entries, without the link to a next directory
+    link = start + 2 + count * 12
+    next_offset = struct.unpack_from(byte_order + "I", data, link)[0] if link + 4 <= len(data) else 0
+    return entries, next_offset
+
+def read_tag(data, entries, tag, byte_order):
+    """Return the decoded value of tag from read_ifd's entries, or None if it is missing."""
+    if tag not in entries:
+        return None
+    value_type, count, value_at = entries[tag]
+    return decode_value(data, value_at, value_type, count, byte_order)
+
+def extract_embedded_jpeg(raw_path, full_size=True):
+    """Return a JPEG embedded in a CR2, or None if there is none.
+
+    full_size=True gives the camera's full-resolution preview from IFD0,
+    False the 160x120 thumbnail from IFD1.
+    """
+    with open(raw_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 8:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:2] not in (b"II", b"MM"):
+                return None
+            byte_order = "<" if data[:2] == b"II" else ">"
+
+            ifd0, ifd1_offset = read_ifd(data, 0, struct.unpack_from(byte_order + "I", data, 4)[0], byte_order)
+            if full_size:
+                offset = read_tag(data, ifd0, TAG_STRIP_OFFSETS, byte_order)
+                length = read_tag(data, ifd0, TAG_STRIP_BYTE_COUNTS, byte_order)
+            elif ifd1_offset:
+                ifd1, _ = read_ifd(data, 0, ifd1_offset, byte_order)
+                offset = read_tag(data, ifd1, TAG_JPEG_OFFSET, byte_order)
+                length = read_tag(data, ifd1, TAG_JPEG_LENGTH, byte_order)
+            else:
+                return None
+
+            if not isinstance(offset, int) or not isinstance(length, int) or not offset or not length:
+                return None
+            jpeg = data[offset:offset + length]
+    return jpeg if jpeg[:2] == b"\xff\xd8" else None
+
+def _render_thumbnail(source_path, thumbnail_path):
+    """Write a thumbnail for one capture (runs in a worker process). Returns its size in bytes."""
+    temp_file = f"{thumbnail_path}.tmp"
+    is_raw = source_path.lower().endswith(RAW_EXTENSIONS)
+
+    if Image is None:
+        if not is_raw:
+            raise RuntimeError("Pillow is needed to make thumbnails from JPG files")
+        data = extract_embedded_jpeg(source_path, full_size=False)
+        if data is None:
+            raise ValueError(f"No embedded thumbnail in {source_path}")
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+    else:
+        if is_raw:
+            data = extract_embedded_jpeg(source_path)
+            if data is None:
+                raise ValueError(f"No embedded preview in {source_path}")
+            image = Image.open(io.BytesIO(data))
+        else:
+            image = Image.open(source_path)
+
+        # Let the JPEG decoder scale down by up to 8x instead of decoding every pixel
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image = image.convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        image.save(temp_file, "JPEG", quality=THUMBNAIL_QUALITY)
+
+    os.replace(temp_file, thumbnail_path)
+    return os.path.getsize(thumbnail_path)
+
+def _load_index():
+    """Build the LRU index from the files on disk, least recently used first. Caller must hold _cache_lock."""
+    global _index, _total_bytes
+    if _index is not None:
+        return
+
+    entries = []
+    for folder, _, filenames in os.walk(THUMBNAIL_DIR):
+        for filename in filenames:
+            if filename.endswith(".jpg"):
+                path = os.path.join(folder, filename)
+                stat = os.stat(path)
+                entries.append((stat.st_atime, os.path.relpath(path, THUMBNAIL_DIR), stat.st_size))
+
+    _index = OrderedDict((relative_path, size) for _, relative_path, size in sorted(entries))
+    _total_bytes = sum(_index.values())
+
+def _record(relative_path, size):
+    """Add a new thumbnail to the index and evict the oldest ones over the size limit."""
+    global _total_bytes
+    with _cache_lock:
+        _load_index()
+        _total_bytes += size - _index.pop(relative_path, 0)
+        _index[relative_path] = size
+
+        while _total_bytes > THUMBNAIL_CACHE_MAX_MB * 1024 * 1024 and len(_index) > 1:
+            evicted, evicted_size = _index.popitem(last=False)
+            _total_bytes -= evicted_size
+            try:
+                os.remove(os.path.join(THUMBNAIL_DIR, evicted))
+            except FileNotFoundError:
+                pass
+
+def _touch(relative_path):
+    """Mark a thumbnail as just used, in the index and in its access time on disk."""
+    with _cache_lock:
+        _load_index()
+        if relative_path in _index:
+            _index.move_to_end(relative_path)
+    path = os.path.join(THUMBNAIL_DIR, relative_path)
+    try:
+        # Only the access time changes, so the file's ETag stays the same
+        os.utime(path, (time.time(), os.stat(path).st_mtime))
+    except FileNotFoundError:
+        pass
+
+def _folder(username, date):
+    if not SAFE_NAME.match(username) or not SAFE_NAME.match(date):
+        raise ValueError("invalid user or date")
+    return os.path.join(THUMBNAIL_DIR, username, date)
+
+def _read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _choose_sources(saved_paths):
+    """Pick one source per capture: the JPG of a RAW+JPG pair (the RAW without Pillow)."""
+    sources = {}
+    for path in saved_paths:
+        stem, extension = os.path.splitext(os.path.basename(path))
+        extension = extension.lower()
+        if extension in JPEG_EXTENSIONS:
+            if Image is not None or stem not in sources:
+                sources[stem] = path
+        elif extension in RAW_EXTENSIONS:
+            if Image is None or stem not in sources:
+                sources[stem] = path
+    return sources
+
+def _submit(source_path, folder, stem):
+    """Queue one thumbnail on the process pool and index it when it is done."""
+    thumbnail_path = os.path.join(folder, f"{stem}.jpg")
+    relative_path = os.path.relpath(thumbnail_path, THUMBNAIL_DIR)
+
+    def done(future):
+        try:
+            _record(relative_path, future.result())
+        except Exception as e:
+            print(f"⚠️ Thumbnail for {os.path.basename(source_path)} failed: {e}")
+
+    pool = worker_pool.get_pool("thumbnails", THUMBNAIL_WORKERS)
+    future = pool.submit(_render_thumbnail, source_path, thumbnail_path)
+    future.add_done_callback(done)
+    return future
+
+def submit_captures(saved_paths, username, date):
+    """Make thumbnails for freshly captured files in the background (returns immediately)."""
+    sources = _choose_sources(saved_paths)
+    if not sources:
+        return
+
+    folder = _folder(username, date)
+    os.makedirs(folder, exist_ok=True)
+    with _cache_lock:
+        # The manifest remembers every capture, so evicted thumbnails can be rebuilt
+        manifest = _read_manifest(folder)
+        manifest.update({stem: os.path.abspath(path) for stem, path in sources.items()})
+        temp_file = os.path.join(folder, f"{MANIFEST_FILE}.tmp")
+        with open(temp_file, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_file, os.path.join(folder, MANIFEST_FILE))
+
+    for stem, path in sources.items():
+        _submit(path, folder, stem)
+
+def get_gallery(username, date):
+    """List the captures of one user and date folder, newest first."""
+    folder = _folder(username, date)
+    with _cache_lock:
+        manifest = _read_manifest(folder)
+
+    return [{"name": stem,
+             "source": os.path.basename(source),
+             "cached": os.path.exists(os.path.join(folder, f"{stem}.jpg"))}
+            for stem, source in sorted(manifest.items(), reverse=True)]
+
+def get_thumbnail_path(username, date, name):
+    """Return the path of a thumbnail, rebuilding it if it was evicted. None if unknown."""
+    folder = _folder(username, date)
+    if not SAFE_NAME.match(name):
+        return None
+    thumbnail_path = os.path.join(folder, f"{name}.jpg")
+
+    if not os.path.exists(thumbnail_path):
+        with _cache_lock:
+            source = _read_manifest(folder).get(name)
+        if source is None or not os.path.exists(source):
+            return None
+        try:
+            _submit(source, folder, name).result(timeout=THUMBNAIL_TIMEOUT)
+        except Exception:
+            return None
+
+    _touch(os.path.relpath(thumbnail_path, THUMBNAIL_DIR))
+    return thumbnail_path
+
+def get_cache_stats():
+    """Return how many thumbnails are cached and how much space they use."""
+    with _cache_lock:
+        _load_index()
+        return {"thumbnails": len(_index),
+                "size_mb": round(_total_bytes / (1024 * 1024), 2),
+                "max_mb": THUMBNAIL_CACHE_MAX_MB}
@@ -0,0 +1,276 @@
+import queue
+import threading
+import time
+
+import event_bus
+
+MISSED_SLOT_GRACE = 5  # seconds a slot may fire late before it is skipped as missed
+IDLE_WAKE_INTERVAL = 60  # seconds the engine sleeps when there is nothing scheduled
+
+class Schedule:
+    """A named timelapse firing every interval seconds on a fixed monotonic grid.
+
+    Slot n is due at anchor + n * interval, so capture and upload time never
+    push later frames off the grid. start_at/stop_at are wall-clock times.
+    """
+
+    def __init__(self, name, interval, username=None, start_at=None, stop_at=None):
+        self.name = name
+        self.interval = interval
+        self.username = username
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.created_at = time.time()
+
+        delay = max(start_at - time.time(), 0) if start_at else 0
+        self.anchor = time.monotonic() + delay
+        self.next_slot = 0
+
+        self.active = True
+        self.busy = False
+        self.finished = False  # Set once stopped with no capture in flight
+        self.frames_taken = 0
+        self.failed_frames = 0
+        self.missed_slots = 0
+        self.last_fired_at = None
+        self.last_lag = None
+
+    def slot_time(self, slot):
+        """Monotonic time slot number `slot` is due."""
+        return self.anchor + slot * self.interval
+
+    def to_dict(self):
+        next_in = self.slot_time(self.next_slot) - time.monotonic() if self.active else None
+        return {
+            "name": self.name,
+            "username": self.username,
+            "interval": self.interval,
+            "start_at": self.start_at,
+            "stop_at": self.stop_at,
+            "active": self.active,
+            "capturing": self.busy,
+            "frames_taken": self.frames_taken,
+            "failed_frames": self.failed_frames,
+            "missed_slots": self.missed_slots,
+            "last_fired_at": self.last_fired_at,
+            "last_lag_seconds": round(self.last_lag, 3) if self.last_lag is not None else None,
+            "next_fire_in_seconds": round(max(next_in, 0), 1) if next_in is not None else None
+        }
+
+# Scheduler state (guarded by _scheduler_lock)
+_scheduler_lock = threading.Lock()
+_wake = threading.Condition(_scheduler_lock)
+_schedules = {}
+
+# Called with each schedule once it is stopped and its last capture is done
+_finish_listeners = []
+
+# Engine state
+_capture_func = None
+_jobs = queue.Queue()
+_engine_thread = None
+_worker_thread = None
+_stop_event = threading.Event()
+
+def _check_finished(schedule):
+    """Return True the first time a schedule is stopped and idle. Caller must hold _scheduler_lock."""
+    if schedule.active or schedule.busy or schedule.finished:
+        return False
+    schedule.finished = True
+    return True
+
+def _notify_finished(schedule):
+    for listener in list(_finish_listeners):
+        try:
+            listener(schedule)
+        except Exception as e:
+            print(f"⚠️ Timelapse finish listener error: {e}")
+
+def add_finish_listener(listener):
+    """Call listener(schedule) once a schedule has stopped and its last frame is captured."""
+    _finish_listeners.append(listener)
+
+def _fire_due_slot(schedule, now):
+    """Queue a capture for the latest due slot and skip any older ones. Caller must hold _scheduler_lock."""
+    latest = int((now - schedule.anchor) // schedule.interval)
+    latest_due = schedule.slot_time(latest)
+    missed = latest - schedule.next_slot
+    schedule.next_slot = latest + 1
+
+    if now - latest_due > MISSED_SLOT_GRACE:
+        # Too late for this slot as well - wait for the next one on the grid
+        missed += 1
+    elif schedule.busy:
+        # The previous frame is still being captured - don't pile up behind it
+        missed += 1
+    else:
+        schedule.busy = True
+        _jobs.put((schedule, latest_due))
+
+    if missed:
+        schedule.missed_slots += missed
+        print(f"⚠️ Timelapse '{schedule.name}' skipped {missed} missed slot(s)")
+
+def _engine():
+    """Background thread that fires schedules on their absolute deadlines."""
+    with _wake:
+        while not _stop_event.is_set():
+            now = time.monotonic()
+            next_wake = now + IDLE_WAKE_INTERVAL
+            finished = []
+
+            for schedule in list(_schedules.values()):
+                if not schedule.active:
+                    continue
+
+                if schedule.stop_at is not None and time.time() >= schedule.stop_at:
+                    schedule.active = False
+                    print(f"🕒 Timelapse '{schedule.name}' reached its stop time")
+                    event_bus.publish("timelapse", schedule.to_dict())
+                    if _check_finished(schedule):
+                        finished.append(schedule)
+                    continue
+
+                if schedule.slot_time(schedule.next_slot) <= now:
+                    _fire_due_slot(schedule, now)
+
+                next_wake = min(next_wake, schedule.slot_time(schedule.next_slot))
+                if schedule.stop_at is not None:
+                    next_wake = min(next_wake, now + schedule.stop_at - time.time())
+
+            if finished:
+                # Listeners may take a while, so run them without holding the lock
+                _wake.release()
+                try:
+                    for schedule in finished:
+                        _notify_finished(schedule)
+                finally:
+                    _wake.acquire()
+                continue
+
+            _wake.wait(timeout=max(next_wake - time.monotonic(), 0))
+
+def _capture_worker():
+    """Runs the captures queued by the engine, one at a time."""
+    while True:
+        job = _jobs.get()
+        if job is None:
+            return
+
+        schedule, due = job
+        lag = time.monotonic() - due
+        print(f"🕒 Taking scheduled timelapse photo for '{schedule.name}' ({lag * 1000:.0f} ms after its slot)...")
+        try:
+            success = _capture_func(schedule)
+        except Exception as e:
+            print(f"❌ Timelapse '{schedule.name}' capture error: {e}")
+            success = False
+
+        with _scheduler_lock:
+            schedule.busy = False
+            schedule.last_fired_at = time.time()
+            schedule.last_lag = lag
+            if success:
+                schedule.frames_taken += 1
+            else:
+                schedule.failed_frames += 1
+            tick = schedule.to_dict()
+            finished = _check_finished(schedule)
+        event_bus.publish("timelapse", tick)
+        if finished:
+            _notify_finished(schedule)
+
+def start_engine(capture_func):
+    """Start the scheduler threads. Calling this again is a no-op.
+
+    capture_func(schedule) takes one frame for the schedule and returns success.
+    """
+    global _capture_func, _engine_thread, _worker_thread
+    with _scheduler_lock:
+        if _engine_thread is not None:
+            return
+
+        _capture_func = capture_func
+        _stop_event.clear()
+        _engine_thread = threading.Thread(target=_engine, name="timelapse-engine")
+        _engine_thread.daemon = True
+        _engine_thread.start()
+        _worker_thread = threading.Thread(target=_capture_worker, name="timelapse-capture")
+        _worker_thread.daemon = True
+        _worker_thread.start()
+
+def stop_engine(timeout=1):
+    """Stop the scheduler threads. Schedules are kept but no longer fire."""
+    global _engine_thread, _worker_thread
+    _stop_event.set()
+    _jobs.put(None)
+    with _wake:
+        _wake.notify_all()
+
+    for thread in (_engine_thread, _worker_thread):
+        if thread is not None:
+            thread.join(timeout=timeout)
+    _engine_thread = None
+    _worker_thread = None
+
+def add_schedule(name, interval, username=None, start_at=None, stop_at=None):
+    """Create and start a named schedule. Raises ValueError for bad or duplicate schedules."""
+    if interval <= 0:
+        raise ValueError("interval must be positive")
+    if start_at is not None and stop_at is not None and stop_at <= start_at:
+        raise ValueError("stop time must be after start time")
+
+    with _wake:
+        existing = _schedules.get(name)
+        if existing is not None and existing.active:
+            raise ValueError(f"timelapse '{name}' already exists")
+
+        schedule = Schedule(name, interval, username, start_at, stop_at)
+        _schedules[name] = schedule
+        _wake.notify_all()
+
+    print(f"🕒 Timelapse '{name}' scheduled every {interval} seconds")
+    event_bus.publish("timelapse", schedule.to_dict())
+    return schedule
+
+def stop_schedule(name):
+    """Stop a schedule from firing. Returns False if there is no such schedule."""
+    with _wake:
+        schedule = _schedules.get(name)
+        if schedule is None:
+            return False
+        schedule.active = False
+        finished = _check_finished(schedule)
+        _wake.notify_all()
+
+    print(f"🕒 Timelapse '{name}' stopped")
+    event_bus.publish("timelapse", schedule.to_dict())
+    if finished:
+        _notify_finished(schedule)
+    return True
+
+def remove_schedule(name):
+    """Stop and forget a schedule. Returns False if there is no such schedule."""
+    with _wake:
+        schedule = _schedules.pop(name, None)
+        if schedule is None:
+            return False
+        schedule.active = False
+        finished = _check_finished(schedule)
+        _wake.notify_all()
+    event_bus.publish("timelapse", schedule.to_dict())
+    if finished:
+        _notify_finished(schedule)
+    return True
+
+def is_active(name):
+    """Check if the named schedule exists and is still firing."""
+    with _scheduler_lock:
+        schedule = _schedules.get(name)
+        return schedule is not None and schedule.active
+
+def list_schedules():
+    """Return every schedule as a dict, active ones first."""
+    with _scheduler_lock:
+        schedules = [schedule.to_dict() for schedule in _schedules.values()]
+    return sorted(schedules, key=lambda schedule: (not schedule["active"], schedule["name"]))
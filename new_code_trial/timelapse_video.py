@@ -0,0 +1,223 @@
+import io
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+import event_bus
+import thumbnails
+import worker_pool
+
+# Pillow is optional - without it frames cannot be scaled and no video is made
+from worker_pool import Image
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+VIDEO_DIR = "timelapse_videos"
+VIDEO_SIZE = (1920, 1080)  # Frames are scaled to fit and padded to exactly this size
+VIDEO_FPS = 24
+VIDEO_CRF = 23  # x264 quality: lower is better and larger
+VIDEO_PRESET = "veryfast"  # Keeps encoding ahead of the camera on a Raspberry Pi
+VIDEO_SEGMENT_FRAMES = 1000  # Long series are split into segments that upload as they fill up
+VIDEO_WORKERS = 1
+FRAME_QUALITY = 90
+FFMPEG_CLOSE_TIMEOUT = 60  # seconds to wait for ffmpeg to flush the last fragment
+DELETE_UPLOADED_VIDEOS = True
+
+# Assemblers of the series currently being recorded, by schedule name (guarded by _assemblers_lock)
+_assemblers_lock = threading.Lock()
+_assemblers = {}
+_finished_segments = 0
+
+def _prepare_frame(source_path, size):
+    """Scale one capture to the video size and return it as JPEG bytes (runs in a worker process)."""
+    if source_path.lower().endswith(thumbnails.RAW_EXTENSIONS):
+        data = thumbnails.extract_embedded_jpeg(source_path)
+        if data is None:
+            raise ValueError(f"No embedded preview in {os.path.basename(source_path)}")
+        image = Image.open(io.BytesIO(data))
+    else:
+        image = Image.open(source_path)
+
+    image.draft("RGB", size)
+    image = image.convert("RGB")
+    image.thumbnail(size)
+
+    # Pad to the exact size so every frame matches the video dimensions
+    frame = Image.new("RGB", size)
+    frame.paste(image, ((size[0] - image.width) // 2, (size[1] - image.height) // 2))
+    output = io.BytesIO()
+    frame.save(output, "JPEG", quality=FRAME_QUALITY)
+    return output.getvalue()
+
+class VideoAssembler:
+    """Streams the frames of one timelapse series into an ffmpeg process kept open between frames.
+
+    The MP4 is fragmented, so the file on disk is playable at all times and
+    finishing a segment only flushes the last fragment instead of re-encoding.
+    """
+
+    def __init__(self, name, dropbox_folder, upload_func):
+        self.name = name
+        self.dropbox_folder = dropbox_folder
+        self.upload_func = upload_func
+        self.started_at = time.strftime("%Y%m%d_%H%M%S")
+        self.segment = 0
+        self.segment_frames = 0
+        self.frames = 0
+        self.failed_frames = 0
+        self.output_path = None
+        self._process = None
+        self._frames = queue.Queue()  # Futures of scaled frames in capture order, None to finish
+        self._thread = threading.Thread(target=self._run, name=f"timelapse-video-{name}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, future):
+        self._frames.put(future)
+
+    def finish(self):
+        """Close the video once the frames already added are written. Returns immediately."""
+        self._frames.put(None)
+
+    def _start_segment(self):
+        self.segment += 1
+        self.segment_frames = 0
+        safe_name = re.sub(r"[^\w-]", "_", self.name)
+        os.makedirs(VIDEO_DIR, exist_ok=True)
+        self.output_path = os.path.join(VIDEO_DIR, f"timelapse_{safe_name}_{self.started_at}_part{self.segment}.mp4")
+        command = [FFMPEG_BINARY, "-y", "-loglevel", "error",
+                   "-f", "image2pipe", "-framerate", str(VIDEO_FPS), "-c:v", "mjpeg", "-i", "-",
+                   "-c:v", "libx264", "-preset", VIDEO_PRESET, "-crf", str(VIDEO_CRF), "-pix_fmt", "yuv420p",
+                   "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", self.output_path]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL)
+        print(f"🎬 Recording timelapse '{self.name}' to {self.output_path}")
+
+    def _close_segment(self):
+        """Flush the current segment and hand it to the uploader."""
+        global _finished_segments
+        process, self._process = self._process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            returncode = process.wait(timeout=FFMPEG_CLOSE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            returncode = None
+
+        if returncode != 0:
+            print(f"❌ ffmpeg failed on {self.output_path} (exit code {returncode})")
+            return
+        print(f"🎬 Timelapse video {os.path.basename(self.output_path)} finished ({self.segment_frames} frames)")
+        with _assemblers_lock:
+            _finished_segments += 1
+        event_bus.publish("timelapse_video", {"name": self.name, "file": os.path.basename(self.output_path),
+                                              "frames": self.segment_frames})
+        try:
+            self.upload_func(self.output_path, self.dropbox_folder)
+        except Exception as e:
+            print(f"⚠️ Could not queue {os.path.basename(self.output_path)} for upload: {e}")
+
+    def _run(self):
+        """Writer thread: appends scaled frames to ffmpeg in capture order."""
+        while True:
+            future = self._frames.get()
+            if future is None:
+                break
+            try:
+                frame = future.result()
+            except Exception as e:
+                self.failed_frames += 1
+                print(f"⚠️ Timelapse '{self.name}' frame skipped: {e}")
+                continue
+
+            if self._process is None:
+                self._start_segment()
+            try:
+                self._process.stdin.write(frame)
+            except (BrokenPipeError, OSError) as e:
+                print(f"❌ Lost the ffmpeg process for timelapse '{self.name}': {e}")
+                self._close_segment()
+                continue
+            self.frames += 1
+            self.segment_frames += 1
+            if self.segment_frames >= VIDEO_SEGMENT_FRAMES:
+                self._close_segment()
+
+        if self._process is not None:
+            self._close_segment()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "frames": self.frames,
+            "failed_frames": self.failed_frames,
+            "segment": self.segment,
+            "segment_frames": self.segment_frames,
+            "file": os.path.basename(self.output_path) if self.output_path else None,
+            "pending_frames": self._frames.qsize()
+        }
+
+def is_available():
+    """Check that Pillow and the ffmpeg binary are both there."""
+    return Image is not None and shutil.which(FFMPEG_BINARY) is not None
+
+def add_frame(name, saved_paths, dropbox_folder, upload_func):
+    """Append a timelapse frame to the video of schedule `name`, starting the video on its first frame.
+
+    Scaling runs in a worker process. upload_func(video_path, dropbox_folder)
+    is called for every finished segment. Returns False if no video can be made.
+    """
+    jpegs = [path for path in saved_paths if path.lower().endswith(thumbnails.JPEG_EXTENSIONS)]
+    raws = [path for path in saved_paths if path.lower().endswith(thumbnails.RAW_EXTENSIONS)]
+    sources = jpegs or raws
+    if not sources:
+        return False
+    if not is_available():
+        print(f"⚠️ Timelapse video needs Pillow and {FFMPEG_BINARY} - skipping")
+        return False
+
+    with _assemblers_lock:
+        assembler = _assemblers.get(name)
+        if assembler is None:
+            assembler = _assemblers[name] = VideoAssembler(name, dropbox_folder, upload_func)
+        # Submitted while holding the lock so frames reach the writer in capture order
+        pool = worker_pool.get_pool("timelapse_video", VIDEO_WORKERS)
+        assembler.add(pool.submit(_prepare_frame, sources[0], VIDEO_SIZE))
+    return True
+
+def finish(name):
+    """Finish the video of a series that has ended. Returns False if it had no video."""
+    with _assemblers_lock:
+        assembler = _assemblers.pop(name, None)
+    if assembler is None:
+        return False
+    assembler.finish()
+    return True
+
+def finish_all():
+    """Finish every video that is being recorded, e.g. on shutdown."""
+    with _assemblers_lock:
+        assemblers = list(_assemblers.values())
+        _assemblers.clear()
+    for assembler in assemblers:
+        assembler.finish()
+    for assembler in assemblers:
+        assembler._thread.join(timeout=FFMPEG_CLOSE_TIMEOUT)
+
+def on_upload_finished(item, status):
+    """Upload queue listener that deletes finished videos once they are safely in Dropbox."""
+    if DELETE_UPLOADED_VIDEOS:
+        worker_pool.delete_if_uploaded(item, status, VIDEO_DIR)
+
+def get_video_stats():
+    """Return the videos being recorded and how many segments have been finished."""
+    with _assemblers_lock:
+        recording = [assembler.to_dict() for assembler in _assemblers.values()]
+        finished = _finished_segments
+    return {"available": is_available(), "recording": recording, "finished_segments": finished}
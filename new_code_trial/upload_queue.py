@@ -0,0 +1,433 @@
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# fcntl is POSIX only - elsewhere every process shares UPLOAD_QUEUE_FILE
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Pending uploads are stored on disk so a restart picks up where we left off
+UPLOAD_QUEUE_FILE = "upload_queue.json"  # Other processes running at the same time use upload_queue.<pid>.json
+UPLOAD_WORKERS = 4  # Most uploads allowed to run at the same time
+INITIAL_CONCURRENCY = 2  # Uploads allowed at first; grows on success, halves when Dropbox rate-limits us
+UPLOAD_RETRY_DELAY = 30  # seconds before the first retry of a failed upload; doubles with every failure
+UPLOAD_RETRY_MAX_DELAY = 3600  # Longest wait between retries
+UPLOAD_MAX_FAILURES = 12  # Failed attempts (not counting rate limits) before an upload is given up
+LATENCY_HISTORY = 200  # Number of finished uploads kept for latency stats
+MAX_BATCH_SIZE = 1000  # Most files committed together in one batch
+RESULT_HISTORY = 1000  # Number of per-item results kept for callers to look up
+RATE_LIMIT_DEFAULT_BACKOFF = 10  # seconds to pause when a 429 comes without a retry-after
+
+# Returned by an upload function for an error no retry can fix (e.g. a malformed path)
+PERMANENT_FAILURE = "permanent_failure"
+
+# Priority lanes - lower goes first
+LANE_INTERACTIVE = 0  # Shots someone is waiting for at the bench
+LANE_BACKGROUND = 1  # Timelapse frames
+FAST_EXTENSIONS = (".jpg", ".jpeg")  # Go ahead of RAW files in the same lane
+PRIORITY_AGING = 300  # seconds of waiting that lift an item by one priority level, so nothing starves
+
+# Queue state (guarded by _queue_lock)
+_queue_lock = threading.Lock()
+_work_available = threading.Condition(_queue_lock)
+_pending = []
+_in_flight = {}
+_recent_uploads = deque(maxlen=LATENCY_HISTORY)
+_results = OrderedDict()
+_completed_count = 0
+_failed_attempts = 0
+_active_uploads = 0
+_concurrency_limit = float(INITIAL_CONCURRENCY)
+_paused_until = 0
+_rate_limited_count = 0
+
+# Queue file owned by this process and its held lock (guarded by _queue_lock)
+_queue_file = None
+_queue_file_lock = None
+
+# Worker state
+_workers = []
+_upload_func = None
+_batch_upload_func = None
+_stop_event = threading.Event()
+_listeners = []
+
+def _lock_queue_file(path):
+    """Lock a queue file without waiting. Returns the open lock file, or None if another process holds it."""
+    lock_file = open(f"{path}.lock", "a+")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _read_queue_file(path):
+    """Load the items of a queue file."""
+    if not os.path.exists(path):
+        return []
+
+    try:
+        with open(path, 'r') as f:
+            items = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read upload queue file {path}: {e}")
+        return []
+
+    # Drop entries whose local file has disappeared since the last run
+    return [item for item in items if os.path.exists(item["local_path"])]
+
+def _claim_queue_file():
+    """Take ownership of a queue file and resume the items of processes that have exited.
+
+    Only the process holding a queue file's lock reads or writes it, so a
+    second process (e.g. the web server next to the pedal loop) neither
+    uploads nor overwrites the first one's items. Caller must hold _queue_lock.
+    """
+    global _queue_file, _queue_file_lock
+    if _queue_file is not None:
+        return
+    base, ext = os.path.splitext(UPLOAD_QUEUE_FILE)
+    if fcntl is None:
+        _queue_file = UPLOAD_QUEUE_FILE
+        orphans = []
+    else:
+        _queue_file_lock = _lock_queue_file(UPLOAD_QUEUE_FILE)
+        if _queue_file_lock is not None:
+            _queue_file = UPLOAD_QUEUE_FILE
+        else:
+            _queue_file = f"{base}.{os.getpid()}{ext}"
+            _queue_file_lock = _lock_queue_file(_queue_file)
+        # Files of other processes are free once those processes have exited
+        orphans = []
+        for path in glob.glob(f"{base}.*{ext}"):
+            if path != _queue_file:
+                lock_file = _lock_queue_file(path)
+                if lock_file is not None:
+                    orphans.append((path, lock_file))
+
+    leftover = _read_queue_file(_queue_file)
+    for path, _ in orphans:
+        leftover.extend(_read_queue_file(path))
+    for item in leftover:
+        item["next_attempt_at"] = 0
+    _pending[:0] = leftover
+    _save_queue()
+
+    # Only remove the other files once their items are safely in ours
+    for path, lock_file in orphans:
+        for stale in (path, f"{path}.lock"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        lock_file.close()
+
+    if leftover:
+        print(f"📥 Resuming {len(leftover)} upload(s) from previous session")
+
+def _save_queue():
+    """Write pending and in-flight items to this process's queue file. Caller must hold _queue_lock."""
+    _claim_queue_file()
+    items = list(_in_flight.values()) + _pending
+    temp_file = f"{_queue_file}.tmp"
+    with open(temp_file, 'w') as f:
+        json.dump(items, f, indent=4)
+    os.replace(temp_file, _queue_file)
+
+def _priority(local_path, lane):
+    """Priority of a file: its lane first, then JPGs ahead of RAW files."""
+    is_fast = os.path.splitext(local_path)[1].lower() in FAST_EXTENSIONS
+    return lane * 2 + (0 if is_fast else 1)
+
+def _new_item(local_path, dropbox_folder, batch_id=None, not_before=0, lane=LANE_INTERACTIVE):
+    """Build a queue item for one local file."""
+    return {
+        "id": uuid.uuid4().hex,
+        "local_path": local_path,
+        "dropbox_folder": dropbox_folder,
+        "batch_id": batch_id,
+        "priority": _priority(local_path, lane),
+        "enqueued_at": time.time(),
+        "attempts": 0,
+        "next_attempt_at": not_before
+    }
+
+def enqueue_upload(local_path, dropbox_folder, lane=LANE_INTERACTIVE):
+    """Add a file to the upload queue and return its queue item id."""
+    return enqueue_batch([(local_path, dropbox_folder)], lane=lane)[0]
+
+def enqueue_batch(files, batch_id=None, not_before=0, lane=LANE_INTERACTIVE):
+    """Queue (local_path, dropbox_folder) pairs to be committed together.
+
+    Items sharing a batch_id are uploaded as one batch once not_before has
+    passed, so a timelapse window can keep adding frames to an open batch.
+    A batch is picked at the priority of its best file and its JPGs are
+    uploaded ahead of its RAW files. Returns the queue item ids in the same order as files.
+    """
+    if batch_id is None and len(files) > 1:
+        batch_id = uuid.uuid4().hex
+    items = [_new_item(local_path, dropbox_folder, batch_id, not_before, lane)
+             for local_path, dropbox_folder in files]
+
+    with _work_available:
+        _pending.extend(items)
+        for item in items:
+            _results[item["id"]] = "pending"
+        _trim_results()
+        _save_queue()
+        _work_available.notify()
+        waiting = len(_pending)
+
+    for item in items:
+        print(f"📥 Queued {os.path.basename(item['local_path'])} for upload ({waiting} waiting)")
+    return [item["id"] for item in items]
+
+def _trim_results():
+    """Forget the oldest results. Caller must hold _queue_lock."""
+    while len(_results) > RESULT_HISTORY:
+        _results.popitem(last=False)
+
+def _effective_priority(item, now):
+    """Priority after aging - an item waiting long enough overtakes newer, higher-priority ones."""
+    return item.get("priority", 0) - (now - item["enqueued_at"]) / PRIORITY_AGING
+
+def _next_items():
+    """Block until work is due and an upload slot is free, then mark it in flight.
+
+    Returns the highest priority due item, or every due item of its batch
+    in priority order (JPGs before RAW files).
+    """
+    global _active_uploads
+    with _work_available:
+        while not _stop_event.is_set():
+            now = time.time()
+            due = [item for item in _pending if item["next_attempt_at"] <= now]
+            if due and now >= _paused_until and _active_uploads < int(_concurrency_limit):
+                item = min(due, key=lambda item: _effective_priority(item, now))
+                items = [item]
+                if item.get("batch_id"):
+                    items = [other for other in due if other.get("batch_id") == item["batch_id"]]
+                    items.sort(key=lambda other: _effective_priority(other, now))
+                    items = items[:MAX_BATCH_SIZE]
+                for picked in items:
+                    _pending.remove(picked)
+                    _in_flight[picked["id"]] = picked
+                _active_uploads += 1
+                return items
+
+            # Nothing we may start yet - wait for new work, a free slot or the next retry
+            if due and now < _paused_until:
+                _work_available.wait(timeout=_paused_until - now)
+            elif _pending and not due:
+                next_due = min(item["next_attempt_at"] for item in _pending)
+                _work_available.wait(timeout=max(next_due - now, 0.1))
+            else:
+                _work_available.wait(timeout=1)
+    return []
+
+def report_rate_limit(backoff=None):
+    """Tell the queue Dropbox answered 429: halve concurrency and pause for the retry-after time."""
+    global _concurrency_limit, _paused_until, _rate_limited_count
+    backoff = backoff if backoff is not None else RATE_LIMIT_DEFAULT_BACKOFF
+    with _work_available:
+        _rate_limited_count += 1
+        _concurrency_limit = max(1.0, _concurrency_limit / 2)
+        _paused_until = max(_paused_until, time.time() + backoff)
+    print(f"🐢 Dropbox rate limit hit - pausing uploads for {backoff} seconds, "
+          f"concurrency now {int(_concurrency_limit)}")
+
+def _upload_done(succeeded):
+    """Free the upload slot and grow concurrency by one per round of successful uploads."""
+    global _active_uploads, _concurrency_limit
+    with _work_available:
+        _active_uploads -= 1
+        if succeeded and time.time() >= _paused_until:
+            _concurrency_limit = min(float(UPLOAD_WORKERS), _concurrency_limit + 1 / _concurrency_limit)
+        _work_available.notify_all()
+
+def _finish_item(item, result, started_at):
+    """Record the outcome of an upload attempt: True, False or PERMANENT_FAILURE."""
+    global _completed_count, _failed_attempts
+
+    finished_at = time.time()
+    success = result is True
+    with _work_available:
+        _in_flight.pop(item["id"], None)
+        item["attempts"] += 1
+        status = "uploaded" if success else "retrying"
+        rate_limited = _paused_until > finished_at
+        if not success and not rate_limited:
+            item["failures"] = item.get("failures", 0) + 1
+
+        if success:
+            _completed_count += 1
+            _recent_uploads.append({
+                "file": os.path.basename(item["local_path"]),
+                "attempts": item["attempts"],
+                "queued_seconds": round(started_at - item["enqueued_at"], 3),
+                "upload_seconds": round(finished_at - started_at, 3),
+                "total_seconds": round(finished_at - item["enqueued_at"], 3),
+                "finished_at": finished_at
+            })
+        elif result == PERMANENT_FAILURE:
+            _failed_attempts += 1
+            status = "failed"
+            print(f"⚠️ Giving up on {os.path.basename(item['local_path'])} - Dropbox will never accept it")
+        elif item.get("failures", 0) >= UPLOAD_MAX_FAILURES:
+            _failed_attempts += 1
+            status = "failed"
+            print(f"⚠️ Giving up on {os.path.basename(item['local_path'])} after {item['failures']} failed attempts")
+        elif os.path.exists(item["local_path"]):
+            # Keep the item and try again later (as soon as a rate-limit pause ends), backing off exponentially
+            _failed_attempts += 1
+            if rate_limited:
+                item["next_attempt_at"] = _paused_until
+            else:
+                delay = UPLOAD_RETRY_DELAY * 2 ** (item["failures"] - 1)
+                item["next_attempt_at"] = finished_at + min(delay, UPLOAD_RETRY_MAX_DELAY)
+            _pending.append(item)
+            print(f"🔁 Upload of {os.path.basename(item['local_path'])} failed, "
+                  f"retrying in {item['next_attempt_at'] - finished_at:.0f} seconds")
+        else:
+            _failed_attempts += 1
+            status = "failed"
+            print(f"⚠️ Dropping upload of {item['local_path']} - file no longer exists")
+
+        if item["id"] in _results:
+            _results[item["id"]] = status
+        _save_queue()
+        _work_available.notify_all()
+
+    for listener in list(_listeners):
+        try:
+            listener(item, status)
+        except Exception as e:
+            print(f"⚠️ Upload listener error: {e}")
+
+def add_listener(listener):
+    """Call listener(item, status) after every upload attempt.
+
+    status is "uploaded", "retrying" or "failed".
+    """
+    _listeners.append(listener)
+
+def _upload_worker():
+    """Worker thread that uploads queued files or batches one at a time."""
+    while not _stop_event.is_set():
+        items = _next_items()
+        if not items:
+            continue
+
+        started_at = time.time()
+        try:
+            if len(items) > 1 and _batch_upload_func:
+                results = _batch_upload_func([(item["local_path"], item["dropbox_folder"]) for item in items])
+            else:
+                results = [_upload_func(item["local_path"], item["dropbox_folder"]) for item in items]
+        except Exception as e:
+            print(f"❌ Upload worker error: {e}")
+            results = [False] * len(items)
+
+        for item, result in zip(items, results):
+            _finish_item(item, result, started_at)
+        _upload_done(any(result is True for result in results))
+
+def start_workers(upload_func, batch_upload_func=None):
+    """Start the upload worker threads. Calling this again is a no-op.
+
+    upload_func(local_path, dropbox_folder) uploads one file and returns
+    True, False to retry later, or PERMANENT_FAILURE to give up right away.
+    batch_upload_func, if given, takes a list of such pairs and returns one
+    such result per file.
+    """
+    global _upload_func, _batch_upload_func
+
+    with _work_available:
+        if _workers:
+            return
+
+        _upload_func = upload_func
+        _batch_upload_func = batch_upload_func
+        _stop_event.clear()
+
+        # Resume anything left over from the previous run
+        _claim_queue_file()
+
+        for i in range(UPLOAD_WORKERS):
+            worker = threading.Thread(target=_upload_worker, name=f"upload-worker-{i}")
+            worker.daemon = True
+            worker.start()
+            _workers.append(worker)
+
+def stop_workers(timeout=5):
+    """Stop the worker threads. Unfinished items stay on disk for next time."""
+    _stop_event.set()
+    with _work_available:
+        _work_available.notify_all()
+        workers = list(_workers)
+        _workers.clear()
+
+    for worker in workers:
+        worker.join(timeout=timeout)
+
+def get_item_status(item_id):
+    """Return "pending", "retrying", "uploaded", "failed" or None if unknown."""
+    with _queue_lock:
+        return _results.get(item_id)
+
+def wait_for_items(item_ids, timeout=None):
+    """Wait until the given items are uploaded or failed, and return their status."""
+    deadline = time.time() + timeout if timeout is not None else None
+    with _work_available:
+        while True:
+            statuses = {item_id: _results.get(item_id) for item_id in item_ids}
+            if all(status in ("uploaded", "failed", None) for status in statuses.values()):
+                return statuses
+            remaining = deadline - time.time() if deadline is not None else 1
+            if remaining <= 0:
+                return statuses
+            _work_available.wait(timeout=min(remaining, 1))
+
+def get_waiting_count():
+    """Return how many files are waiting or uploading."""
+    with _queue_lock:
+        return len(_pending) + len(_in_flight)
+
+def get_queue_stats():
+    """Return queue depth and recent upload latency figures."""
+    with _queue_lock:
+        now = time.time()
+        waiting = list(_pending) + list(_in_flight.values())
+        recent = list(_recent_uploads)
+        stats = {
+            "depth": len(_pending),
+            "in_flight": len(_in_flight),
+            "completed": _completed_count,
+            "failed_attempts": _failed_attempts,
+            "workers": len(_workers),
+            "concurrency_limit": int(_concurrency_limit),
+            "active_uploads": _active_uploads,
+            "rate_limited": _rate_limited_count,
+            "paused_seconds": round(max(_paused_until - now, 0), 1),
+            "depth_by_priority": {priority: sum(1 for item in _pending if item.get("priority", 0) == priority)
+                                  for priority in sorted({item.get("priority", 0) for item in _pending})},
+            "oldest_waiting_seconds": round(now - min(item["enqueued_at"] for item in waiting), 3) if waiting else 0
+        }
+
+    if recent:
+        totals = sorted(upload["total_seconds"] for upload in recent)
+        stats["latency_seconds"] = {
+            "average": round(sum(totals) / len(totals), 3),
+            "p50": totals[len(totals) // 2],
+            "p95": totals[min(len(totals) - 1, int(len(totals) * 0.95))],
+            "max": totals[-1]
+        }
+    stats["recent_uploads"] = recent[-20:]
+    return stats
@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+
+# User profile storage
+USERS_DIR = "lab_users"
+ACTIVE_USER_FILE = "active_user.txt"
+DEFAULT_USER = "shared"
+REGISTRY_POLL_INTERVAL = 2  # seconds between checks for profiles edited on disk
+
+# In-memory copy of the profiles (guarded by _registry_lock)
+_registry_lock = threading.RLock()
+_users = {}
+_user_mtimes = {}
+_active_user = DEFAULT_USER
+_active_mtime = None
+_loaded = False
+
+# Watcher state
+_watcher_thread = None
+_stop_event = threading.Event()
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _atomic_write(path, text):
+    """Write a file by renaming a finished temp file over it, so readers never see half a file."""
+    temp_file = f"{path}.tmp"
+    with open(temp_file, 'w') as f:
+        f.write(text)
+    os.replace(temp_file, path)
+
+def _read_user(username):
+    """Load one profile from disk. Caller must hold _registry_lock."""
+    user_file = os.path.join(USERS_DIR, f"{username}.json")
+    try:
+        with open(user_file, 'r') as f:
+            _users[username] = json.load(f)
+        _user_mtimes[username] = _mtime(user_file)
+    except (OSError, ValueError) as e:
+        # Keep the last good copy if the file is mid-edit or broken
+        print(f"⚠️ Could not read user profile {user_file}: {e}")
+
+def _read_active_user():
+    """Load the active username from disk. Caller must hold _registry_lock."""
+    global _active_user, _active_mtime
+    _active_mtime = _mtime(ACTIVE_USER_FILE)
+    if _active_mtime is None:
+        _active_user = DEFAULT_USER
+        return
+    with open(ACTIVE_USER_FILE, 'r') as f:
+        _active_user = f.read().strip() or DEFAULT_USER
+
+def refresh():
+    """Reload any profile whose file was added, changed or removed since the last check."""
+    with _registry_lock:
+        on_disk = set()
+        if os.path.isdir(USERS_DIR):
+            for filename in os.listdir(USERS_DIR):
+                if filename.endswith('.json'):
+                    username = filename[:-5]  # Remove .json extension
+                    on_disk.add(username)
+                    if _user_mtimes.get(username) != _mtime(os.path.join(USERS_DIR, filename)):
+                        _read_user(username)
+
+        for username in set(_users) - on_disk:
+            _users.pop(username, None)
+            _user_mtimes.pop(username, None)
+
+        if _mtime(ACTIVE_USER_FILE) != _active_mtime:
+            _read_active_user()
+
+def _watch():
+    """Background thread that keeps the in-memory profiles in sync with the files."""
+    while not _stop_event.wait(REGISTRY_POLL_INTERVAL):
+        try:
+            refresh()
+        except Exception as e:
+            print(f"⚠️ User registry refresh failed: {e}")
+
+def _ensure_loaded():
+    """Load everything once and start the watcher thread."""
+    global _loaded, _watcher_thread
+    if _loaded:
+        return
+
+    with _registry_lock:
+        if _loaded:
+            return
+        refresh()
+        _loaded = True
+        _stop_event.clear()
+        _watcher_thread = threading.Thread(target=_watch, name="user-registry")
+        _watcher_thread.daemon = True
+        _watcher_thread.start()
+
+def get_all_users():
+    """Return a {username: profile} copy of every known user."""
+    _ensure_loaded()
+    with _registry_lock:
+        return {username: dict(profile) for username, profile in _users.items()}
+
+def get_active_user():
+    """Get the currently active username."""
+    _ensure_loaded()
+    return _active_user
+
+def set_active_user(username):
+    """Set the active user, in memory and on disk."""
+    global _active_user, _active_mtime
+    _ensure_loaded()
+    with _registry_lock:
+        _atomic_write(ACTIVE_USER_FILE, username)
+        _active_user = username
+        _active_mtime = _mtime(ACTIVE_USER_FILE)
+
+def get_user_config(username=None):
+    """Get the profile for a user (default: the active user) from memory."""
+    _ensure_loaded()
+    with _registry_lock:
+        if username is None:
+            username = _active_user
+        profile = _users.get(username)
+        if profile is None:
+            print(f"⚠️ User '{username}' not found, using default user")
+            profile = _users.get(DEFAULT_USER, {})
+        return dict(profile)
+
+def save_user(username, user_data):
+    """Write a user profile to disk and update the in-memory copy."""
+    _ensure_loaded()
+    user_file = os.path.join(USERS_DIR, f"{username}.json")
+    with _registry_lock:
+        _atomic_write(user_file, json.dumps(user_data, indent=4))
+        _users[username] = dict(user_data)
+        _user_mtimes[username] = _mtime(user_file)
+
+def user_exists(username):
+    """Check if a profile exists for the username."""
+    _ensure_loaded()
+    with _registry_lock:
+        return username in _users
@@ -1,20 +1,32 @@
 # web_interface.py
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, send_file
 import json
 import os
 import time
 from datetime import datetime
-from camera_pedal import take_photo, check_camera_connection, toggle_timelapse_mode, timelapse_active
+import camera_service
+import capture_index
+import live_view
+import user_registry
 
 # Configuration
-USERS_DIR = "lab_users"
-ACTIVE_USER_FILE = "active_user.txt"
-DEFAULT_USER = "shared"
+USERS_DIR = user_registry.USERS_DIR
+ACTIVE_USER_FILE = user_registry.ACTIVE_USER_FILE
+DEFAULT_USER = user_registry.DEFAULT_USER
 APP_PORT = 8080  # Web server port
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Camera, timelapse and upload state: in this process for the development
+# server, or in the camera process when served through wsgi.py
+camera = camera_service.LocalCamera()
+
+def use_camera_service(address=camera_service.SERVICE_ADDRESS):
+    """Talk to a separate camera process (see camera_service.py) instead of running the camera here"""
+    global camera
+    camera = camera_service.RemoteCamera(address)
+
 # Ensure user directories exist
 def setup_user_system():
     """Set up the user system directories and files if they don't exist"""
@@ -37,49 +49,28 @@ def setup_user_system():
         with open(ACTIVE_USER_FILE, 'w') as f:
             f.write(DEFAULT_USER)
 
-# User management functions
+# User management functions (profiles are cached in memory by user_registry)
 def get_all_users():
     """Get a list of all configured users"""
-    users = []
-    for filename in os.listdir(USERS_DIR):
-        if filename.endswith('.json'):
-            username = filename[:-5]  # Remove .json extension
-            with open(os.path.join(USERS_DIR, filename), 'r') as f:
-                user_data = json.load(f)
-                users.append({
-                    "username": username,
-                    "display_name": user_data.get("name", username)
-                })
+    users = [
+        {"username": username, "display_name": user_data.get("name", username)}
+        for username, user_data in user_registry.get_all_users().items()
+    ]
     return sorted(users, key=lambda x: x["display_name"])
 
 def get_active_user():
     """Get the currently active user"""
-    if not os.path.exists(ACTIVE_USER_FILE):
-        return DEFAULT_USER
-    
-    with open(ACTIVE_USER_FILE, 'r') as f:
-        return f.read().strip()
+    return user_registry.get_active_user()
 
 def set_active_user(username):
     """Set the active user"""
-    with open(ACTIVE_USER_FILE, 'w') as f:
-        f.write(username)
+    user_registry.set_active_user(username)
     print(f"✅ Active user set to: {username}")
     return True
 
 def get_user_config(username=None):
     """Get the configuration for the specified user or active user"""
-    if username is None:
-        username = get_active_user()
-    
-    user_file = os.path.join(USERS_DIR, f"{username}.json")
-    if not os.path.exists(user_file):
-        print(f"⚠️ User '{username}' not found, using default user")
-        username = DEFAULT_USER
-        user_file = os.path.join(USERS_DIR, f"{username}.json")
-    
-    with open(user_file, 'r') as f:
-        return json.load(f)
+    return user_registry.get_user_config(username)
 
 def create_or_update_user(username, display_name, dropbox_folder=None):
     """Create a new user or update an existing one"""
@@ -90,19 +81,17 @@ def create_or_update_user(username, display_name, dropbox_folder=None):
     if dropbox_folder is None:
         dropbox_folder = f"/Camera_Pedal_Photos/{username}"
     
-    # Create user data
-    user_data = {
+    # Create user data, keeping settings the form does not edit (quota, post-processing)
+    user_data = user_registry.get_all_users().get(username, {})
+    user_data.update({
         "name": display_name,
         "dropbox_folder": dropbox_folder,
         "local_folder": f"pedal_triggered_photos/{username}"
-    }
+    })
     
     # Save user file
-    user_file = os.path.join(USERS_DIR, f"{username}.json")
-    file_existed = os.path.exists(user_file)
-    
-    with open(user_file, 'w') as f:
-        json.dump(user_data, f, indent=4)
+    file_existed = user_registry.user_exists(username)
+    user_registry.save_user(username, user_data)
     
     # Make sure the local folder exists
     os.makedirs(user_data["local_folder"], exist_ok=True)
@@ -111,15 +100,12 @@ def create_or_update_user(username, display_name, dropbox_folder=None):
 
 # Camera control functions
 def take_photo_for_user():
-    """Take a photo using the current user's configuration"""
-    user_config = get_user_config()
-    # Set the photo directory for the current user
-    os.environ['PHOTO_DIR'] = user_config['local_folder']
-    return take_photo()
+    """Queue a photo for the current user and return the capture job"""
+    return camera.call('submit_capture', get_active_user())
 
 def check_camera_status():
-    """Check if the camera is connected and working"""
-    return check_camera_connection()
+    """Return the cached camera connection status from the background monitor"""
+    return camera.call('camera_status')['connected']
 
 # Flask routes
 @app.route('/')
@@ -127,15 +113,16 @@ def index():
     """Main page - user selection and camera control"""
     users = get_all_users()
     active_user = get_active_user()
-    camera_status = check_camera_status()
+    camera_connected = check_camera_status()
     active_user_data = get_user_config(active_user)
     
     return render_template('index.html', 
                          users=users, 
                          active_user=active_user,
                          active_user_data=active_user_data,
-                         camera_status=camera_status,
-                         timelapse_active=timelapse_active)
+                         camera_status=camera_connected,
+                         timelapse_active=camera.call('timelapse_active'),
+                         today=datetime.now().strftime("%Y-%m-%d"))
 
 @app.route('/set_user', methods=['POST'])
 def set_user():
@@ -167,31 +154,189 @@ def add_user():
 
 @app.route('/take_photo', methods=['POST'])
 def trigger_photo():
-    """Trigger a photo capture for the current user"""
+    """Queue a photo capture for the current user and return its job ID right away"""
     try:
-        success = take_photo_for_user()
-        return jsonify({'success': success, 'message': 'Photo captured successfully' if success else 'Failed to capture photo'})
+        job = take_photo_for_user()
+        return jsonify({'success': True,
+                        'job_id': job['id'],
+                        'state': job['state'],
+                        'position': job.get('position'),
+                        'status_url': url_for('job_status', job_id=job['id']),
+                        'message': 'Photo queued'}), 202
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Error capturing photo: {str(e)}'})
+        return jsonify({'success': False, 'message': f'Error queueing photo: {str(e)}'})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and result of a capture job"""
+    job = camera.call('get_job', job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Queued, running and recently finished capture jobs"""
+    return jsonify(camera.call('list_jobs'))
 
 @app.route('/check_camera', methods=['GET'])
 def check_camera():
-    """Check camera connection status"""
+    """Check camera connection status (served from the monitor's cache)"""
     try:
-        connected = check_camera_status()
-        return jsonify({'connected': connected})
+        # refresh asks for a fresh probe; the result shows up on the next check
+        status = camera.call('camera_status', refresh=bool(request.args.get('refresh')))
+        return jsonify({'connected': bool(status['connected']),
+                        'checked_at': status['checked_at'],
+                        'age_seconds': status['age_seconds'],
+                        'busy_with': status['busy_with']})
     except Exception as e:
         return jsonify({'connected': False, 'error': str(e)})
 
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of camera, capture, upload and timelapse updates"""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return Response(camera.stream('events', last_event_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/live_view')
+def live_view_stream():
+    """MJPEG live-view stream (pauses while a photo is being taken)"""
+    return Response(camera.stream('live_view'),
+                    mimetype=f'multipart/x-mixed-replace; boundary={live_view.MJPEG_BOUNDARY}',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/live_view/frame.jpg')
+def live_view_frame():
+    """Latest cached live-view frame as a single JPEG"""
+    jpeg = camera.call('live_view_frame', wait=3)
+    if jpeg is None:
+        return "No live-view frame available", 503
+    return Response(jpeg, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/live_view', methods=['GET'])
+def api_live_view():
+    """API endpoint showing whether live view is running and how many are watching"""
+    return jsonify(camera.call('live_view_stats'))
+
+@app.route('/api/camera_arbiter', methods=['GET'])
+def api_camera_arbiter():
+    """API endpoint showing who owns the camera, who is waiting and how often each kind got it"""
+    return jsonify(camera.call('camera_arbiter'))
+
+@app.route('/gallery/<username>/<date>')
+def gallery(username, date):
+    """List the thumbnails of one user's date folder (ETag lets browsers reuse the last answer)"""
+    try:
+        captures = camera.call('gallery', username, date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    for capture in captures:
+        capture['url'] = url_for('gallery_thumbnail', username=username, date=date, name=capture['name'])
+    response = jsonify({'username': username, 'date': date, 'captures': captures})
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/gallery/<username>/<date>/<name>.jpg')
+def gallery_thumbnail(username, date, name):
+    """Serve one cached thumbnail (answers If-None-Match with 304 Not Modified)"""
+    try:
+        thumbnail_path = camera.call('thumbnail_path', username, date, name)
+    except ValueError as e:
+        return str(e), 400
+    if thumbnail_path is None:
+        return "Thumbnail not found", 404
+    return send_file(thumbnail_path, mimetype='image/jpeg', conditional=True, max_age=0)
+
 @app.route('/toggle_timelapse', methods=['POST'])
 def toggle_timelapse():
     """Toggle timelapse mode on/off"""
     try:
-        toggle_timelapse_mode()
+        timelapse_active = camera.call('toggle_timelapse')
         return jsonify({'success': True, 'timelapse_active': timelapse_active})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error toggling timelapse: {str(e)}'})
 
+def parse_time(value):
+    """Parse a time given as epoch seconds or an ISO date/time"""
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+@app.route('/api/timelapse/schedules', methods=['GET'])
+def api_list_schedules():
+    """API endpoint listing every timelapse schedule with its frame counts"""
+    return jsonify(camera.call('list_schedules'))
+
+@app.route('/api/timelapse/schedules', methods=['POST'])
+def api_add_schedule():
+    """Create a named timelapse schedule (JSON or form fields)"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        name = data.get('name') or f"timelapse-{int(time.time())}"
+        username = data.get('username') or None
+        if username and not user_registry.user_exists(username):
+            raise ValueError(f"unknown user '{username}'")
+        interval = float(data.get('interval', 0))
+        start_at = parse_time(data.get('start_at'))
+        stop_at = parse_time(data.get('stop_at'))
+        schedule = camera.call('add_schedule', name, interval, username, start_at, stop_at)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'schedule': schedule})
+
+@app.route('/api/timelapse/schedules/<name>', methods=['DELETE'])
+def api_remove_schedule(name):
+    """Stop and remove a timelapse schedule"""
+    if not camera.call('remove_schedule', name):
+        return jsonify({'success': False, 'message': f"No timelapse named '{name}'"}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/captures', methods=['GET'])
+def api_captures():
+    """API endpoint listing indexed captures, filtered by user, time range, mode and upload state"""
+    try:
+        captures = capture_index.query_captures(username=request.args.get('user'),
+                                                start=parse_time(request.args.get('from')),
+                                                end=parse_time(request.args.get('to')),
+                                                mode=request.args.get('mode'),
+                                                upload_state=request.args.get('state'),
+                                                limit=request.args.get('limit', 500),
+                                                offset=request.args.get('offset', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'count': len(captures), 'captures': captures})
+
+@app.route('/api/captures/summary', methods=['GET'])
+def api_captures_summary():
+    """API endpoint with capture counts and sizes per day and upload state"""
+    try:
+        summary = capture_index.summarize_captures(username=request.args.get('user'),
+                                                   start=parse_time(request.args.get('from')),
+                                                   end=parse_time(request.args.get('to')),
+                                                   mode=request.args.get('mode'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(summary)
+
+@app.route('/api/captures/<int:capture_id>', methods=['GET'])
+def api_capture(capture_id):
+    """API endpoint for a single indexed capture"""
+    capture = capture_index.get_capture(capture_id)
+    if capture is None:
+        return jsonify({'error': 'Capture not found'}), 404
+    return jsonify(capture)
+
+@app.route('/api/storage', methods=['GET'])
+def api_storage():
+    """API endpoint with free disk space, per-user local usage and eviction counters"""
+    return jsonify(camera.call('storage'))
+
 @app.route('/api/current_user', methods=['GET'])
 def api_current_user():
     """API endpoint to get current user - for the camera script to query"""
@@ -205,6 +350,36 @@ def api_current_user():
         "local_folder": user_config.get("local_folder")
     })
 
+@app.route('/api/upload_queue', methods=['GET'])
+def api_upload_queue():
+    """API endpoint showing the Dropbox upload backlog and recent upload latency"""
+    return jsonify(camera.call('upload_queue'))
+
+@app.route('/api/postprocess', methods=['GET'])
+def api_postprocess():
+    """API endpoint with post-processing counts, failures and time per capture"""
+    return jsonify(camera.call('postprocess'))
+
+@app.route('/api/timelapse/videos', methods=['GET'])
+def api_timelapse_videos():
+    """API endpoint with the timelapse videos being assembled and finished segments"""
+    return jsonify(camera.call('timelapse_videos'))
+
+@app.route('/api/latency', methods=['GET'])
+def api_latency():
+    """API endpoint with press-to-capture/upload latency percentiles per stage"""
+    return jsonify(camera.call('latency'))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus endpoint with the latency histograms and upload backlog"""
+    queue_stats = camera.call('upload_queue')
+    text = camera.call('prometheus')
+    text += "# HELP camera_upload_queue_depth Files waiting to be uploaded to Dropbox\n"
+    text += "# TYPE camera_upload_queue_depth gauge\n"
+    text += f"camera_upload_queue_depth {queue_stats['depth'] + queue_stats['in_flight']}\n"
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 # Start the web server
 def run_webserver():
     """Run the Flask web server"""
@@ -217,9 +392,14 @@ def run_webserver():
         ip_address = "0.0.0.0"
     
     print(f"✨ Web interface starting at http://{ip_address}:{APP_PORT}")
+    print("   (development server - see wsgi.py for production serving)")
     print(f"Access from other devices at http://{ip_address}:{APP_PORT}")
     app.run(host='0.0.0.0', port=APP_PORT)
 
 if __name__ == "__main__":
     setup_user_system()
-    run_webserver()
\ No newline at end of file
+    camera_service.start_camera_process()
+    try:
+        run_webserver()
+    finally:
+        camera_service.stop_camera_process()
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""Worker processes for image work (thumbnails, post-processing, timelapse frames).
+
+Workers are started from a forkserver rather than forked from the camera
+process, which runs a dozen threads and may hold an open libgphoto2 session.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Pillow is optional - callers check for None and fall back or skip the step
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+POOL_START_METHOD = "forkserver"
+
+# Pools by name, created on first use (guarded by _pools_lock)
+_pools_lock = threading.Lock()
+_pools = {}
+
+def get_pool(name, max_workers):
+    """Return the process pool called name, starting it on first use."""
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            context = multiprocessing.get_context(POOL_START_METHOD)
+            pool = _pools[name] = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        return pool
+
+def shutdown():
+    """Stop every pool's worker processes once their queued work is done."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+def delete_if_uploaded(item, status, directory):
+    """Delete an upload queue item's local file once uploaded, if it lives under directory."""
+    if status != "uploaded":
+        return
+    local_path = os.path.abspath(item["local_path"])
+    if local_path.startswith(os.path.abspath(directory) + os.sep):
+        try:
+            os.remove(local_path)
+        except FileNotFoundError:
+            pass
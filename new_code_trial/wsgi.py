@@ -0,0 +1,22 @@
+"""Production entry point for the web interface.
+
+The camera, timelapse engine and upload queue stay in a single camera
+process, and any number of web server workers talk to it over a local
+socket. Start the camera process first, then the web server:
+
+    python camera_service.py
+    gunicorn --worker-class gthread --workers 4 --threads 64 --bind 0.0.0.0:8080 wsgi:app
+
+Workers authenticate with the key the camera process writes to
+camera_service.key (or CAMERA_SERVICE_AUTHKEY), so run both as the same user.
+
+Every open /events or /live_view stream occupies one worker thread, so
+workers x threads is the number of dashboards that can stay connected.
+Measure it with load_test.py.
+"""
+import webinterface
+
+webinterface.setup_user_system()
+webinterface.use_camera_service()
+
+app = webinterface.app